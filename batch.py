@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import logging
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import objfile
+import processor
+import translator
+from loops import LoopDetector
+from translation_cache import TranslationCache, default_directory
+
+
+def load_manifest(manifest_file: str, engine: str = "signal", detect_loops: bool = False) -> list[dict]:
+    """Задания из манифеста: по одному JSON-объекту в строке.
+
+    Обязательное поле -- `source`; `input`, `memory_size`, `limit`, `engine` и `detect_loops` необязательны.
+    Относительные пути отсчитываются от каталога манифеста.
+    """
+    base = Path(manifest_file).parent
+    jobs = []
+    with open(manifest_file, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            job = json.loads(line)
+            assert "source" in job, f"Job on line {number} has no source"
+            jobs.append(
+                {
+                    "job": len(jobs),
+                    "source": str(base / job["source"]),
+                    "input": str(base / job["input"]) if job.get("input") else "",
+                    "memory_size": job.get("memory_size", 200),
+                    "limit": job.get("limit", 5000),
+                    "engine": job.get("engine", engine),
+                    "detect_loops": job.get("detect_loops", detect_loops),
+                }
+            )
+    return jobs
+
+
+def init_worker(log_level: str):
+    logging.basicConfig(level=log_level)
+
+
+def translate_source(source: str, cache_directory: str | None = None) -> list | str:
+    """Машинный код программы или, если задан каталог кэша трансляции, путь к объектному файлу в нём."""
+    if cache_directory is None:
+        code, _ = translator.translate(source)
+        return code
+    path, _ = TranslationCache(cache_directory).object_path(source)
+    return str(path)
+
+
+def run_job(job: dict, code: list | str) -> dict:
+    """Моделирование одного задания над уже оттранслированной программой (или объектным файлом)."""
+    loop_detector = LoopDetector() if job.get("detect_loops") else None
+    with contextlib.ExitStack() as stack:
+        if isinstance(code, str):
+            code = objfile.read_program(code)
+            stack.callback(code.close)
+        output, _, instr_counter, ticks = processor.simulation(
+            code,
+            processor.open_input(job["input"], stack),
+            job["memory_size"],
+            job["limit"],
+            engine=job["engine"],
+            loop_detector=loop_detector,
+        )
+    result = {**job, "output": output, "instr_counter": instr_counter, "ticks": ticks}
+    if loop_detector is not None and loop_detector.loop is not None:
+        return {**result, "status": "loop", "loop": str(loop_detector.loop)}
+    return {**result, "status": "limit" if instr_counter >= job["limit"] else "halted"}
+
+
+def error_result(job: dict, error: BaseException) -> dict:
+    return {**job, "status": "error", "error": f"{type(error).__name__}: {error}"}
+
+
+def run_batch(
+    jobs: list[dict],
+    emit,
+    workers: int | None = None,
+    log_level: str = "WARNING",
+    cache_directory: str | None = None,
+) -> dict:
+    """Выполнить задания в пуле процессов, передавая результаты в `emit` по мере готовности.
+
+    Каждая программа транслируется один раз, её моделирование для всех входных файлов
+    ставится в очередь сразу после трансляции. С кэшем трансляции (`cache_directory`)
+    неизменённые программы не транслируются повторно и между запусками, а процессы
+    получают путь к объектному файлу вместо машинного кода. Возвращает количество
+    заданий по статусам.
+    """
+    by_source = {}
+    for job in jobs:
+        by_source.setdefault(job["source"], []).append(job)
+    statuses = {"halted": 0, "limit": 0, "loop": 0, "error": 0}
+
+    def report(result: dict):
+        statuses[result["status"]] += 1
+        emit(result)
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(log_level,)) as pool:
+        pending = {pool.submit(translate_source, source, cache_directory): (None, source) for source in by_source}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, source = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    for failed in [job] if job is not None else by_source[source]:
+                        report(error_result(failed, error))
+                    continue
+                if job is not None:
+                    report(result)
+                    continue
+                for source_job in by_source[source]:
+                    pending[pool.submit(run_job, source_job, result)] = (source_job, source)
+    return statuses
+
+
+def main(
+    manifest_file: str,
+    workers: int | None = None,
+    engine: str = "signal",
+    log_level: str = "WARNING",
+    cache_directory: str | None = None,
+    detect_loops: bool = False,
+):
+    jobs = load_manifest(manifest_file, engine, detect_loops)
+
+    def emit(result: dict):
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    statuses = run_batch(jobs, emit, workers, log_level, cache_directory)
+    print("jobs:", len(jobs), " ".join(f"{status}: {count}" for status, count in statuses.items()), file=sys.stderr)
+    return statuses["error"] == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пакетное моделирование программ")
+    parser.add_argument("manifest_file", help="JSON lines: source, input, memory_size, limit, engine")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="количество процессов (по умолчанию -- по числу ядер)"
+    )
+    parser.add_argument("--engine", choices=processor.engines.keys(), default="signal", help="движок по умолчанию")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING"], default="WARNING", help="уровень журнала")
+    parser.add_argument(
+        "--translation-cache", metavar="DIR", help="каталог кэша трансляции (по умолчанию ~/.cache/csa_lab3)"
+    )
+    parser.add_argument("--no-translation-cache", action="store_true", help="транслировать программы без кэша")
+    parser.add_argument("--detect-loops", action="store_true", help="останавливать зациклившиеся программы")
+    args = parser.parse_args()
+    cache_directory = None if args.no_translation_cache else str(args.translation_cache or default_directory())
+    ok = main(args.manifest_file, args.workers, args.engine, args.log_level, cache_directory, args.detect_loops)
+    sys.exit(0 if ok else 1)
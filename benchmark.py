@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import processor
+import translator
+
+examples_directory = Path(__file__).parent / "examples" / "src"
+
+
+def prob2_workload(scale: float) -> tuple[str, list, int]:
+    """Пример prob2 (сумма чётных чисел Фибоначчи), повторённый `rounds` раз внешним циклом."""
+    rounds = max(1, int(200 * scale))
+    source = f"""org 10
+limit:
+    .word 4000000
+odd:
+    .word 1
+prev:
+    .word 1
+cur:
+    .word 2
+tmp:
+    .word 0
+result:
+    .word 0
+out_port:
+    .word 1
+rounds:
+    .word {rounds}
+_start:
+    load #1
+    store prev
+    load #2
+    store cur
+    load #0
+    store result
+    step:
+        load cur
+        cmp limit
+        jg end
+        test odd
+        jnz finally
+        if_even:
+            load result
+            add cur
+            store result
+        finally:
+            load cur
+            store tmp
+            add prev
+            store cur
+            load tmp
+            store prev
+        jmp step
+    end:
+    load rounds
+    dec
+    store rounds
+    jnz _start
+    load result
+    out out_port
+    halt
+"""
+    return source, [], 200
+
+
+def hello_workload(scale: float) -> tuple[str, list, int]:
+    """Вывод длинной строки по указателю, как в hello."""
+    length = max(1, int(4000 * scale))
+    source = f"""org 10
+message:
+    .word {length}, '{"a" * length}'
+pointer:
+    .word message
+cycles:
+    .word 0
+out_port:
+    .word 1
+_start:
+    load message
+    store cycles
+    loop:
+        load pointer
+        inc
+        store pointer
+        load (pointer)
+        out out_port
+        load cycles
+        dec
+        store cycles
+        jnz loop
+    halt
+"""
+    return source, [], length + 100
+
+
+def stack_workload(scale: float) -> tuple[str, list, int]:
+    """Заполнение и опустошение стека глубиной `depth` несколько раз."""
+    depth = max(1, int(2000 * scale))
+    source = f"""org 10
+depth:
+    .word {depth}
+k:
+    .word 0
+rounds:
+    .word 5
+_start:
+    load depth
+    store k
+    fill:
+        load k
+        push
+        dec
+        store k
+        jnz fill
+    drain:
+        pop
+        cmp depth
+        jnz drain
+    load rounds
+    dec
+    store rounds
+    jnz _start
+    halt
+"""
+    return source, [], depth + 100
+
+
+def cat_workload(scale: float) -> tuple[str, list, int]:
+    """Пример cat на большом вводе."""
+    length = max(1, int(20000 * scale))
+    return (
+        (examples_directory / "cat.ed").read_text(encoding="utf-8"),
+        list("abcdefgh\n" * (length // 9 + 1))[:length],
+        200,
+    )
+
+
+workloads = {
+    "prob2": prob2_workload,
+    "hello": hello_workload,
+    "stack": stack_workload,
+    "cat": cat_workload,
+}
+"Нагрузки моделирования: имя -> функция (масштаб) -> (исходный код, ввод, размер памяти)."
+
+
+def translation_source(scale: float) -> str:
+    """Сгенерированная программа для замера трансляции: код, слова данных и тысячи меток."""
+    count = max(20, int(50000 * scale))
+    lines = ["_start:", "    nop"]
+    for index in range(count):
+        if index % 20 == 0:
+            lines.append(f"label{index}:")
+        if index % 3:
+            lines.append(f"    load label{(index * 7919) % count // 20 * 20}")
+        else:
+            lines.append(f"    .word 'abcdefghij', {index}, label{index // 20 * 20}")
+    return "\n".join(lines) + "\n"
+
+
+def measure(run, min_time: float) -> tuple[float, object]:
+    """Время одного запуска `run` (повторяя его, пока не наберётся `min_time` секунд) и его результат."""
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        result = run()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs, result
+
+
+def best_of(run, repeat: int, min_time: float) -> tuple[float, object]:
+    return min((measure(run, min_time) for _ in range(repeat)), key=lambda item: item[0])
+
+
+def peak_memory(run) -> int:
+    """Пиковый объём памяти Python-объектов за один запуск (tracemalloc)."""
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(
+    engines: list[str],
+    scale: float = 1.0,
+    repeat: int = 3,
+    min_time: float = 0.2,
+    memory: bool = True,
+) -> dict:
+    """Замерить трансляцию и моделирование всех нагрузок на всех движках."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / "translation.ed"
+        source.write_text(translation_source(scale), encoding="utf-8")
+
+        def translate():
+            return translator.translate(str(source))
+
+        seconds, (_, source_loc) = best_of(translate, repeat, min_time)
+        results["translate/generated"] = {
+            "seconds": seconds,
+            "lines": source_loc,
+            "lines_per_sec": source_loc / seconds,
+        }
+        if memory:
+            results["translate/generated"]["peak_bytes"] = peak_memory(translate)
+
+        for name, workload in workloads.items():
+            text, tokens, memory_size = workload(scale)
+            source = Path(directory) / f"{name}.ed"
+            source.write_text(text, encoding="utf-8")
+            code, _ = translator.translate(str(source))
+            for engine in engines:
+
+                def simulate(engine=engine):
+                    return processor.simulation(code, tokens, memory_size, 10**9, engine=engine)
+
+                seconds, (_, _, instr_counter, ticks) = best_of(simulate, repeat, min_time)
+                metrics = {
+                    "seconds": seconds,
+                    "instructions": instr_counter,
+                    "ticks": ticks,
+                    "instr_per_sec": instr_counter / seconds,
+                    "ticks_per_sec": ticks / seconds,
+                }
+                if memory:
+                    metrics["peak_bytes"] = peak_memory(simulate)
+                results[f"simulation/{name}/{engine}"] = metrics
+    return {"python": platform.python_version(), "scale": scale, "results": results}
+
+
+higher_is_better = ["instr_per_sec", "ticks_per_sec", "lines_per_sec"]
+lower_is_better = ["peak_bytes"]
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Регрессии относительно базового отчёта: метрика хуже больше чем на `threshold` (доля)."""
+    regressions = []
+    for key, metrics in report["results"].items():
+        expected = baseline["results"].get(key)
+        if expected is None:
+            continue
+        for metric in higher_is_better:
+            if metric in metrics and metric in expected and metrics[metric] < expected[metric] * (1 - threshold):
+                regressions.append(f"{key}: {metric} {metrics[metric]:.0f} < baseline {expected[metric]:.0f}")
+        for metric in lower_is_better:
+            if metric in metrics and metric in expected and metrics[metric] > expected[metric] * (1 + threshold):
+                regressions.append(f"{key}: {metric} {metrics[metric]:.0f} > baseline {expected[metric]:.0f}")
+    return regressions
+
+
+def main(
+    engines: list[str],
+    scale: float = 1.0,
+    repeat: int = 3,
+    min_time: float = 0.2,
+    memory: bool = True,
+    output_file: str | None = None,
+    baseline_file: str | None = None,
+    threshold: float = 0.1,
+) -> bool:
+    report = run_benchmarks(engines, scale, repeat, min_time, memory)
+    text = json.dumps(report, indent=2)
+    if output_file is None:
+        print(text)
+    else:
+        Path(output_file).write_text(text + "\n", encoding="utf-8")
+
+    if baseline_file is None:
+        return True
+    baseline = json.loads(Path(baseline_file).read_text(encoding="utf-8"))
+    regressions = compare(report, baseline, threshold)
+    for regression in regressions:
+        print("regression:", regression, file=sys.stderr)
+    return not regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры производительности транслятора и модели процессора")
+    parser.add_argument("--engines", default=",".join(processor.engines), help="движки через запятую")
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель размера нагрузок")
+    parser.add_argument("--repeat", type=int, default=3, help="количество замеров (берётся лучший)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="минимальная длительность одного замера в секундах")
+    parser.add_argument("--no-memory", action="store_true", help="не замерять пиковую память")
+    parser.add_argument("--output", help="файл для отчёта JSON (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="базовый отчёт JSON для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.1, help="допустимое ухудшение метрик (доля)")
+    args = parser.parse_args()
+    engines = args.engines.split(",")
+    for engine in engines:
+        assert engine in processor.engines, f"Unknown engine '{engine}'"
+    ok = main(
+        engines,
+        args.scale,
+        args.repeat,
+        args.min_time,
+        not args.no_memory,
+        args.output,
+        args.baseline,
+        args.threshold,
+    )
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import random
+
+replacement_policies = {"lru", "fifo", "random"}
+"Политики вытеснения строк."
+
+write_policies = {"back", "through"}
+"Политики записи: write-back (строка размещается при промахе записи) и write-through (не размещается)."
+
+spec_options = {
+    "lines": int,
+    "line_size": int,
+    "ways": int,
+    "replacement": str,
+    "write_policy": str,
+    "hit_ticks": int,
+    "miss_ticks": int,
+    "seed": int,
+}
+"Параметры `Cache.from_spec`: имя -> тип значения."
+
+
+class Cache:
+    """Модель кэша между DataPath и памятью.
+
+    Моделируются только задержки: данные по-прежнему читаются и пишутся в `Memory`, кэш
+    хранит лишь теги строк и признак изменённости. Каждое обращение возвращает число
+    тактов ожидания сверх базового цикла инструкции, `ControlUnit` добавляет их к счётчику
+    тактов.
+
+    `ways == 1` -- кэш прямого отображения, `ways == lines` (или 0) -- полностью
+    ассоциативный, промежуточные значения -- наборно-ассоциативный.
+    """
+
+    lines = None
+    "Количество строк кэша."
+
+    line_size = None
+    "Размер строки в ячейках памяти."
+
+    ways = None
+    "Ассоциативность (количество строк в наборе)."
+
+    replacement = None
+    "Политика вытеснения: `lru`, `fifo` или `random`."
+
+    write_policy = None
+    "Политика записи: `back` или `through`."
+
+    hit_ticks = None
+    "Задержка попадания (тактов сверх базового цикла)."
+
+    miss_ticks = None
+    "Задержка обращения к памяти: заполнение строки, вытеснение изменённой строки, сквозная запись."
+
+    sets = None
+    "Наборы: номер строки памяти -> признак изменённости, в порядке вытеснения."
+
+    def __init__(
+        self,
+        lines: int = 16,
+        line_size: int = 4,
+        ways: int = 1,
+        replacement: str = "lru",
+        write_policy: str = "back",
+        hit_ticks: int = 0,
+        miss_ticks: int = 10,
+        seed: int = 0,
+    ):
+        ways = ways or lines
+        assert lines > 0, "cache lines should be greater than zero"
+        assert line_size > 0, "cache line size should be greater than zero"
+        assert ways > 0, "cache ways should be greater than zero"
+        assert lines % ways == 0, "cache lines should be divisible by ways"
+        assert replacement in replacement_policies, f"Unknown replacement policy '{replacement}'"
+        assert write_policy in write_policies, f"Unknown write policy '{write_policy}'"
+        self.lines = lines
+        self.line_size = line_size
+        self.ways = ways
+        self.replacement = replacement
+        self.write_policy = write_policy
+        self.hit_ticks = hit_ticks
+        self.miss_ticks = miss_ticks
+        self.set_count = lines // ways
+        self.sets = [{} for _ in range(self.set_count)]
+        self.random = random.Random(seed)
+        self.hits = self.misses = self.evictions = self.writebacks = self.memory_writes = 0
+        self.stall_ticks = 0
+
+    @classmethod
+    def from_spec(cls, spec: str) -> Cache:
+        """Кэш по строке вида `lines=64,line_size=4,ways=2,replacement=fifo,write_policy=through`."""
+        options = {}
+        for item in filter(None, spec.split(",")):
+            key, _, value = item.partition("=")
+            key = key.strip()
+            assert key in spec_options, f"Unknown cache option '{key}'"
+            options[key] = spec_options[key](value.strip())
+        return cls(**options)
+
+    def access(self, addr: int, write: bool = False) -> int:
+        """Обращение к ячейке `addr`. Возвращает задержку в тактах."""
+        line = addr // self.line_size
+        ways = self.sets[line % self.set_count]
+        ticks = self.hit_ticks
+        if line in ways:
+            self.hits += 1
+            if self.replacement == "lru":
+                ways[line] = ways.pop(line)
+        elif write and self.write_policy == "through":
+            self.misses += 1
+        else:
+            self.misses += 1
+            ticks += self.miss_ticks
+            if len(ways) >= self.ways:
+                ticks += self.evict(ways)
+            ways[line] = False
+
+        if write:
+            if self.write_policy == "back":
+                ways[line] = True
+            else:
+                self.memory_writes += 1
+                ticks += self.miss_ticks
+        self.stall_ticks += ticks
+        return ticks
+
+    def evict(self, ways: dict) -> int:
+        """Вытеснить строку из набора. Возвращает задержку записи изменённой строки в память."""
+        if self.replacement == "random":
+            victim = self.random.choice(list(ways))
+        else:
+            victim = next(iter(ways))
+        self.evictions += 1
+        if ways.pop(victim):
+            self.writebacks += 1
+            return self.miss_ticks
+        return 0
+
+    def stats(self) -> dict:
+        accesses = self.hits + self.misses
+        return {
+            "accesses": accesses,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / accesses if accesses else 0.0,
+            "evictions": self.evictions,
+            "writebacks": self.writebacks,
+            "memory_writes": self.memory_writes,
+            "dirty_lines": sum(dirty for ways in self.sets for dirty in ways.values()),
+            "stall_ticks": self.stall_ticks,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            f"cache: accesses: {stats['accesses']} hits: {stats['hits']} misses: {stats['misses']} "
+            f"hit_rate: {stats['hit_rate']:.3f} evictions: {stats['evictions']} writebacks: {stats['writebacks']} "
+            f"memory_writes: {stats['memory_writes']} stall_ticks: {stats['stall_ticks']}"
+        )
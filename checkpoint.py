@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+import os
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+
+from memory import Memory, PagedMemory, _Page, make_memory
+from opcodes import ALUOpcode, Opcode
+from ports import BufferOutputPort, ListInputPort, input_port, output_port
+
+version = 2
+"Версия формата снимка."
+
+registers = ["addr", "to_mem", "dr", "pc", "sp", "ac", "ir_indirect", "ir_immediate"]
+"Регистры `DataPath`, которые сохраняются как есть (`ir` и `ps` сохраняются отдельно)."
+
+alu_fields = ["result", "src_a", "src_b", "n_flag", "z_flag"]
+"Поля АЛУ, которые сохраняются как есть (`operation` сохраняется по имени)."
+
+
+def encode_array(data: array | bytearray) -> str:
+    """Массив -> base64 его байтов в порядке little-endian."""
+    if isinstance(data, array) and data.itemsize > 1 and sys.byteorder == "big":
+        data = array(data.typecode, data)
+        data.byteswap()
+    return base64.b64encode(data).decode("ascii")
+
+
+def decode_array(typecode: str, text: str) -> array:
+    data = array(typecode)
+    data.frombytes(base64.b64decode(text))
+    if data.itemsize > 1 and sys.byteorder == "big":
+        data.byteswap()
+    return data
+
+
+def encode_cells(cells: Memory | _Page) -> dict:
+    return {
+        "opcodes": encode_array(cells.opcodes),
+        "values": encode_array(cells.values),
+        "modes": encode_array(cells.modes),
+    }
+
+
+def decode_cells(cells: Memory | _Page, state: dict):
+    cells.opcodes = decode_array("B", state["opcodes"])
+    cells.values = decode_array("q", state["values"])
+    cells.modes = bytearray(base64.b64decode(state["modes"]))
+
+
+def capture_memory(memory: Memory | PagedMemory) -> dict:
+    """Содержимое памяти: массивы ячеек (для постраничной -- только созданные страницы) и длинные значения."""
+    state = {"size": memory.size, "wide_values": sorted(memory.wide_values.items())}
+    if isinstance(memory, PagedMemory):
+        state["pages"] = [[number, encode_cells(page)] for number, page in sorted(memory.pages.items())]
+    else:
+        state["cells"] = encode_cells(memory)
+    return state
+
+
+def restore_memory(state: dict) -> Memory | PagedMemory:
+    memory = make_memory(state["size"])
+    if isinstance(memory, PagedMemory):
+        assert "pages" in state, "Snapshot holds dense memory, but paged memory is expected"
+        for number, cells in state["pages"]:
+            page = memory.pages[number] = _Page(memory.page_size)
+            decode_cells(page, cells)
+            assert len(page.values) == memory.page_size, "Snapshot page size does not match `memory.page_bits`"
+    else:
+        assert "cells" in state, "Snapshot holds paged memory, but dense memory is expected"
+        decode_cells(memory, state["cells"])
+    memory.wide_values = {addr: value for addr, value in state["wide_values"]}
+    return memory
+
+
+def capture(control_unit) -> dict:
+    """Снимок полного состояния модели между инструкциями.
+
+    Сохраняются регистры и флаги `DataPath`, состояние АЛУ, память, количество
+    прочитанных символов ввода, накопленный буфер вывода и счётчики инструкций и тактов.
+    Модель кэша, профиль и журнал состояний в снимок не входят.
+    """
+    dp = control_unit.data_path
+    return {
+        "version": version,
+        "memory_size": dp.memory_size,
+        "registers": {name: getattr(dp, name) for name in registers} | {"ir": str(dp.ir), "ps": dict(dp.ps)},
+        "alu": {name: getattr(dp.alu, name) for name in alu_fields}
+        | {"operation": None if dp.alu.operation is None else str(dp.alu.operation)},
+        "memory": capture_memory(dp.memory),
+        "input_position": dp.input_ports[input_port].position,
+        "output": list(dp.output_buffer),
+        "instruction_counter": control_unit.instruction_counter,
+        "ticks": control_unit.current_tick(),
+    }
+
+
+def restore(control_unit, state: dict):
+    """Восстановить состояние модели из снимка `capture`.
+
+    Порт ввода должен читать тот же ввод, что и при снятии снимка: уже прочитанные
+    символы пропускаются. Если вывод идёт в буфер, он дополняется сохранённым выводом.
+    """
+    assert state["version"] == version, f"Unsupported snapshot version {state['version']}"
+    dp = control_unit.data_path
+    dp.memory_size = state["memory_size"]
+    dp.memory = restore_memory(state["memory"])
+    registers_state = state["registers"]
+    for name in registers:
+        setattr(dp, name, registers_state[name])
+    dp.ir = Opcode(registers_state["ir"])
+    dp.ps = dict(registers_state["ps"])
+    for name in alu_fields:
+        setattr(dp.alu, name, state["alu"][name])
+    operation = state["alu"]["operation"]
+    dp.alu.operation = None if operation is None else ALUOpcode(operation)
+
+    skip_input(dp.input_ports[input_port], state["input_position"])
+    output = dp.output_ports.get(output_port)
+    if isinstance(output, BufferOutputPort):
+        output.codepoints[:0] = state["output"]
+
+    control_unit.instruction_counter = state["instruction_counter"]
+    control_unit.tick(state["ticks"] - control_unit.current_tick())
+
+
+def skip_input(port, count: int):
+    """Пропустить `count` символов порта ввода."""
+    if isinstance(port, ListInputPort):
+        assert count <= len(port.tokens), "Input is shorter than in the snapshot"
+        port.position = count
+        return
+    for _ in range(count):
+        symbol = port.read()
+        assert symbol is not None, "Input is shorter than in the snapshot"
+
+
+def save(filename: str | Path, state: dict):
+    """Записать снимок в файл (JSON, сжатый gzip). Файл заменяется атомарно."""
+    path = Path(filename)
+    handle, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file, gzip.GzipFile(fileobj=file, mode="wb") as archive:
+            archive.write(json.dumps(state).encode("utf-8"))
+        Path(temporary).replace(path)
+    except BaseException:
+        Path(temporary).unlink(missing_ok=True)
+        raise
+
+
+def load(filename: str | Path) -> dict:
+    with gzip.open(filename, "rb") as archive:
+        return json.loads(archive.read().decode("utf-8"))
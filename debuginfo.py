@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import bisect
+import json
+
+version = 1
+"Версия формата файла отладочной информации."
+
+
+def debug_info_path(code_file: str) -> str:
+    """Файл отладочной информации для машинного кода `code_file` (рядом с ним)."""
+    return f"{code_file}.dbg"
+
+
+class DebugInfo:
+    """Отладочная информация программы: адрес -> строка исходного кода, адрес -> метка.
+
+    Транслятор строит её по тем же проходам, что и машинный код (`translator.translate_with_debug_info`),
+    с учётом сдвига ячеек peephole-оптимизацией. Место в программе описывается ближайшей
+    меткой не выше адреса и строкой исходного кода: `loop+3 (hello.ed:18)`.
+    """
+
+    source = None
+    "Имя файла исходного кода (без каталога)."
+
+    lines = None
+    "Адрес ячейки -> номер строки исходного кода, считая от 1. Ячейка `jmp _start` по адресу 0 строки не имеет."
+
+    labels = None
+    "Адрес -> метка. Если адрес помечен несколько раз, берётся первая метка в исходном коде."
+
+    def __init__(self, source: str, lines: dict[int, int], labels: dict[int, str]):
+        self.source = source
+        self.lines = lines
+        self.labels = labels
+        self.label_addresses = sorted(labels)
+
+    @classmethod
+    def from_symbols(cls, source: str, lines: dict[int, int], symbols: dict[str, int]) -> DebugInfo:
+        """Отладочная информация по таблице символов транслятора (метка -> адрес)."""
+        labels = {}
+        for label, addr in symbols.items():
+            labels.setdefault(addr, label)
+        return cls(source, lines, labels)
+
+    def label(self, addr: int) -> str | None:
+        """Ближайшая метка не выше адреса со смещением (`loop+3`) или None, если меток ниже нет."""
+        index = bisect.bisect_right(self.label_addresses, addr)
+        if index == 0:
+            return None
+        base = self.label_addresses[index - 1]
+        return self.labels[base] if base == addr else f"{self.labels[base]}+{addr - base}"
+
+    def location(self, addr: int) -> str:
+        """Место в программе: `loop+3 (hello.ed:18)`, без метки -- адрес, без строки -- только метка."""
+        label = self.label(addr)
+        place = str(addr) if label is None else label
+        line = self.lines.get(addr)
+        return place if line is None else f"{place} ({self.source}:{line})"
+
+    def to_dict(self) -> dict:
+        return {
+            "version": version,
+            "source": self.source,
+            "lines": {str(addr): line for addr, line in sorted(self.lines.items())},
+            "labels": {str(addr): label for addr, label in sorted(self.labels.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> DebugInfo:
+        assert data.get("version") == version, f"Unsupported debug info version {data.get('version')}"
+        lines = {int(addr): line for addr, line in data["lines"].items()}
+        labels = {int(addr): label for addr, label in data["labels"].items()}
+        return cls(data["source"], lines, labels)
+
+    def dump_json(self, filename: str):
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load_json(cls, filename: str) -> DebugInfo:
+        with open(filename, encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
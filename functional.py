@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import logging
+
+from opcodes import (
+    IMMEDIATE,
+    INDIRECT,
+    Opcode,
+    fetch_ticks,
+    immediate_ticks,
+    indirect_ticks,
+    instruction_ticks,
+    opcode_ids,
+    opcode_list,
+    string_word_ticks,
+)
+from ports import input_port, write_string
+
+
+class _HaltError(Exception):
+    pass
+
+
+class FunctionalEngine:
+    """Функциональная модель процессора.
+
+    Каждая инструкция выполняется сразу над регистрами, без сигналов и АЛУ. Такты
+    начисляются по таблице `opcodes.instruction_ticks`, поэтому счётчики инструкций
+    и тактов совпадают с потактовой моделью `ControlUnit`. Сохраняются только
+    архитектурные регистры (AC, PC, SP, PS) и память.
+
+    Флаги хранятся как значение, по которому АЛУ выставило бы N и Z последним
+    действием инструкции.
+
+    Инструкции с непосредственным операндом выполняются отдельными обработчиками
+    (`immediate_handlers`), для кодов операций без такого режима это обычные обработчики.
+    """
+
+    control_unit = None
+    data_path = None
+    memory = None
+
+    ac = None
+    pc = None
+    sp = None
+    flag = None
+    "Значение, по которому выставлены флаги N (< 0) и Z (== 0)."
+
+    string_ticks = None
+    "Такты вывода слов последней инструкции `outs` (начисляются `ControlUnit` сразу, без счётчика цикла)."
+
+    def __init__(self, control_unit):
+        self.control_unit = control_unit
+        self.data_path = control_unit.data_path
+        self.memory = self.data_path.memory
+        detector = self.data_path.loop_detector
+        self.write = self.memory.write if detector is None else detector.write
+        self.read_input = self.data_path.input_ports[input_port].read
+        self.output_ports = self.data_path.output_ports
+        self.handlers = [self.execute_nop] * len(opcode_list)
+        for opcode, handler in {
+            Opcode.INC: self.execute_inc,
+            Opcode.DEC: self.execute_dec,
+            Opcode.HALT: self.execute_halt,
+            Opcode.PUSH: self.execute_push,
+            Opcode.POP: self.execute_pop,
+            Opcode.LOAD: self.execute_load,
+            Opcode.STORE: self.execute_store,
+            Opcode.ADD: self.execute_add,
+            Opcode.SUB: self.execute_sub,
+            Opcode.MUL: self.execute_mul,
+            Opcode.DIV: self.execute_div,
+            Opcode.OUT: self.execute_out,
+            Opcode.IN: self.execute_in,
+            Opcode.CMP: self.execute_cmp,
+            Opcode.TEST: self.execute_test,
+            Opcode.JG: self.execute_jg,
+            Opcode.JZ: self.execute_jz,
+            Opcode.JNZ: self.execute_jnz,
+            Opcode.JMP: self.execute_jmp,
+            Opcode.OUTS: self.execute_outs,
+        }.items():
+            self.handlers[opcode_ids[opcode]] = handler
+        self.costs = [fetch_ticks + instruction_ticks[opcode] for opcode in opcode_list]
+        self.immediate_handlers = list(self.handlers)
+        for opcode, handler in {
+            Opcode.LOAD: self.execute_load_immediate,
+            Opcode.ADD: self.execute_add_immediate,
+            Opcode.SUB: self.execute_sub_immediate,
+            Opcode.MUL: self.execute_mul_immediate,
+            Opcode.DIV: self.execute_div_immediate,
+            Opcode.OUT: self.execute_out_immediate,
+            Opcode.CMP: self.execute_cmp_immediate,
+            Opcode.TEST: self.execute_test_immediate,
+        }.items():
+            self.immediate_handlers[opcode_ids[opcode]] = handler
+        self.immediate_costs = [
+            fetch_ticks + immediate_ticks.get(opcode, instruction_ticks[opcode]) for opcode in opcode_list
+        ]
+
+    def load_state(self):
+        dp = self.data_path
+        self.ac, self.pc, self.sp = dp.ac, dp.pc, dp.sp
+        self.flag = -1 if dp.ps["N"] else 0 if dp.ps["Z"] else 1
+
+    def store_state(self):
+        dp = self.data_path
+        dp.ac, dp.pc, dp.sp = self.ac, self.pc, self.sp
+        dp.alu.n_flag = self.flag < 0
+        dp.alu.z_flag = self.flag == 0
+        dp.signal_latch_ps_flags()
+
+    def run(self, limit: int) -> bool:
+        """Выполнять инструкции до останова или лимита. Возвращает True при останове."""
+        if self.control_unit.profile is not None or self.data_path.loop_detector is not None:
+            return self.run_instrumented(limit)
+        control_unit = self.control_unit
+        decode, read, size = self.memory.decode, self.memory.read, self.data_path.memory_size
+        handlers, costs = self.handlers, self.costs
+        immediate_handlers, immediate_costs = self.immediate_handlers, self.immediate_costs
+        count, ticks = control_unit.instruction_counter, 0
+        nop_id = opcode_ids[Opcode.NOP]
+        opcode_id = mode = None
+        halted = False
+        self.load_state()
+        try:
+            while count < limit:
+                pc = self.pc
+                opcode_id, value, mode = decode(pc)
+                self.pc = (pc + 1) % size
+                if not mode:
+                    handlers[opcode_id](value, None)
+                    ticks += costs[opcode_id]
+                elif mode == INDIRECT and opcode_id != nop_id:
+                    handlers[opcode_id](read(value), value)
+                    ticks += costs[opcode_id] + indirect_ticks
+                else:
+                    immediate_handlers[opcode_id](value, None)
+                    ticks += immediate_costs[opcode_id]
+                count += 1
+        except _HaltError:
+            ticks += fetch_ticks + (indirect_ticks if mode == INDIRECT else 0)
+            halted = True
+        self.store_state()
+        if opcode_id is not None:
+            self.data_path.ir = opcode_list[opcode_id]
+            self.data_path.ir_indirect = mode == INDIRECT
+            self.data_path.ir_immediate = mode == IMMEDIATE
+        control_unit.instruction_counter = count
+        control_unit.tick(ticks)
+        return halted
+
+    def run_instrumented(self, limit: int) -> bool:
+        """То же, что `run`, с профилем (`control_unit.profile`) и поиском циклов (`data_path.loop_detector`)."""
+        control_unit, detector = self.control_unit, self.data_path.loop_detector
+        record = control_unit.profile.record if control_unit.profile is not None else None
+        decode, read, size = self.memory.decode, self.memory.read, self.data_path.memory_size
+        handlers, costs = self.handlers, self.costs
+        immediate_handlers, immediate_costs = self.immediate_handlers, self.immediate_costs
+        immediate_ids = {opcode_ids[opcode] for opcode in immediate_ticks}
+        count, ticks = control_unit.instruction_counter, 0
+        nop_id, push_id, pop_id = opcode_ids[Opcode.NOP], opcode_ids[Opcode.PUSH], opcode_ids[Opcode.POP]
+        outs_id = opcode_ids[Opcode.OUTS]
+        opcode_id = mode = None
+        halted = False
+        self.load_state()
+        try:
+            while count < limit:
+                pc, sp, flag = self.pc, self.sp, self.flag
+                opcode_id, value, mode = decode(pc)
+                self.pc = (pc + 1) % size
+                handler, immediate = handlers[opcode_id], False
+                if mode == INDIRECT and opcode_id != nop_id:
+                    pointer, addr, cost = value, read(value), costs[opcode_id] + indirect_ticks
+                elif mode and opcode_id in immediate_ids:
+                    handler, immediate = immediate_handlers[opcode_id], True
+                    pointer, addr, cost = None, value, immediate_costs[opcode_id]
+                else:
+                    pointer, addr, cost = None, value, costs[opcode_id]
+                try:
+                    handler(addr, pointer)
+                except _HaltError:
+                    if record is not None:
+                        halt_cost = cost - instruction_ticks[opcode_list[opcode_id]]
+                        record(pc, opcode_id, pointer, addr, halt_cost, flag < 0, flag == 0)
+                    raise
+                if record is not None:
+                    if opcode_id == push_id:
+                        addr = self.sp
+                    elif opcode_id == pop_id:
+                        addr = sp
+                    elif immediate:
+                        addr = None
+                    string_ticks = self.string_ticks if opcode_id == outs_id else 0
+                    record(pc, opcode_id, pointer, addr, cost + string_ticks, flag < 0, flag == 0)
+                ticks += cost
+                count += 1
+                if (
+                    detector is not None
+                    and self.pc <= pc
+                    and detector.back_edge(pc, self.pc, self.ac, self.sp, self.flag < 0, self.flag == 0, count)
+                ):
+                    break
+        except _HaltError:
+            ticks += fetch_ticks + (indirect_ticks if mode == INDIRECT else 0)
+            halted = True
+        self.store_state()
+        if opcode_id is not None:
+            self.data_path.ir = opcode_list[opcode_id]
+            self.data_path.ir_indirect = mode == INDIRECT
+            self.data_path.ir_immediate = mode == IMMEDIATE
+        control_unit.instruction_counter = count
+        control_unit.tick(ticks)
+        return halted
+
+    def execute_nop(self, operand, pointer):
+        self.flag = 1
+
+    def execute_inc(self, operand, pointer):
+        self.ac += 1
+        self.flag = self.ac
+
+    def execute_dec(self, operand, pointer):
+        self.ac -= 1
+        self.flag = self.ac
+
+    def execute_halt(self, operand, pointer):
+        raise _HaltError
+
+    def execute_push(self, operand, pointer):
+        self.sp = (self.sp - 1) % self.data_path.memory_size
+        self.write(self.sp, self.ac)
+        self.flag = self.ac
+
+    def execute_pop(self, operand, pointer):
+        self.ac = self.memory.read(self.sp)
+        self.sp = (self.sp + 1) % self.data_path.memory_size
+        self.flag = self.ac
+
+    def execute_load(self, operand, pointer):
+        self.ac = self.flag = self.memory.read(operand)
+
+    def execute_store(self, operand, pointer):
+        self.write(operand, self.ac)
+        self.flag = self.ac
+
+    def execute_add(self, operand, pointer):
+        self.ac = self.flag = self.ac + self.memory.read(operand)
+
+    def execute_sub(self, operand, pointer):
+        self.ac = self.flag = self.ac - self.memory.read(operand)
+
+    def execute_mul(self, operand, pointer):
+        self.ac = self.flag = self.ac * self.memory.read(operand)
+
+    def execute_div(self, operand, pointer):
+        divisor = self.memory.read(operand)
+        if divisor == 0:
+            logging.error(f"Division by zero: {Opcode.DIV}")
+            self.ac = self.flag = 0
+        else:
+            self.ac = self.flag = self.ac // divisor
+
+    def execute_cmp(self, operand, pointer):
+        self.flag = self.ac - self.memory.read(operand)
+
+    def execute_test(self, operand, pointer):
+        self.flag = self.ac & self.memory.read(operand)
+
+    def execute_out(self, operand, pointer):
+        port = self.output_ports.get(self.memory.read(operand))
+        if port is not None:
+            port.write(self.ac)
+        self.flag = operand
+
+    def execute_outs(self, operand, pointer):
+        port = self.output_ports.get(self.ac)
+        length = write_string(port, self.memory.read, operand, self.data_path.memory_size)
+        self.string_ticks = length * string_word_ticks
+        self.control_unit.tick(self.string_ticks)
+        self.flag = operand
+
+    def execute_load_immediate(self, value, pointer):
+        self.ac = self.flag = value
+
+    def execute_add_immediate(self, value, pointer):
+        self.ac = self.flag = self.ac + value
+
+    def execute_sub_immediate(self, value, pointer):
+        self.ac = self.flag = self.ac - value
+
+    def execute_mul_immediate(self, value, pointer):
+        self.ac = self.flag = self.ac * value
+
+    def execute_div_immediate(self, value, pointer):
+        if value == 0:
+            logging.error(f"Division by zero: {Opcode.DIV}")
+            self.ac = self.flag = 0
+        else:
+            self.ac = self.flag = self.ac // value
+
+    def execute_cmp_immediate(self, value, pointer):
+        self.flag = self.ac - value
+
+    def execute_test_immediate(self, value, pointer):
+        self.flag = self.ac & value
+
+    def execute_out_immediate(self, value, pointer):
+        port = self.output_ports.get(value)
+        if port is not None:
+            port.write(self.ac)
+        self.flag = value
+
+    def execute_in(self, operand, pointer):
+        symbol_code = self.read_input()
+        if symbol_code is None:
+            raise _HaltError
+        self.ac = symbol_code
+        self.flag = 1 if pointer is None else pointer
+
+    def execute_jg(self, operand, pointer):
+        self._branch(operand, pointer, self.flag >= 0)
+
+    def execute_jz(self, operand, pointer):
+        self._branch(operand, pointer, self.flag == 0)
+
+    def execute_jnz(self, operand, pointer):
+        self._branch(operand, pointer, self.flag != 0)
+
+    def execute_jmp(self, operand, pointer):
+        self._branch(operand, pointer, True)
+
+    def _branch(self, target, pointer, taken: bool):
+        if taken:
+            self.pc = target % self.data_path.memory_size
+            self.flag = target
+        else:
+            self.flag = 1 if pointer is None else pointer
+
+
+def run_functional(control_unit, limit: int) -> bool:
+    return FunctionalEngine(control_unit).run(limit)
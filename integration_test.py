@@ -1,12 +1,41 @@
+import asyncio
 import contextlib
 import io
+import json
 import logging
 import os
+import pathlib
 import tempfile
 
+import batch
+import benchmark
+import checkpoint
+import debuginfo
+import lockstep
+import memory
+import objfile
+import opcodes
 import processor
 import pytest
+import server
 import translator
+from cache import Cache
+from loops import LoopDetector
+from microcode import microcode
+from peephole import Peephole
+from pipeline import Pipeline, execute_cycles
+from profiler import Profile
+from translation_cache import TranslationCache
+
+
+def golden_program(golden, tmp_path: pathlib.Path) -> tuple[list, pathlib.Path, pathlib.Path]:
+    """Машинный код программы golden-теста, её исходный код и ввод в файлах `tmp_path`."""
+    source = tmp_path / "source.src"
+    input_stream = tmp_path / "input.txt"
+    source.write_text(golden["in_source"], encoding="utf-8")
+    input_stream.write_text(golden["in_stdin"], encoding="utf-8")
+    code, _ = translator.translate(str(source))
+    return code, source, input_stream
 
 
 @pytest.mark.golden_test("golden/*.yml")
@@ -31,7 +60,7 @@ def test_translator_and_processor(golden, caplog):
         # Запускаем транслятор и собираем весь стандартный вывод в переменную
         # stdout
         with contextlib.redirect_stdout(io.StringIO()) as stdout:
-            translator.main(source, target)
+            translator.main(source, target, "json")
             print("============================================================")
             processor.main(target, input_stream)
 
@@ -43,3 +72,715 @@ def test_translator_and_processor(golden, caplog):
         assert code == golden.out["out_code"]
         assert stdout.getvalue() == golden.out["out_stdout"]
         assert caplog.text == golden.out["out_log"]
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_engines_match_signal_model(golden, tmp_path):
+    # Все движки должны давать тот же вывод и те же счётчики, что и потактовая модель.
+    code, _, input_stream = golden_program(golden, tmp_path)
+    expected = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000)
+    for engine in processor.engines:
+        result = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000, engine=engine)
+        assert result == expected, engine
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_trace_renders_golden_log(golden, tmp_path):
+    # Журнал состояний, собранный из снимков трассировки, совпадает с журналом logging.
+    code, _, input_stream = golden_program(golden, tmp_path)
+    trace = processor.TraceRecorder(5000)
+    processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000, trace=trace)
+
+    marker = "decode_and_execute_instruction "
+    expected = [line.split(marker, 1)[1] for line in golden.out["out_log"].splitlines() if marker in line]
+    assert trace.render_lines() == expected
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_stream_ports_match_buffers(golden, tmp_path):
+    # Потоковые порты (маленькие буферы) дают тот же вывод, что и списки.
+    code, _, input_stream = golden_program(golden, tmp_path)
+    expected = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000)
+    for engine in processor.engines:
+        sink = io.StringIO()
+        with open(input_stream, encoding="utf-8") as file:
+            _, numbers, instr_counter, ticks = processor.simulation(
+                code,
+                processor.TokenStreamInputPort(file, buffer_size=3),
+                200,
+                5000,
+                engine=engine,
+                output=processor.StreamOutputPort(sink, flush_size=2),
+            )
+        assert (sink.getvalue(), instr_counter, ticks) == (expected[0], expected[2], expected[3]), engine
+        assert numbers == [], engine
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_paged_memory_matches_dense(golden, tmp_path, monkeypatch):
+    # Постраничная память (с маленькими страницами) ведёт себя так же, как плотная.
+    code, _, input_stream = golden_program(golden, tmp_path)
+    expected = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000)
+    monkeypatch.setattr(memory, "page_bits", 4)
+    monkeypatch.setattr(memory, "paged_memory_threshold", 0)
+    for engine in processor.engines:
+        result = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000, engine=engine)
+        assert result == expected, engine
+
+
+def test_paged_memory_allocates_touched_pages_only():
+    code = [
+        {"index": 0, "opcode": "jmp", "value": 3_000_000_000, "is_indirect": False},
+        {"index": 3_000_000_000, "opcode": "push", "value": 0, "is_indirect": False},
+        {"index": 3_000_000_001, "opcode": "halt", "value": 0, "is_indirect": False},
+    ]
+    data_path = processor.DataPath(2**32, [])
+    control_unit = processor.ControlUnit(code, data_path)
+    assert processor.run_signal(control_unit, 10)
+    assert data_path.sp == 2**32 - 1
+    assert len(data_path.memory.pages) == 3
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_cache_adds_stall_ticks(golden, tmp_path):
+    # Кэш меняет только такты: вывод и счётчик инструкций те же, такты больше на задержки кэша.
+    code, _, input_stream = golden_program(golden, tmp_path)
+    expected = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000)
+    cache = Cache(lines=4, line_size=2, ways=2)
+    result = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000, cache=cache)
+
+    stats = cache.stats()
+    assert result[:3] == expected[:3]
+    assert result[3] == expected[3] + stats["stall_ticks"]
+    assert stats["misses"] > 0
+    assert stats["accesses"] >= expected[2]
+
+
+def test_cache_policies():
+    # Два адреса, конфликтующие в кэше прямого отображения, уживаются в ассоциативном.
+    direct = Cache(lines=2, line_size=1, ways=1)
+    associative = Cache(lines=2, line_size=1, ways=0)
+    for addr in [0, 2, 0, 2]:
+        direct.access(addr)
+        associative.access(addr)
+    assert (direct.hits, direct.misses, direct.evictions) == (0, 4, 3)
+    assert (associative.hits, associative.misses, associative.evictions) == (2, 2, 0)
+
+    lru = Cache(lines=2, line_size=1, ways=2, replacement="lru")
+    fifo = Cache(lines=2, line_size=1, ways=2, replacement="fifo")
+    for addr in [0, 1, 0, 2, 0]:
+        lru.access(addr)
+        fifo.access(addr)
+    assert lru.hits == 2
+    assert fifo.hits == 1
+
+    back = Cache(lines=1, line_size=1, miss_ticks=10)
+    assert back.access(0, write=True) == 10
+    assert back.access(1) == 20
+    assert back.writebacks == 1
+    through = Cache(lines=1, line_size=1, write_policy="through", miss_ticks=10)
+    assert through.access(0, write=True) == 10
+    assert through.access(0) == 10
+    assert through.memory_writes == 1
+
+
+def test_batch_runs_manifest(tmp_path):
+    # Программа транслируется один раз, результаты по всем входам совпадают с `simulation`.
+    (tmp_path / "ab.txt").write_text("['a', 'b']", encoding="utf-8")
+    (tmp_path / "x.txt").write_text("['x']", encoding="utf-8")
+    (tmp_path / "bad.ed").write_text("load x\n", encoding="utf-8")
+    (tmp_path / "spin.ed").write_text("_start:\n    jmp _start\n", encoding="utf-8")
+    cat = str(pathlib.Path("examples/src/cat.ed").resolve())
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(
+        "\n".join(
+            [
+                json.dumps({"source": cat, "input": "ab.txt"}),
+                json.dumps({"source": cat, "input": "x.txt", "engine": "jit"}),
+                json.dumps({"source": cat, "input": "x.txt", "limit": 2}),
+                json.dumps({"source": "bad.ed"}),
+                json.dumps({"source": "spin.ed", "detect_loops": True}),
+            ]
+        ),
+        encoding="utf-8",
+    )
+
+    results = []
+    statuses = batch.run_batch(batch.load_manifest(str(manifest)), results.append, workers=2)
+    results = {result["job"]: result for result in results}
+
+    code, _ = translator.translate(cat)
+    for job, tokens in [(0, ["a", "b"]), (1, ["x"])]:
+        output, _, instr_counter, ticks = processor.simulation(code, tokens, 200, 5000)
+        assert results[job]["status"] == "halted"
+        assert (results[job]["output"], results[job]["instr_counter"], results[job]["ticks"]) == (
+            output,
+            instr_counter,
+            ticks,
+        )
+    assert results[2]["status"] == "limit"
+    assert results[3]["status"] == "error"
+    assert (results[4]["status"], results[4]["instr_counter"]) == ("loop", 2)
+    assert statuses == {"halted": 2, "limit": 1, "loop": 1, "error": 1}
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_object_file_matches_json(golden, tmp_path):
+    # Двоичный объектный файл загружается в ту же память, что и JSON.
+    code, _, _ = golden_program(golden, tmp_path)
+    target = tmp_path / "target.bin"
+    code.append({"index": 199, "opcode": "nop", "value": -(2**100), "is_indirect": False})
+    objfile.write_object(target, code)
+    program = objfile.read_program(target)
+    assert isinstance(program, objfile.ObjectCode)
+
+    expected = processor.DataPath(200, [])
+    processor.ControlUnit(code, expected)
+    loaded = processor.DataPath(200, [])
+    processor.ControlUnit(program, loaded)
+    program.close()
+
+    assert [loaded.memory.cell(addr) for addr in range(200)] == [expected.memory.cell(addr) for addr in range(200)]
+
+
+def test_translator_main_defaults_to_json(tmp_path):
+    # По умолчанию машинный код записывается в JSON; ячейку, которую двоичный формат не кодирует, он называет.
+    source = tmp_path / "label.ed"
+    target = tmp_path / "label.json"
+    source.write_text("_start:\n    halt\nref:\n    .word missing\n", encoding="utf-8")
+    translator.main(str(source), str(target))
+    assert objfile.read_program(str(target))[-1]["value"] == "missing"
+
+    with pytest.raises(AssertionError, match="Cell 1 holds a non-integer value 'missing'"):
+        translator.main(str(source), str(tmp_path / "label.bin"), "bin")
+
+
+def test_main_closes_object_file(tmp_path, monkeypatch, capsys):
+    # `processor.main` закрывает отображение объектного файла после моделирования.
+    source = tmp_path / "halt.ed"
+    target = tmp_path / "halt.bin"
+    input_stream = tmp_path / "input.txt"
+    source.write_text("_start:\n    halt\n", encoding="utf-8")
+    input_stream.write_text("", encoding="utf-8")
+    translator.main(str(source), str(target), "bin")
+    programs = []
+
+    def read_program(filename):
+        programs.append(objfile.read_program(filename))
+        return programs[-1]
+
+    monkeypatch.setattr(processor, "read_program", read_program)
+    processor.main(str(target), str(input_stream))
+    capsys.readouterr()
+
+    assert isinstance(programs[0], objfile.ObjectCode)
+    assert programs[0].buffer.closed
+
+
+def test_translator_word_tokens_and_symbols():
+    _, words = translator.parse_word(10, "'ab', -5-3 12x, lbl", {})
+    assert words == {10: [97], 11: [98], 12: [-5], 13: [-3], 14: [12], 15: ["x"], 16: ["lbl"]}
+    # Повторяющаяся метка связывается с первой по порядку таблицы меток.
+    linked = translator.link_labels({5: ["load", "(x)"], 6: ["y"]}, {3: "x", 1: "y", 4: "x"})
+    assert linked == {5: ["load", 3, True], 6: [1, False]}
+
+
+def test_translation_cache(tmp_path):
+    sources = []
+    for name in ["cat", "hello", "prob2"]:
+        sources.append(str(pathlib.Path(f"examples/src/{name}.ed").resolve()))
+    cache = TranslationCache(tmp_path / "cache")
+    for source in sources:
+        code, source_loc = translator.translate(source)
+        cached, cached_loc = cache.translate(source)
+        again, again_loc = cache.translate(source)
+        assert source_loc == cached_loc == again_loc
+        assert list(cached.cells()) == list(again.cells()) == list(memory.program_cells(code))
+        cached.close()
+        again.close()
+    assert (cache.hits, cache.misses) == (3, 3)
+
+    # Вытесняются записи, к которым дольше всего не обращались; попадание обновляет запись.
+    paths = [cache.object_path(source)[0] for source in sources]
+    for age, path in enumerate(paths, 1):
+        os.utime(path, (age, age))
+    cache.object_path(sources[0])
+    small = TranslationCache(tmp_path / "cache", max_size=paths[0].stat().st_size + paths[2].stat().st_size)
+    small.evict()
+    assert [path.exists() for path in paths] == [True, False, True]
+
+
+def test_benchmark_report_and_baseline():
+    report = benchmark.run_benchmarks(["functional"], scale=0.01, repeat=1, min_time=0, memory=False)
+    assert set(report["results"]) == {"translate/generated"} | {
+        f"simulation/{name}/functional" for name in benchmark.workloads
+    }
+    assert all(
+        metrics["instructions"] > 0 for key, metrics in report["results"].items() if key != "translate/generated"
+    )
+    assert benchmark.compare(report, report, 0.1) == []
+
+    faster = {"results": {key: dict(metrics) for key, metrics in report["results"].items()}}
+    faster["results"]["simulation/cat/functional"]["instr_per_sec"] *= 2
+    assert len(benchmark.compare(report, faster, 0.1)) == 1
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_profile_matches_between_engines(golden, tmp_path):
+    # Профили signal и functional совпадают, сумма тактов по кодам операций равна числу тактов.
+    code, _, input_stream = golden_program(golden, tmp_path)
+    profiles = {}
+    for engine in ["signal", "functional"]:
+        profile = Profile(200)
+        result = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000, engine, profile=profile)
+        profiles[engine] = profile.to_dict()
+        assert sum(profile.ticks) == result[3]
+
+    assert profiles["signal"] == profiles["functional"]
+    assert sum(counts["count"] for counts in profiles["signal"]["opcodes"].values()) == result[2] + 1
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_checkpoint_resume_matches_full_run(golden, tmp_path):
+    # Прогон, прерванный по лимиту и продолженный из снимка другим движком, совпадает с прогоном целиком.
+    code, source, input_stream = golden_program(golden, tmp_path)
+    snapshot_file = str(tmp_path / "snapshot.gz")
+
+    expected = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000)
+    first = processor.simulation(
+        code, processor.parse_to_tokens(input_stream), 200, 25, checkpoint_file=snapshot_file, checkpoint_every=10
+    )
+    if first[2] < 25:
+        assert first == expected
+        return
+    resumed = processor.simulation(
+        [], processor.parse_to_tokens(input_stream), 1, 5000, "functional", resume=checkpoint.load(snapshot_file)
+    )
+    assert resumed == expected
+
+    # Профиль продолженного прогона -- по размеру памяти снимка (200), а не `--memory-size`.
+    profile_file = tmp_path / "profile.json"
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        processor.main(
+            str(source), str(input_stream), memory_size=8, resume_file=snapshot_file, profile_file=str(profile_file)
+        )
+    profile = json.loads(profile_file.read_text(encoding="utf-8"))
+    assert sum(counts["ticks"] for counts in profile["opcodes"].values()) == expected[3] - first[3]
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_lockstep_matches_simulation(golden, tmp_path):
+    # Векторное выполнение на нескольких входах совпадает с отдельным моделированием каждого.
+    pytest.importorskip("numpy")
+    code, _, _ = golden_program(golden, tmp_path)
+    inputs = [list("Alice\n"), [], list("x"), list("a much longer line of input\n")]
+
+    results = lockstep.simulate_many(code, inputs, 200, 5000)
+
+    assert results == [processor.simulation(code, list(tokens), 200, 5000) for tokens in inputs]
+
+
+@pytest.mark.parametrize("engine", ["signal", "functional"])
+def test_loop_detector_stops_repeating_state(engine, tmp_path):
+    # Счётчик до 10 -- не цикл; бесконечный вывод одного символа останавливается через одну итерацию.
+    source = tmp_path / "spin.ed"
+    source.write_text(
+        """org 10
+x:
+    .word 0
+_start:
+    load x
+    inc
+    store x
+    cmp ten
+    jnz _start
+loop:
+    load x
+    out port
+    jmp loop
+ten:
+    .word 10
+port:
+    .word 1
+""",
+        encoding="utf-8",
+    )
+    code, _ = translator.translate(str(source))
+    detector = LoopDetector()
+
+    output, _, instr_counter, _ = processor.simulation(code, [], 200, 5000, engine, loop_detector=detector)
+
+    assert (detector.loop.first_pc, detector.loop.last_pc, detector.loop.period) == (16, 18, 3)
+    assert instr_counter == 57
+    assert output == "\n" * 2
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_peephole_keeps_program_behaviour(golden, tmp_path):
+    # Оптимизированная программа выводит то же самое и не медленнее исходной.
+    code, source, input_stream = golden_program(golden, tmp_path)
+    optimized, _ = translator.translate(str(source), Peephole())
+    expected = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000)
+    result = processor.simulation(optimized, processor.parse_to_tokens(input_stream), 200, 5000)
+
+    assert result[:2] == expected[:2]
+    assert result[3] <= expected[3]
+
+
+def test_peephole_patterns(tmp_path):
+    source = tmp_path / "loop.ed"
+    source.write_text(
+        """org 10
+x:
+    .word 0
+port:
+    .word 1
+_start:
+    nop
+    in
+    store x
+    load x
+    cmp x
+    jz hop
+    out port
+    jmp _start
+    inc
+hop:
+    jmp done
+done:
+    halt
+""",
+        encoding="utf-8",
+    )
+    optimizer = Peephole()
+    code, _ = translator.translate(str(source), optimizer)
+    plain, _ = translator.translate(str(source))
+
+    # `nop`, `load x` после `store x` и недостижимый `inc` удалены, `jz hop` ведёт сразу на `done`.
+    assert optimizer.removed == {"redundant load/store": 1, "nop": 1, "unreachable": 1}
+    assert optimizer.threaded == 1
+    assert [cell["opcode"] for cell in code[1:]] == [
+        "nop",
+        "nop",
+        "in",
+        "store",
+        "cmp",
+        "jz",
+        "out",
+        "jmp",
+        "jmp",
+        "halt",
+    ]
+    assert code[6]["value"] == code[-1]["index"]
+    assert optimizer.loops == {(12, 17): 10}
+    assert (
+        processor.simulation(code, list("ab"), 200, 5000)[:2] == processor.simulation(plain, list("ab"), 200, 5000)[:2]
+    )
+
+
+def test_peephole_keeps_adjacent_org_block(tmp_path):
+    # Участок `org` сразу за кодом, из которого удалены `nop`, остаётся на своём адресе.
+    source = tmp_path / "org.ed"
+    source.write_text(
+        """_start:
+    nop
+    nop
+    load x
+    halt
+org 4
+x:
+    .word 7
+""",
+        encoding="utf-8",
+    )
+    optimizer = Peephole()
+    code, _ = translator.translate(str(source), optimizer)
+
+    assert optimizer.removed["nop"] == 2
+    assert [(cell["index"], cell["opcode"], cell["value"]) for cell in code[1:]] == [
+        (0, "load", 4),
+        (1, "halt", 0),
+        (4, "nop", 7),
+    ]
+
+
+def test_immediate_operands(tmp_path):
+    source = tmp_path / "count.ed"
+    source.write_text(
+        """org 10
+counter:
+    .word 5
+port:
+    .word 1
+one:
+    .word 1
+_start:
+    load counter
+    add one
+    out port
+    sub one
+    sub one
+    store counter
+    jnz _start
+    halt
+""",
+        encoding="utf-8",
+    )
+    direct, _ = translator.translate(str(source))
+    source.write_text(source.read_text(encoding="utf-8").replace(" one", " #1").replace(" port", " #1"), "utf-8")
+    code, _ = translator.translate(str(source))
+    assert [cell.get("is_immediate", False) for cell in code if cell["opcode"] in {"add", "out", "sub"}] == [True] * 4
+
+    expected = processor.simulation(direct, [], 100, 1000)
+    results = {engine: processor.simulation(code, [], 100, 1000, engine=engine) for engine in processor.engines}
+    assert results["signal"][:3] == expected[:3]
+    # Непосредственный операнд экономит такт обращения к памяти: 4 инструкции за итерацию, 5 итераций.
+    assert results["signal"][3] == expected[3] - 4 * 5
+    assert all(result == results["signal"] for result in results.values())
+
+    target = tmp_path / "count.bin"
+    objfile.write_object(target, code)
+    program = objfile.read_program(target)
+    assert list(program.cells()) == list(memory.program_cells(code))
+    program.close()
+
+    source.write_text("_start:\n    store #1\n    halt\n", encoding="utf-8")
+    with pytest.raises(AssertionError, match="Immediate operand is not allowed for 'store'"):
+        translator.translate(str(source))
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_pipeline_overlaps_fetch(golden, tmp_path):
+    # Конвейер меняет только такты: вывод и инструкции те же, последовательные такты -- как у `signal`.
+    code, _, input_stream = golden_program(golden, tmp_path)
+
+    pipeline = Pipeline()
+    expected = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000)
+    result = processor.simulation(code, processor.parse_to_tokens(input_stream), 200, 5000, pipeline=pipeline)
+
+    assert result[:3] == expected[:3]
+    assert pipeline.sequential_ticks == expected[3]
+    assert pipeline.ticks == result[3] < expected[3]
+
+
+def test_pipeline_flushes_modified_instruction(tmp_path):
+    source = tmp_path / "patch.ed"
+    source.write_text(
+        """org 10
+pointer:
+    .word next
+_start:
+    store (pointer)
+next:
+    inc
+    jmp done
+    inc
+done:
+    halt
+""",
+        encoding="utf-8",
+    )
+    code, _ = translator.translate(str(source))
+    pipeline = Pipeline()
+    processor.simulation(code, [], 100, 100, pipeline=pipeline)
+
+    # `store (pointer)` читает указатель и пишет в `next`, который уже выбран во время исполнения.
+    assert pipeline.flushes == {"control": 2, "data": 1}
+    assert pipeline.stalls == {"structural": 0, "short_execute": 1}
+    # Выборка и исполнение плюс ожидание: jmp _start (2 + 1 + 2), store (4 + 2), nop (1 + 1), jmp done (1 + 2), halt.
+    assert pipeline.ticks == 16
+
+
+def test_server_streams_and_stops_requests():
+    hello = pathlib.Path("examples/src/hello.ed").read_text(encoding="utf-8")
+    spin = "_start:\n    jmp _start\n"
+    lines = [
+        json.dumps({"id": "hello", "source": hello}),
+        json.dumps({"id": "cat", "code": translator.translate("examples/src/cat.ed")[0], "input": "ab"}),
+        json.dumps({"id": "timeout", "source": spin, "limit": 10**9, "engine": "functional", "timeout": 0.2}),
+        json.dumps({"id": "cancel", "source": spin, "limit": 10**9, "engine": "functional"}),
+        json.dumps({"id": "cancel", "source": hello}),
+        json.dumps({"cancel": "cancel"}),
+        "[]",
+        json.dumps({"id": "bad", "source": "load x\n"}),
+        json.dumps({"id": 9, "source": spin, "limit": 1000}),
+        json.dumps({"source": hello}),
+    ]
+    messages = []
+
+    async def read_line() -> str:
+        return lines.pop(0) + "\n" if lines else ""
+
+    async def send(message: dict):
+        messages.append(message)
+
+    async def serve():
+        async with server.Server(workers=2, stop_every=20) as simulation_server:
+            await simulation_server.session(read_line, send)
+
+    asyncio.run(serve())
+    results = {message["id"]: message for message in messages if "status" in message}
+    outputs = [message for message in messages if "output" in message]
+
+    output, _, instr_counter, ticks = processor.simulation(
+        translator.translate("examples/src/hello.ed")[0], [], 200, 5000
+    )
+    hello_outputs = [message["output"] for message in outputs if message["id"] == "hello"]
+    # Вывод приходит порциями по мере работы программы.
+    assert len(hello_outputs) > 1
+    assert "".join(hello_outputs) == output
+    assert (results["hello"]["status"], results["hello"]["instr_counter"], results["hello"]["ticks"]) == (
+        "halted",
+        instr_counter,
+        ticks,
+    )
+    assert "".join(message["output"] for message in outputs if message["id"] == "cat") == "ab"
+    assert results["timeout"]["status"] == "timeout"
+    assert 0 < results["timeout"]["instr_counter"] < 10**9
+    # Запрос с `id` выполняющегося запроса отклоняется, отмена доходит до первого.
+    statuses = sorted(message["status"] for message in messages if message["id"] == "cancel" and "status" in message)
+    assert statuses == ["cancelled", "error"]
+    assert results[None]["status"] == results["bad"]["status"] == "error"
+    # Запрос без `id` (строка 9) не путается с явным `id` 9.
+    assert (results[9]["status"], results["line-9"]["status"]) == ("limit", "halted")
+
+
+def test_server_unix_socket(tmp_path):
+    # Ответы по сокету отправляются с ожиданием `drain`, вывод приходит до итога.
+    hello = pathlib.Path("examples/src/hello.ed").read_text(encoding="utf-8")
+    path = str(tmp_path / "server.sock")
+
+    async def serve():
+        async with server.Server(workers=1, stop_every=20) as simulation_server:
+            serving = asyncio.create_task(server.serve_unix(simulation_server, path))
+            for _ in range(500):
+                try:
+                    reader, writer = await asyncio.open_unix_connection(path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    await asyncio.sleep(0.01)
+            writer.write((json.dumps({"id": 1, "source": hello}) + "\n").encode("utf-8"))
+            writer.write_eof()
+            messages = [json.loads(line) async for line in reader]
+            writer.close()
+            serving.cancel()
+            return messages
+
+    messages = asyncio.run(serve())
+    assert "".join(message.get("output", "") for message in messages) == "Hello, World!"
+    assert messages[-1]["status"] == "halted"
+
+
+@pytest.mark.parametrize("engine", processor.engines.keys())
+def test_iter_simulation_feeds_input_lazily(engine, tmp_path):
+    code, _ = translator.translate("examples/src/hello_user_name.ed")
+    output, _, instr_counter, ticks = processor.simulation(code, list("Egor\n"), 200, 5000, engine=engine)
+
+    # Ввод подаётся по одному символу на каждый запрос: счётчики как при всём вводе сразу.
+    events = processor.iter_simulation(code, 200, 5000, engine, slice_size=7)
+    pending, kinds, text = list("Egor\n"), [], ""
+    event = next(events)
+    while event.kind in {"output", "input"}:
+        kinds.append(event.kind)
+        text += event.text or ""
+        event = events.send(pending.pop(0) if event.kind == "input" and pending else None)
+    assert "input" in kinds
+    assert kinds.index("output") < kinds.index("input")
+    assert (text, event.kind, event.instruction_counter, event.ticks) == (output, "halt", instr_counter, ticks)
+
+    # Откат `in` с косвенной адресацией снимает и такты чтения указателя.
+    source = tmp_path / "echo.ed"
+    source.write_text("org 10\np:\n    .word 0\n_start:\n    in (p)\n    out #1\n    halt\n", encoding="utf-8")
+    code, _ = translator.translate(str(source))
+    expected = processor.simulation(code, ["a"], 200, 5000, engine=engine)
+    events = processor.iter_simulation(code, 200, 5000, engine)
+    event = next(events)
+    assert event.kind == "input"
+    event = events.send("a")
+    while event.kind == "output":
+        event = next(events)
+    assert (event.kind, event.instruction_counter, event.ticks) == ("halt", expected[2], expected[3])
+
+    # Потребитель останавливается на первом выводе: бесконечная программа дальше не моделируется.
+    source = tmp_path / "forever.ed"
+    source.write_text("_start:\n    load #33\n    out #1\n    jmp _start\n", encoding="utf-8")
+    events = processor.iter_simulation(translator.translate(str(source))[0], 200, 10**12, engine, slice_size=10)
+    first = next(events)
+    events.close()
+    assert (first.kind, first.text, first.instruction_counter) == ("output", "!!!", 10)
+
+
+def test_microcode_rom_matches_timing_tables():
+    # Микрокоманда -- такт; порт памяти занят в тактах, где читается DR или идёт запись (как в `pipeline`).
+    for opcode in opcodes.Opcode:
+        if opcode == opcodes.Opcode.HALT:
+            continue
+        for mode in (opcodes.DIRECT, opcodes.INDIRECT, opcodes.IMMEDIATE):
+            steps = microcode(opcode, mode)
+            cycles = tuple(any(name in {"latch_dr", "wr"} for name, _ in operations) for _, operations in steps)
+            assert cycles == execute_cycles(opcode, mode), (opcode, mode)
+            assert len(processor.microcode_rom[opcode][mode]) == len(steps)
+        assert len(microcode(opcode, opcodes.DIRECT)) == opcodes.instruction_ticks[opcode]
+
+
+def test_outs_prints_string_in_one_instruction(tmp_path):
+    hello = pathlib.Path("examples/src/hello.ed").read_text(encoding="utf-8")
+    source = tmp_path / "hello_outs.ed"
+    source.write_text(hello.split("_start:")[0] + "_start:\n    load out_port\n    outs message\n    halt\n", "utf-8")
+    code, _ = translator.translate(str(source))
+    loop_code, _ = translator.translate("examples/src/hello.ed")
+
+    expected = processor.simulation(loop_code, [], 200, 1000)
+    results = {engine: processor.simulation(code, [], 200, 1000, engine=engine) for engine in processor.engines}
+    assert results["signal"][:2] == expected[:2]
+    # 13 слов по такту вместо итерации цикла из 9 инструкций на символ.
+    assert results["signal"][3] * 10 < expected[3]
+    assert all(result == results["signal"] for result in results.values())
+    assert lockstep.simulate_many(code, [[]], 200, 1000) == [results["signal"]]
+
+    profiles = {}
+    for engine in ("signal", "functional"):
+        profiles[engine] = Profile(200)
+        processor.simulation(code, [], 200, 1000, engine=engine, profile=profiles[engine])
+    assert profiles["signal"].to_dict() == profiles["functional"].to_dict()
+    assert sum(profiles["signal"].ticks) == results["signal"][3]
+
+
+def test_debug_info_maps_addresses_to_source(tmp_path, caplog):
+    source = tmp_path / "count.ed"
+    source.write_text(
+        """org 10
+; счётчик итераций
+counter:
+    .word 3, 'ab'
+
+_start:
+    nop
+    load counter
+loop:
+    dec          ; следующая итерация
+    store counter
+    jnz loop
+    halt
+""",
+        encoding="utf-8",
+    )
+    code, _, info = translator.translate_with_debug_info(str(source))
+    assert code == translator.translate(str(source))[0]
+    assert info.location(11) == "counter+1 (count.ed:4)"
+    assert info.location(16) == "loop+1 (count.ed:11)"
+    assert info.location(0) == "0"
+
+    # Peephole удаляет `nop`: следующие ячейки сдвигаются вместе со строками.
+    optimized, _, optimized_info = translator.translate_with_debug_info(str(source), Peephole())
+    assert optimized_info.location(13) == "_start (count.ed:8)"
+    assert optimized_info.location(14) == "loop (count.ed:10)"
+
+    debug_file = tmp_path / "count.bin.dbg"
+    optimized_info.dump_json(debug_file)
+    assert debuginfo.DebugInfo.load_json(debug_file).to_dict() == optimized_info.to_dict()
+
+    profile = Profile(200)
+    processor.simulation(optimized, [], 200, 8, profile=profile, debug_info=optimized_info)
+    assert "Limit exceeded! pc: loop (count.ed:10)" in caplog.text
+    assert "      14         2  loop (count.ed:10)" in profile.report(debug_info=optimized_info)
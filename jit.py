@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+from opcodes import (
+    DIRECT,
+    IMMEDIATE,
+    INDIRECT,
+    Opcode,
+    fetch_ticks,
+    immediate_ticks,
+    indirect_ticks,
+    instruction_ticks,
+    opcode_list,
+    string_word_ticks,
+)
+from ports import input_port, write_string
+from threaded import ThreadedCode, ThreadedState, _div, _HaltError
+
+block_terminators = {Opcode.JG, Opcode.JZ, Opcode.JNZ, Opcode.JMP, Opcode.HALT}
+"Инструкции, завершающие базовый блок."
+
+max_block_length = 64
+"Максимальная длина базового блока (в инструкциях)."
+
+branch_conditions = {
+    Opcode.JG: "f >= 0",
+    Opcode.JZ: "f == 0",
+    Opcode.JNZ: "f != 0",
+    Opcode.JMP: "True",
+}
+
+arithmetic = {
+    Opcode.ADD: "ac = f = ac + {}",
+    Opcode.SUB: "ac = f = ac - {}",
+    Opcode.MUL: "ac = f = ac * {}",
+    Opcode.DIV: "ac = f = div(ac, {})",
+    Opcode.LOAD: "ac = f = {}",
+    Opcode.CMP: "f = ac - {}",
+    Opcode.TEST: "f = ac & {}",
+}
+"Инструкции, читающие операнд из памяти: шаблон строки, куда подставляется прочитанное значение (или непосредственный операнд)."
+
+
+class JitState(ThreadedState):
+    __slots__ = ("count",)
+
+    def __init__(self, ac, sp, flag, count):
+        super().__init__(ac, sp, flag)
+        self.count = count
+
+
+class BlockBuilder:
+    """Генерация исходного кода на Python для одного базового блока."""
+
+    def __init__(self, code, entry: int):
+        self.code = code
+        self.entry = entry
+        self.lines = ["ac, sp, f = st.ac, st.sp, st.flag"]
+        self.count = 0
+        self.ticks = 0
+        self.end = entry
+
+    def emit(self, line: str):
+        self.lines.append(line)
+
+    def exit_lines(self, next_pc: str, count: int, ticks: int) -> list[str]:
+        return [
+            "st.ac, st.sp, st.flag = ac, sp, f",
+            f"st.ticks += {ticks}",
+            f"st.count += {count}",
+            f"return {next_pc}",
+        ]
+
+    def emit_exit(self, next_pc: str, count: int, ticks: int, indent: str = ""):
+        for line in self.exit_lines(next_pc, count, ticks):
+            self.emit(indent + line)
+
+    def emit_halt(self, next_pc: int, ticks: int, indent: str = ""):
+        self.emit(indent + "st.ac, st.sp, st.flag = ac, sp, f")
+        self.emit(indent + f"st.ticks += {ticks}")
+        self.emit(indent + f"st.count += {self.count}")
+        self.emit(indent + f"st.halt_pc = {next_pc}")
+        self.emit(indent + "raise HaltError")
+
+    def emit_write_check(self, addr: str, next_pc: int):
+        """Выход из блока, если запись попала в его собственный код."""
+        self.emit(f"if {self.entry} <= {addr} % size < {self.entry} + LENGTH:")
+        self.emit_exit(repr(next_pc), self.count, self.ticks, "    ")
+
+    def emit_output(self, opcode: Opcode, operand: str, immediate: bool):
+        if opcode == Opcode.OUTS:
+            # Такты слов строки зависят от памяти и добавляются сразу, а не при выходе из блока.
+            self.emit(f"st.ticks += write_string(output_ports.get(ac), read, {operand}, size) * {string_word_ticks}")
+        else:
+            self.emit(f"port = output_ports.get({operand if immediate else f'read({operand})'})")
+            self.emit("if port is not None:")
+            self.emit("    port.write(ac)")
+        self.emit(f"f = {operand}")
+
+    def build(self) -> tuple[str, int]:
+        """Исходный код функции `block(st)` и количество ячеек в блоке."""
+        memory, size = self.code.memory, self.code.size
+        pc = self.entry
+        while True:
+            opcode_id, value, mode = memory.decode(pc)
+            opcode = opcode_list[opcode_id]
+            next_pc = pc + 1
+            if (mode == INDIRECT and opcode == Opcode.NOP) or (mode == IMMEDIATE and opcode not in immediate_ticks):
+                mode = DIRECT
+            self.add(opcode, value, mode, next_pc % size)
+            terminates = opcode in block_terminators
+            pc = next_pc
+            if terminates or pc >= size or self.count >= max_block_length:
+                break
+        self.end = pc
+        if not terminates:
+            self.emit_exit(repr(pc % size), self.count, self.ticks)
+        source = "def block(st):\n" + "".join(f"    {line}\n" for line in self.lines)
+        return source.replace("LENGTH", str(self.end - self.entry)), self.end - self.entry
+
+    def add(self, opcode: Opcode, value, mode: int, next_pc: int):
+        """Сгенерировать код одной инструкции (`mode` -- вид адресации, допустимый для `opcode`)."""
+        indirect, immediate = mode == INDIRECT, mode == IMMEDIATE
+        fetch_cost = fetch_ticks + (indirect_ticks if indirect else 0)
+        operand = pointer = repr(value)
+        if indirect:
+            self.emit(f"a = read({pointer})")
+            operand = "a"
+
+        if opcode == Opcode.HALT:
+            self.emit_halt(next_pc, self.ticks + fetch_cost)
+            return
+        if opcode == Opcode.IN:
+            self.emit("symbol_code = read_input()")
+            self.emit("if symbol_code is None:")
+            self.emit_halt(next_pc, self.ticks + fetch_cost, "    ")
+
+        self.count += 1
+        self.ticks += fetch_cost + (immediate_ticks[opcode] if immediate else instruction_ticks[opcode])
+        if opcode in branch_conditions:
+            self.emit(f"if {branch_conditions[opcode]}:")
+            self.emit(f"    f = {operand}")
+            target = f"{operand} % size" if indirect else repr(value % self.code.size)
+            self.emit_exit(target, self.count, self.ticks, "    ")
+            self.emit(f"f = {pointer if indirect else 1}")
+            self.emit_exit(repr(next_pc), self.count, self.ticks)
+            return
+
+        if opcode in arithmetic:
+            self.emit(arithmetic[opcode].format(operand if immediate else f"read({operand})"))
+        elif opcode == Opcode.STORE:
+            self.emit(f"write({operand}, ac)")
+            self.emit("f = ac")
+            if indirect or value >= self.entry:
+                self.emit_write_check(operand, next_pc)
+        elif opcode == Opcode.PUSH:
+            self.emit("sp = (sp - 1) % size")
+            self.emit("write(sp, ac)")
+            self.emit("f = ac")
+            self.emit_write_check("sp", next_pc)
+        elif opcode == Opcode.POP:
+            self.emit("ac = f = read(sp)")
+            self.emit("sp = (sp + 1) % size")
+        elif opcode in {Opcode.OUT, Opcode.OUTS}:
+            self.emit_output(opcode, operand, immediate)
+        elif opcode == Opcode.IN:
+            self.emit("ac = symbol_code")
+            self.emit(f"f = {pointer if indirect else 1}")
+        elif opcode == Opcode.INC:
+            self.emit("ac = f = ac + 1")
+        elif opcode == Opcode.DEC:
+            self.emit("ac = f = ac - 1")
+        else:
+            self.emit("f = 1")
+
+
+class JitCode(ThreadedCode):
+    """Кэш базовых блоков, скомпилированных в байт-код Python: адрес входа -> (функция, длина).
+
+    Базовый блок -- последовательность инструкций до перехода или останова включительно.
+    Запись в память удаляет все блоки, покрывающие адрес записи. Одиночные инструкции
+    (когда до лимита осталось меньше длины блока) выполняются обработчиками `ThreadedCode`.
+    """
+
+    def __init__(self, data_path):
+        super().__init__(data_path)
+        self.blocks = {}
+        self.covering = {}
+        "Адрес ячейки -> адреса входа блоков, которые её покрывают."
+        self.namespace = {
+            "read": self.memory.read,
+            "write": self.write,
+            "size": self.size,
+            "output_ports": data_path.output_ports,
+            "read_input": data_path.input_ports[input_port].read,
+            "div": _div,
+            "write_string": write_string,
+            "HaltError": _HaltError,
+        }
+
+    def block(self, entry: int):
+        block = self.blocks.get(entry)
+        if block is None:
+            block = self.blocks[entry] = self.compile_block(entry)
+        return block
+
+    def compile_block(self, entry: int):
+        builder = BlockBuilder(self, entry)
+        source, length = builder.build()
+        namespace = dict(self.namespace)
+        exec(compile(source, f"<block {entry}>", "exec"), namespace)
+        for addr in range(entry, builder.end):
+            self.covering.setdefault(addr, set()).add(entry)
+        return namespace["block"], length
+
+    def write(self, addr: int, value):
+        super().write(addr, value)
+        entries = self.covering.pop(addr % self.size, None)
+        if entries:
+            for entry in entries:
+                self.blocks.pop(entry, None)
+
+
+def run_jit(control_unit, limit: int) -> bool:
+    """Выполнение базовыми блоками, скомпилированными в байт-код Python. Возвращает True при останове."""
+    dp = control_unit.data_path
+    code = JitCode(dp)
+    state = JitState(dp.ac, dp.sp, -1 if dp.ps["N"] else 0 if dp.ps["Z"] else 1, control_unit.instruction_counter)
+    pc = dp.pc
+    halted = False
+    try:
+        while state.count < limit:
+            block, length = code.block(pc)
+            if state.count + length <= limit:
+                pc = block(state)
+            else:
+                pc = code[pc](state)
+                state.count += 1
+    except _HaltError:
+        pc = state.halt_pc
+        halted = True
+
+    dp.ac, dp.sp, dp.pc = state.ac, state.sp, pc
+    dp.alu.n_flag = state.flag < 0
+    dp.alu.z_flag = state.flag == 0
+    dp.signal_latch_ps_flags()
+    control_unit.instruction_counter = state.count
+    control_unit.tick(state.ticks)
+    return halted
@@ -0,0 +1,383 @@
+from __future__ import annotations
+
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # NumPy -- необязательная зависимость, нужна только этому модулю.
+    np = None
+
+import processor
+from memory import Memory, paged_memory_threshold
+from objfile import ObjectCode
+from opcodes import (
+    DIRECT,
+    IMMEDIATE,
+    INDIRECT,
+    Opcode,
+    fetch_ticks,
+    immediate_ticks,
+    indirect_ticks,
+    instruction_ticks,
+    opcode_ids,
+    opcode_list,
+    string_word_ticks,
+)
+from ports import output_port
+
+NOP_ID = opcode_ids[Opcode.NOP]
+
+value_min, value_max = -(1 << 63), (1 << 63) - 1
+"Границы значений ячеек и регистров, которые помещаются в int64."
+
+
+class LockstepEngine:
+    """Одновременное выполнение одной программы на многих входах.
+
+    Состояние каждого экземпляра машины -- строка массивов NumPy: регистры AC, PC, SP,
+    флаги (как в `functional.FunctionalEngine`, одним значением), память, позиция ввода
+    и буфер вывода. На каждом шаге все живые экземпляры выполняют по одной инструкции:
+    инструкции выбираются по их PC, экземпляры группируются по коду операции, и каждая
+    группа выполняется векторно. Инструкции с непосредственным операндом образуют
+    отдельные группы (`handlers` после обработчиков по кодам операций).
+
+    Значения хранятся в int64. Экземпляр, у которого результат арифметики выходит за
+    int64 или чтение выходит за пределы памяти, снимается с выполнения и потом
+    моделируется целиком движком `functional` -- результат всегда совпадает с
+    `processor.simulation`.
+    """
+
+    size = None
+    "Размер памяти."
+
+    opcodes = None
+    "Идентификаторы кодов операций, (экземпляр, адрес)."
+
+    values = None
+    "Значения ячеек, (экземпляр, адрес)."
+
+    modes = None
+    "Виды адресации, (экземпляр, адрес)."
+
+    flag = None
+    "Значения, по которым выставлены флаги N (< 0) и Z (== 0)."
+
+    halted = None
+    "Экземпляры, дошедшие до `halt` или `in` на пустом вводе."
+
+    fallback = None
+    "Экземпляры, которые моделируются движком `functional` (переполнение int64, выход за память)."
+
+    def __init__(self, code: list | ObjectCode, inputs: list[list], memory_size: int):
+        assert np is not None, "Lockstep engine requires numpy"
+        assert memory_size <= paged_memory_threshold, "Lockstep engine supports dense memory only"
+        memory = Memory(memory_size)
+        memory.load(code)
+        count = len(inputs)
+        self.size = memory_size
+        self.opcodes = np.tile(np.frombuffer(memory.opcodes, dtype=np.uint8), (count, 1))
+        self.values = np.tile(np.frombuffer(memory.values, dtype=np.int64), (count, 1))
+        self.modes = np.tile(np.frombuffer(memory.modes, dtype=np.uint8), (count, 1))
+        self.ac = np.zeros(count, dtype=np.int64)
+        self.pc = np.zeros(count, dtype=np.int64)
+        self.sp = np.zeros(count, dtype=np.int64)
+        self.flag = np.zeros(count, dtype=np.int64)
+        self.ticks = np.zeros(count, dtype=np.int64)
+        self.instructions = np.zeros(count, dtype=np.int64)
+        self.halted = np.zeros(count, dtype=bool)
+        # Значения, не помещающиеся в int64, есть уже в программе: векторно моделировать нечего.
+        self.fallback = np.full(count, bool(memory.wide_values))
+
+        self.input_length = np.array([len(tokens) for tokens in inputs], dtype=np.int64)
+        self.input_codes = np.zeros((count, max(self.input_length, default=0) or 1), dtype=np.int64)
+        for index, tokens in enumerate(inputs):
+            self.input_codes[index, : len(tokens)] = [ord(symbol) for symbol in tokens]
+        self.input_position = np.zeros(count, dtype=np.int64)
+        self.output_codes = np.zeros((count, 16), dtype=np.int64)
+        self.output_length = np.zeros(count, dtype=np.int64)
+
+        immediate_costs = [
+            fetch_ticks + immediate_ticks.get(opcode, instruction_ticks[opcode]) for opcode in opcode_list
+        ]
+        self.costs = np.array(
+            [fetch_ticks + instruction_ticks[opcode] for opcode in opcode_list] + immediate_costs, dtype=np.int64
+        )
+        self.has_immediate = np.array([opcode in immediate_ticks for opcode in opcode_list])
+        self.handlers = [self.execute_nop] * len(opcode_list)
+        for opcode, handler in {
+            Opcode.INC: self.execute_inc,
+            Opcode.DEC: self.execute_dec,
+            Opcode.HALT: self.execute_halt,
+            Opcode.PUSH: self.execute_push,
+            Opcode.POP: self.execute_pop,
+            Opcode.LOAD: self.execute_load,
+            Opcode.STORE: self.execute_store,
+            Opcode.ADD: self.execute_add,
+            Opcode.SUB: self.execute_sub,
+            Opcode.MUL: self.execute_mul,
+            Opcode.DIV: self.execute_div,
+            Opcode.OUT: self.execute_out,
+            Opcode.IN: self.execute_in,
+            Opcode.CMP: self.execute_cmp,
+            Opcode.TEST: self.execute_test,
+            Opcode.JG: self.execute_jg,
+            Opcode.JZ: self.execute_jz,
+            Opcode.JNZ: self.execute_jnz,
+            Opcode.JMP: self.execute_jmp,
+            Opcode.OUTS: self.execute_outs,
+        }.items():
+            self.handlers[opcode_ids[opcode]] = handler
+        self.handlers += self.handlers
+        for opcode, operation in {
+            Opcode.LOAD: self.load,
+            Opcode.ADD: self.add,
+            Opcode.SUB: self.sub,
+            Opcode.MUL: self.mul,
+            Opcode.DIV: self.div,
+            Opcode.CMP: self.cmp,
+            Opcode.TEST: self.test,
+        }.items():
+            self.handlers[len(opcode_list) + opcode_ids[opcode]] = self.immediate(operation)
+        self.handlers[len(opcode_list) + opcode_ids[Opcode.OUT]] = self.execute_out_immediate
+
+    def run(self, limit: int):
+        """Выполнять шаги, пока есть живые экземпляры и не достигнут лимит инструкций."""
+        rows = np.flatnonzero(~self.fallback)
+        step = 0
+        while rows.size and step < limit:
+            self.step(rows)
+            rows = rows[~(self.halted[rows] | self.fallback[rows])]
+            step += 1
+
+    def step(self, rows):
+        """Одна инструкция для каждого экземпляра из `rows`."""
+        pc = self.pc[rows]
+        opcode_id = self.opcodes[rows, pc]
+        value = self.values[rows, pc]
+        mode = self.modes[rows, pc]
+        has_pointer = (mode == INDIRECT) & (opcode_id != NOP_ID)
+        # Группа инструкции: код операции, для непосредственного операнда -- со сдвигом на число кодов операций.
+        group = opcode_id + len(opcode_list) * ((mode == IMMEDIATE) & self.has_immediate[opcode_id])
+        self.pc[rows] = (pc + 1) % self.size
+        self.ticks[rows] += self.costs[group] + indirect_ticks * has_pointer
+        operand = value.copy()
+        if has_pointer.any():
+            operand[has_pointer] = self.read(rows[has_pointer], value[has_pointer])
+        # Значение флага для инструкций, которые не меняют AC: указатель или 1.
+        pointer = np.where(has_pointer, value, 1)
+        for present in np.flatnonzero(np.bincount(group, minlength=len(self.handlers))):
+            selected = group == present
+            self.handlers[present](rows[selected], operand[selected], pointer[selected])
+        self.instructions[rows[~self.halted[rows]]] += 1
+
+    def read(self, rows, addr):
+        """Чтение ячеек. Адрес вне памяти (`Memory.read` бросил бы IndexError) снимает экземпляр."""
+        outside = (addr >= self.size) | (addr < -self.size)
+        if outside.any():
+            self.fallback[rows[outside]] = True
+        return self.values[rows, addr % self.size]
+
+    def write(self, rows, addr, value):
+        """Запись данных: ячейка становится NOP'ом с прямой адресацией."""
+        addr = addr % self.size
+        self.values[rows, addr] = value
+        self.opcodes[rows, addr] = NOP_ID
+        self.modes[rows, addr] = DIRECT
+
+    def set_ac(self, rows, result, overflow):
+        if overflow.any():
+            self.fallback[rows[overflow]] = True
+        self.ac[rows] = self.flag[rows] = result
+
+    def execute_nop(self, rows, operand, pointer):
+        self.flag[rows] = 1
+
+    def execute_inc(self, rows, operand, pointer):
+        ac = self.ac[rows]
+        self.set_ac(rows, ac + 1, ac == value_max)
+
+    def execute_dec(self, rows, operand, pointer):
+        ac = self.ac[rows]
+        self.set_ac(rows, ac - 1, ac == value_min)
+
+    def execute_halt(self, rows, operand, pointer):
+        self.halted[rows] = True
+
+    def execute_push(self, rows, operand, pointer):
+        sp = (self.sp[rows] - 1) % self.size
+        self.sp[rows] = sp
+        self.write(rows, sp, self.ac[rows])
+        self.flag[rows] = self.ac[rows]
+
+    def execute_pop(self, rows, operand, pointer):
+        sp = self.sp[rows]
+        self.ac[rows] = self.flag[rows] = self.values[rows, sp]
+        self.sp[rows] = (sp + 1) % self.size
+
+    def execute_load(self, rows, operand, pointer):
+        self.load(rows, self.read(rows, operand))
+
+    def execute_store(self, rows, operand, pointer):
+        self.write(rows, operand, self.ac[rows])
+        self.flag[rows] = self.ac[rows]
+
+    def execute_add(self, rows, operand, pointer):
+        self.add(rows, self.read(rows, operand))
+
+    def execute_sub(self, rows, operand, pointer):
+        self.sub(rows, self.read(rows, operand))
+
+    def execute_mul(self, rows, operand, pointer):
+        self.mul(rows, self.read(rows, operand))
+
+    def execute_div(self, rows, operand, pointer):
+        self.div(rows, self.read(rows, operand))
+
+    def execute_cmp(self, rows, operand, pointer):
+        self.cmp(rows, self.read(rows, operand))
+
+    def execute_test(self, rows, operand, pointer):
+        self.test(rows, self.read(rows, operand))
+
+    def immediate(self, operation):
+        """Обработчик инструкции с непосредственным операндом: `operation` получает сам операнд."""
+
+        def execute(rows, operand, pointer):
+            operation(rows, operand)
+
+        return execute
+
+    def load(self, rows, value):
+        self.ac[rows] = self.flag[rows] = value
+
+    def add(self, rows, other):
+        ac = self.ac[rows]
+        result = ac + other
+        self.set_ac(rows, result, ((ac ^ result) & (other ^ result)) < 0)
+
+    def sub(self, rows, other):
+        ac = self.ac[rows]
+        result = ac - other
+        self.set_ac(rows, result, ((ac ^ other) & (ac ^ result)) < 0)
+
+    def mul(self, rows, other):
+        ac = self.ac[rows]
+        # Оценка через float64 с запасом: экземпляры у границы int64 досчитываются точно движком `functional`.
+        self.set_ac(rows, ac * other, np.abs(ac.astype(np.float64) * other) >= 2.0**62)
+
+    def div(self, rows, divisor):
+        ac = self.ac[rows]
+        zero = divisor == 0
+        if zero.any():
+            logging.error(f"Division by zero: {Opcode.DIV} ({np.count_nonzero(zero)} instances)")
+        result = np.where(zero, 0, ac // np.where(zero, 1, divisor))
+        self.set_ac(rows, result, (ac == value_min) & (divisor == -1))
+
+    def cmp(self, rows, other):
+        ac = self.ac[rows]
+        result = ac - other
+        overflow = ((ac ^ other) & (ac ^ result)) < 0
+        if overflow.any():
+            self.fallback[rows[overflow]] = True
+        self.flag[rows] = result
+
+    def test(self, rows, other):
+        self.flag[rows] = self.ac[rows] & other
+
+    def execute_out(self, rows, operand, pointer):
+        self.out(rows, self.read(rows, operand), operand)
+
+    def execute_out_immediate(self, rows, operand, pointer):
+        self.out(rows, operand, operand)
+
+    def out(self, rows, port, operand):
+        writing = rows[port == output_port]
+        if writing.size:
+            length = self.output_length[writing]
+            self.reserve(length.max() + 1)
+            self.output_codes[writing, length] = self.ac[writing]
+            self.output_length[writing] = length + 1
+        self.flag[rows] = operand
+
+    def execute_outs(self, rows, operand, pointer):
+        """Строка с длиной по адресу операнда: слова с адресов `operand + 1 ..` (по модулю памяти)."""
+        count = np.maximum(self.read(rows, operand), 0)
+        self.ticks[rows] += count * string_word_ticks
+        selected = self.ac[rows] == output_port
+        writing, count, addr = rows[selected], count[selected], operand[selected]
+        if writing.size and count.max() > 0:
+            offsets = np.arange(1, count.max() + 1)
+            present = offsets <= count[:, None]
+            words = self.values[writing[:, None], (addr[:, None] + offsets) % self.size]
+            length = self.output_length[writing]
+            self.reserve((length + count).max())
+            positions = length[:, None] + offsets - 1
+            self.output_codes[np.broadcast_to(writing[:, None], present.shape)[present], positions[present]] = words[
+                present
+            ]
+            self.output_length[writing] = length + count
+        self.flag[rows] = operand
+
+    def reserve(self, length: int):
+        """Расширить буфер вывода (удвоением), чтобы в нём помещалось `length` кодов на экземпляр."""
+        while self.output_codes.shape[1] < length:
+            self.output_codes = np.concatenate([self.output_codes, np.zeros_like(self.output_codes)], axis=1)
+
+    def execute_in(self, rows, operand, pointer):
+        position = self.input_position[rows]
+        empty = position >= self.input_length[rows]
+        if empty.any():
+            # Останов на пустом вводе: такты как у выборки, без исполнения `in`.
+            self.halted[rows[empty]] = True
+            self.ticks[rows[empty]] -= instruction_ticks[Opcode.IN]
+            rows, position, pointer = rows[~empty], position[~empty], pointer[~empty]
+        self.ac[rows] = self.input_codes[rows, position]
+        self.input_position[rows] = position + 1
+        self.flag[rows] = pointer
+
+    def execute_jg(self, rows, operand, pointer):
+        self.branch(rows, operand, pointer, self.flag[rows] >= 0)
+
+    def execute_jz(self, rows, operand, pointer):
+        self.branch(rows, operand, pointer, self.flag[rows] == 0)
+
+    def execute_jnz(self, rows, operand, pointer):
+        self.branch(rows, operand, pointer, self.flag[rows] != 0)
+
+    def execute_jmp(self, rows, operand, pointer):
+        self.branch(rows, operand, pointer, np.ones(rows.size, dtype=bool))
+
+    def branch(self, rows, target, pointer, taken):
+        self.pc[rows[taken]] = target[taken] % self.size
+        self.flag[rows] = np.where(taken, target, pointer)
+
+    def results(self) -> list[tuple[str, list, int, int] | None]:
+        """Результаты в формате `processor.simulation` (None -- экземпляр снят с векторного выполнения)."""
+        results = []
+        for index in range(len(self.ac)):
+            if self.fallback[index]:
+                results.append(None)
+                continue
+            numbers = self.output_codes[index, : self.output_length[index]].tolist()
+            symbols = processor.codepoints_to_string(numbers)
+            results.append((symbols, numbers, int(self.instructions[index]), int(self.ticks[index])))
+        return results
+
+
+def simulate_many(
+    code: list | ObjectCode, inputs: list[list], memory_size: int, limit: int
+) -> list[tuple[str, list, int, int]]:
+    """Моделирование программы на каждом из входов `inputs` (списки символов, как `processor.parse_to_tokens`).
+
+    Результат для каждого входа -- как у `processor.simulation(code, tokens, memory_size, limit)`.
+    """
+    engine = LockstepEngine(code, inputs, memory_size)
+    engine.run(limit)
+    results = engine.results()
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = processor.simulation(code, list(inputs[index]), memory_size, limit, engine="functional")
+    exceeded = sum(1 for result in results if result[2] >= limit)
+    if exceeded:
+        logging.warning(f"Limit exceeded! ({exceeded} of {len(results)} instances)")
+    return results
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from memory import NOP_ID, PagedMemory, page_bits
+from ports import input_port
+
+
+def cell_hash(addr: int, opcode_id: int, value, mode: int) -> int:
+    """Вклад ячейки в хэш памяти. Ячейка по умолчанию (NOP, 0, прямая адресация) даёт 0."""
+    if opcode_id == NOP_ID and value == 0 and not mode:
+        return 0
+    return hash((addr, opcode_id, value, mode))
+
+
+def memory_hash(memory) -> int:
+    """Хэш всей памяти: XOR вкладов ячеек (для постраничной памяти -- ячеек созданных страниц)."""
+    if isinstance(memory, PagedMemory):
+        addresses = ((number << page_bits) + offset for number in memory.pages for offset in range(memory.page_size))
+    else:
+        addresses = range(memory.size)
+    result = 0
+    for addr in addresses:
+        result ^= cell_hash(addr, *memory.decode(addr))
+    return result
+
+
+class Loop:
+    """Найденный бесконечный цикл."""
+
+    first_pc = None
+    last_pc = None
+    "Диапазон адресов инструкций цикла: от наименьшего адреса перехода назад до наибольшего адреса перехода."
+
+    period = None
+    "Количество инструкций между повторами состояния."
+
+    instruction_counter = None
+    "Количество выполненных инструкций на момент обнаружения."
+
+    def __init__(self, first_pc: int, last_pc: int, period: int, instruction_counter: int):
+        self.first_pc = first_pc
+        self.last_pc = last_pc
+        self.period = period
+        self.instruction_counter = instruction_counter
+
+    def __str__(self) -> str:
+        return (
+            f"pc {self.first_pc}..{self.last_pc}, state repeats every {self.period} instructions"
+            f" (detected after {self.instruction_counter})"
+        )
+
+
+class LoopDetector:
+    """Обнаружение бесконечных циклов по повтору состояния машины.
+
+    Состояние -- PC, AC, SP, флаги N и Z, позиция ввода и хэш памяти. Хэш памяти --
+    XOR вкладов ячеек (как в хэшировании Зобриста): при записи вклад старого значения
+    ячейки снимается, нового -- добавляется, поэтому обновление стоит O(1). Состояние
+    запоминается на переходах назад (PC после инструкции не больше PC инструкции).
+    Повтор состояния значит, что машина будет повторять один и тот же участок вечно:
+    остальные регистры перезаписываются каждой инструкцией, а вывод на выполнение
+    не влияет. Модель останавливается на первом повторе, то есть через одну итерацию
+    повторяющегося цикла.
+
+    Совпадение 64-битных хэшей разных состояний теоретически возможно, но при числе
+    запомненных состояний не больше `max_states` маловероятно. При переполнении
+    запомненные состояния сбрасываются, и обнаружение начинается заново.
+    """
+
+    max_states = None
+    "Предельное количество запомненных состояний."
+
+    memory = None
+    memory_size = None
+    input_port = None
+
+    hash = None
+    "Текущий хэш памяти."
+
+    loop = None
+    "Найденный цикл (`Loop`) или None."
+
+    def __init__(self, max_states: int = 1 << 20):
+        assert max_states > 0, "max states should be greater than zero"
+        self.max_states = max_states
+        self.states = {}
+        self.edges = []
+
+    def attach(self, data_path):
+        """Подключиться к памяти и порту ввода модели (после загрузки программы)."""
+        self.memory = data_path.memory
+        self.memory_size = data_path.memory_size
+        self.input_port = data_path.input_ports[input_port]
+        self.hash = memory_hash(self.memory)
+        self.states.clear()
+        self.edges.clear()
+        self.loop = None
+
+    def write(self, addr: int, value):
+        """Запись в память с обновлением хэша."""
+        addr %= self.memory_size
+        self.hash ^= cell_hash(addr, *self.memory.decode(addr)) ^ cell_hash(addr, NOP_ID, value, 0)
+        self.memory.write(addr, value)
+
+    def back_edge(self, source: int, target: int, ac, sp: int, n: bool, z: bool, instruction_counter: int) -> bool:
+        """Учесть переход назад с `source` на `target`. Возвращает True, если состояние повторилось."""
+        self.edges.append((source, target))
+        state = hash((target, ac, sp, n, z, self.input_port.position, self.hash))
+        seen = self.states.get(state)
+        if seen is not None:
+            edge_index, counter = seen
+            edges = self.edges[edge_index:]
+            self.loop = Loop(
+                min(target for _, target in edges),
+                max(source for source, _ in edges),
+                instruction_counter - counter,
+                instruction_counter,
+            )
+            return True
+        if len(self.states) >= self.max_states:
+            self.states.clear()
+            self.edges = [(source, target)]
+        self.states[state] = (len(self.edges) - 1, instruction_counter)
+        return False
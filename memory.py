@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+from array import array
+
+from opcodes import DIRECT, IMMEDIATE, INDIRECT, Opcode, cell_addressing, opcode_ids, opcode_list
+
+NOP_ID = opcode_ids[Opcode.NOP]
+
+page_bits = 12
+"Размер страницы `PagedMemory` -- 2 ** page_bits ячеек."
+
+paged_memory_threshold = 1 << 20
+"Память большего размера `make_memory` создаёт постранично."
+
+
+def program_cells(program):
+    """Ячейки программы: (адрес, идентификатор кода операции, значение, вид адресации).
+
+    Программа -- список ячеек-словарей или объект с методом `cells()` (`objfile.ObjectCode`).
+    """
+    if hasattr(program, "cells"):
+        return program.cells()
+    return ((cell["index"], opcode_ids[cell["opcode"]], cell["value"], cell_addressing(cell)) for cell in program)
+
+
+class Memory:
+    """Память команд и данных.
+
+    Ячейки хранятся в параллельных массивах (код операции, значение, вид адресации),
+    которые декодируются один раз при загрузке программы. Значения, не
+    помещающиеся в 64 бита (или не являющиеся числами), лежат в отдельной таблице.
+    """
+
+    size = None
+    "Размер памяти."
+
+    opcodes = None
+    "Числовые идентификаторы кодов операций (см. `opcodes.opcode_list`)."
+
+    values = None
+    "Значения ячеек."
+
+    modes = None
+    "Виды адресации (`opcodes.DIRECT`, `opcodes.INDIRECT`, `opcodes.IMMEDIATE`)."
+
+    wide_values = None
+    "Значения, не помещающиеся в `values`: адрес -> значение."
+
+    def __init__(self, size: int):
+        assert size > 0, "memory size should be greater than zero"
+        self.size = size
+        self.opcodes = array("B", [NOP_ID]) * size
+        self.values = array("q", [0]) * size
+        self.modes = bytearray(size)
+        self.wide_values = {}
+
+    def load(self, program):
+        """Декодировать ячейки машинного кода в массивы памяти."""
+        for index, opcode_id, value, mode in program_cells(program):
+            assert 0 <= index < self.size, f"Cell {index} is out of memory"
+            self.opcodes[index] = opcode_id
+            self.modes[index] = mode
+            self._set_value(index, value)
+
+    def opcode(self, addr: int) -> Opcode:
+        return opcode_list[self.opcodes[addr]]
+
+    def is_indirect(self, addr: int) -> bool:
+        return self.modes[addr] == INDIRECT
+
+    def is_immediate(self, addr: int) -> bool:
+        return self.modes[addr] == IMMEDIATE
+
+    def read(self, addr: int):
+        if self.wide_values:
+            value = self.wide_values.get(addr % self.size)
+            if value is not None:
+                return value
+        return self.values[addr]
+
+    def decode(self, addr: int) -> tuple[int, object, int]:
+        """Ячейка целиком: (идентификатор кода операции, значение, вид адресации)."""
+        value = self.values[addr]
+        if self.wide_values:
+            value = self.wide_values.get(addr % self.size, value)
+        return self.opcodes[addr], value, self.modes[addr]
+
+    def write(self, addr: int, value):
+        """Запись данных: ячейка становится NOP'ом с прямой адресацией."""
+        addr %= self.size
+        self.opcodes[addr] = NOP_ID
+        self.modes[addr] = DIRECT
+        self._set_value(addr, value)
+
+    def cell(self, addr: int) -> dict:
+        """Ячейка памяти в формате машинного кода."""
+        addr %= self.size
+        cell = {
+            "index": addr,
+            "opcode": self.opcode(addr),
+            "value": self.read(addr),
+            "is_indirect": self.is_indirect(addr),
+        }
+        if self.is_immediate(addr):
+            cell["is_immediate"] = True
+        return cell
+
+    def _set_value(self, addr: int, value):
+        try:
+            self.values[addr] = value
+        except (OverflowError, TypeError):
+            self.values[addr] = 0
+            self.wide_values[addr] = value
+        else:
+            if self.wide_values:
+                self.wide_values.pop(addr, None)
+
+
+class _Page:
+    __slots__ = ("modes", "opcodes", "values")
+
+    def __init__(self, size: int):
+        self.opcodes = array("B", [NOP_ID]) * size
+        self.values = array("q", [0]) * size
+        self.modes = bytearray(size)
+
+
+class PagedMemory:
+    """Разреженная память для больших адресных пространств (вплоть до 2 ** 32 ячеек и больше).
+
+    Интерфейс совпадает с `Memory`. Ячейки хранятся страницами тех же параллельных
+    массивов, страница создаётся при первой записи в неё. Ячейки нетронутых страниц
+    читаются как NOP с нулевым значением. Адреса берутся по модулю размера памяти.
+    """
+
+    size = None
+    "Размер памяти."
+
+    pages = None
+    "Созданные страницы: номер страницы -> `_Page`."
+
+    wide_values = None
+    "Значения, не помещающиеся в 64 бита: адрес -> значение."
+
+    def __init__(self, size: int):
+        assert size > 0, "memory size should be greater than zero"
+        self.size = size
+        self.pages = {}
+        self.wide_values = {}
+        self.page_size = 1 << page_bits
+        self.offset_mask = self.page_size - 1
+
+    def load(self, program):
+        for index, opcode_id, value, mode in program_cells(program):
+            assert 0 <= index < self.size, f"Cell {index} is out of memory"
+            page = self._page(index)
+            offset = index & self.offset_mask
+            page.opcodes[offset] = opcode_id
+            page.modes[offset] = mode
+            self._set_value(page, index, value)
+
+    def opcode(self, addr: int) -> Opcode:
+        addr %= self.size
+        page = self.pages.get(addr >> page_bits)
+        if page is None:
+            return Opcode.NOP
+        return opcode_list[page.opcodes[addr & self.offset_mask]]
+
+    def is_indirect(self, addr: int) -> bool:
+        addr %= self.size
+        page = self.pages.get(addr >> page_bits)
+        return page is not None and page.modes[addr & self.offset_mask] == INDIRECT
+
+    def is_immediate(self, addr: int) -> bool:
+        addr %= self.size
+        page = self.pages.get(addr >> page_bits)
+        return page is not None and page.modes[addr & self.offset_mask] == IMMEDIATE
+
+    def read(self, addr: int):
+        addr %= self.size
+        if self.wide_values:
+            value = self.wide_values.get(addr)
+            if value is not None:
+                return value
+        page = self.pages.get(addr >> page_bits)
+        if page is None:
+            return 0
+        return page.values[addr & self.offset_mask]
+
+    def decode(self, addr: int) -> tuple[int, object, int]:
+        addr %= self.size
+        page = self.pages.get(addr >> page_bits)
+        if page is None:
+            return NOP_ID, 0, 0
+        offset = addr & self.offset_mask
+        value = page.values[offset]
+        if self.wide_values:
+            value = self.wide_values.get(addr, value)
+        return page.opcodes[offset], value, page.modes[offset]
+
+    def write(self, addr: int, value):
+        addr %= self.size
+        page = self._page(addr)
+        offset = addr & self.offset_mask
+        page.opcodes[offset] = NOP_ID
+        page.modes[offset] = DIRECT
+        self._set_value(page, addr, value)
+
+    def cell(self, addr: int) -> dict:
+        addr %= self.size
+        cell = {
+            "index": addr,
+            "opcode": self.opcode(addr),
+            "value": self.read(addr),
+            "is_indirect": self.is_indirect(addr),
+        }
+        if self.is_immediate(addr):
+            cell["is_immediate"] = True
+        return cell
+
+    def allocated(self) -> int:
+        """Количество ячеек в созданных страницах."""
+        return len(self.pages) * self.page_size
+
+    def _page(self, addr: int) -> _Page:
+        number = addr >> page_bits
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = _Page(self.page_size)
+        return page
+
+    def _set_value(self, page: _Page, addr: int, value):
+        offset = addr & self.offset_mask
+        try:
+            page.values[offset] = value
+        except (OverflowError, TypeError):
+            page.values[offset] = 0
+            self.wide_values[addr] = value
+        else:
+            if self.wide_values:
+                self.wide_values.pop(addr, None)
+
+
+def make_memory(size: int) -> Memory | PagedMemory:
+    """Плотная память для небольших размеров, постраничная -- для больших."""
+    if size > paged_memory_threshold:
+        return PagedMemory(size)
+    return Memory(size)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from opcodes import IMMEDIATE, INDIRECT, ALUOpcode, Opcode, Selectors, immediate_ticks
+
+
+def signal(name: str, *args) -> tuple:
+    """Микрооперация: сигнал `DataPath` (имя без префикса `signal_`) и его аргументы."""
+    return name, args
+
+
+def alu(operation: ALUOpcode, left: Selectors | None = None, right: Selectors | None = None) -> tuple:
+    return signal("execute_alu_op", operation, left, right)
+
+
+def step(*operations: tuple, condition: tuple | None = None) -> tuple:
+    """Микрокоманда: микрооперации одного такта по порядку.
+
+    `condition` -- (флаг, значение): микрооперации выполняются, только если флаг PS равен
+    значению, такт проходит в любом случае.
+    """
+    return condition, operations
+
+
+latch_ac = signal("latch_ac", Selectors.FROM_ALU)
+
+operand_address = (alu(ALUOpcode.SKIP_B, right=Selectors.FROM_DR), signal("latch_addr"))
+"Адрес операнда из DR."
+
+
+def memory_operand(*operations: tuple) -> tuple:
+    """Операнд из памяти по адресу в DR: такт выдачи адреса, затем чтение в DR и `operations`."""
+    return step(*operand_address), step(signal("latch_dr"), *operations)
+
+
+def jump(condition: tuple | None = None) -> tuple:
+    return (step(alu(ALUOpcode.SKIP_B, right=Selectors.FROM_DR), signal("latch_pc"), condition=condition),)
+
+
+microprogram = {
+    Opcode.NOP: (step(),),
+    Opcode.INC: (step(alu(ALUOpcode.INC_A, left=Selectors.FROM_AC), latch_ac),),
+    Opcode.DEC: (step(alu(ALUOpcode.DEC_A, left=Selectors.FROM_AC), latch_ac),),
+    Opcode.HALT: (step(signal("halt")),),
+    Opcode.PUSH: (
+        step(alu(ALUOpcode.DEC_B, right=Selectors.FROM_SP), signal("latch_sp"), signal("latch_addr")),
+        step(alu(ALUOpcode.SKIP_A, left=Selectors.FROM_AC), signal("latch_to_mem"), signal("wr")),
+    ),
+    Opcode.POP: (
+        step(alu(ALUOpcode.SKIP_B, right=Selectors.FROM_SP), signal("latch_addr")),
+        step(alu(ALUOpcode.INC_B, right=Selectors.FROM_SP), signal("latch_sp"), signal("latch_dr")),
+        step(alu(ALUOpcode.SKIP_B, right=Selectors.FROM_DR), latch_ac),
+    ),
+    Opcode.LOAD: memory_operand(alu(ALUOpcode.SKIP_B, right=Selectors.FROM_DR), latch_ac),
+    Opcode.STORE: (
+        step(*operand_address),
+        step(alu(ALUOpcode.SKIP_A, left=Selectors.FROM_AC), signal("latch_to_mem"), signal("wr")),
+    ),
+    Opcode.ADD: memory_operand(alu(ALUOpcode.ADD, Selectors.FROM_AC, Selectors.FROM_DR), latch_ac),
+    Opcode.SUB: memory_operand(alu(ALUOpcode.SUB, Selectors.FROM_AC, Selectors.FROM_DR), latch_ac),
+    Opcode.MUL: memory_operand(alu(ALUOpcode.MUL, Selectors.FROM_AC, Selectors.FROM_DR), latch_ac),
+    Opcode.DIV: memory_operand(alu(ALUOpcode.DIV, Selectors.FROM_AC, Selectors.FROM_DR), latch_ac),
+    Opcode.OUT: memory_operand(signal("output")),
+    Opcode.IN: (step(signal("latch_ac", Selectors.FROM_INPUT)),),
+    Opcode.CMP: memory_operand(alu(ALUOpcode.CMP, Selectors.FROM_AC, Selectors.FROM_DR)),
+    Opcode.TEST: memory_operand(alu(ALUOpcode.TEST, Selectors.FROM_AC, Selectors.FROM_DR)),
+    Opcode.JG: jump(("N", False)),
+    Opcode.JZ: jump(("Z", True)),
+    Opcode.JNZ: jump(("Z", False)),
+    Opcode.JMP: jump(),
+    Opcode.OUTS: memory_operand(signal("output_string")),
+}
+"Микропрограммы исполнения инструкций при прямой адресации (после выборки): по микрокоманде на такт."
+
+indirect_prefix = (step(*operand_address), step(signal("latch_dr")))
+"Выборка операнда при косвенной адресации: адрес из DR, чтение ячейки в DR. Перед всеми инструкциями, кроме `nop`."
+
+immediate_microprogram = {
+    Opcode.LOAD: (step(alu(ALUOpcode.SKIP_B, right=Selectors.FROM_DR), latch_ac),),
+    Opcode.ADD: (step(alu(ALUOpcode.ADD, Selectors.FROM_AC, Selectors.FROM_DR), latch_ac),),
+    Opcode.SUB: (step(alu(ALUOpcode.SUB, Selectors.FROM_AC, Selectors.FROM_DR), latch_ac),),
+    Opcode.MUL: (step(alu(ALUOpcode.MUL, Selectors.FROM_AC, Selectors.FROM_DR), latch_ac),),
+    Opcode.DIV: (step(alu(ALUOpcode.DIV, Selectors.FROM_AC, Selectors.FROM_DR), latch_ac),),
+    Opcode.OUT: (step(alu(ALUOpcode.SKIP_B, right=Selectors.FROM_DR), signal("output")),),
+    Opcode.CMP: (step(alu(ALUOpcode.CMP, Selectors.FROM_AC, Selectors.FROM_DR)),),
+    Opcode.TEST: (step(alu(ALUOpcode.TEST, Selectors.FROM_AC, Selectors.FROM_DR)),),
+}
+"Микропрограммы при непосредственной адресации: операнд уже в DR после выборки, один такт без памяти."
+
+assert immediate_microprogram.keys() == immediate_ticks.keys(), "Immediate microprograms do not match ticks table"
+
+
+def microcode(opcode: Opcode, mode: int) -> tuple:
+    """Микропрограмма инструкции `opcode` с видом адресации `mode`."""
+    if mode == INDIRECT and opcode != Opcode.NOP:
+        return indirect_prefix + microprogram[opcode]
+    if mode == IMMEDIATE and opcode in immediate_microprogram:
+        return immediate_microprogram[opcode]
+    return microprogram[opcode]
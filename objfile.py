@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import mmap
+import struct
+
+from opcodes import DIRECT, IMMEDIATE, INDIRECT, cell_addressing, opcode_ids, read_code
+
+magic = b"CSAOBJ\x00\x00"
+"Сигнатура двоичного объектного файла."
+
+version = 3
+"""Версия формата. Версия 2 добавила флаг непосредственной адресации, версия 3 -- код операции `outs`.
+
+Файлы предыдущих версий читаются как есть."""
+
+header_struct = struct.Struct("<8sHHIQ")
+"Заголовок: сигнатура, версия, зарезервировано, размер таблицы длинных чисел, количество ячеек."
+
+cell_struct = struct.Struct("<IBBxxq")
+"Ячейка: адрес, идентификатор кода операции, флаги, значение (или номер в таблице длинных чисел)."
+
+length_struct = struct.Struct("<I")
+"Длина записи таблицы длинных чисел в байтах."
+
+INDIRECT_FLAG = 1
+WIDE_FLAG = 2
+IMMEDIATE_FLAG = 4
+
+mode_flags = {DIRECT: 0, INDIRECT: INDIRECT_FLAG, IMMEDIATE: IMMEDIATE_FLAG}
+"Флаги записи ячейки по виду адресации."
+
+value_min, value_max = -(1 << 63), (1 << 63) - 1
+
+
+class ObjectCode:
+    """Машинный код из двоичного объектного файла, отображённого в память через `mmap`.
+
+    Ячейки не превращаются в словари: `cells()` распаковывает записи прямо из отображения,
+    `Memory.load` кладёт их в массивы памяти.
+    """
+
+    cell_count = None
+    "Количество ячеек."
+
+    wide_values = None
+    "Таблица длинных чисел: номер -> значение."
+
+    def __init__(self, filename: str):
+        with open(filename, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, file_version, _, wide_count, self.cell_count = header_struct.unpack_from(self.buffer)
+        assert file_magic == magic, f"Not an object file: {filename}"
+        assert 1 <= file_version <= version, f"Unsupported object file version {file_version}"
+        self.cells_offset = header_struct.size
+        offset = self.cells_offset + self.cell_count * cell_struct.size
+        self.wide_values = []
+        for _ in range(wide_count):
+            (length,) = length_struct.unpack_from(self.buffer, offset)
+            offset += length_struct.size
+            self.wide_values.append(int.from_bytes(self.buffer[offset : offset + length], "little", signed=True))
+            offset += length
+
+    def __len__(self) -> int:
+        return self.cell_count
+
+    def cells(self):
+        """Ячейки: (адрес, идентификатор кода операции, значение, вид адресации)."""
+        end = self.cells_offset + self.cell_count * cell_struct.size
+        view = memoryview(self.buffer)[self.cells_offset : end]
+        try:
+            for index, opcode_id, flags, value in cell_struct.iter_unpack(view):
+                if flags & WIDE_FLAG:
+                    value = self.wide_values[value]
+                if flags & INDIRECT_FLAG:
+                    mode = INDIRECT
+                else:
+                    mode = IMMEDIATE if flags & IMMEDIATE_FLAG else DIRECT
+                yield index, opcode_id, value, mode
+        finally:
+            view.release()
+
+    def close(self):
+        self.buffer.close()
+
+
+def write_object(filename: str, code: list):
+    """Записать машинный код (список ячеек-словарей) в двоичный объектный файл."""
+    records = bytearray(len(code) * cell_struct.size)
+    wide = []
+    for position, cell in enumerate(code):
+        index, value = cell["index"], cell["value"]
+        assert 0 <= index <= 0xFFFFFFFF, f"Cell {index} does not fit the object format, use JSON"
+        assert isinstance(value, int), f"Cell {index} holds a non-integer value {value!r}"
+        flags = mode_flags[cell_addressing(cell)]
+        if not value_min <= value <= value_max:
+            flags |= WIDE_FLAG
+            wide.append(value)
+            value = len(wide) - 1
+        cell_struct.pack_into(records, position * cell_struct.size, index, opcode_ids[cell["opcode"]], flags, value)
+
+    with open(filename, "wb") as file:
+        file.write(header_struct.pack(magic, version, 0, len(wide), len(code)))
+        file.write(records)
+        for value in wide:
+            data = value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+            file.write(length_struct.pack(len(data)))
+            file.write(data)
+
+
+def is_object_file(filename: str) -> bool:
+    with open(filename, "rb") as file:
+        return file.read(len(magic)) == magic
+
+
+def read_program(filename: str) -> list | ObjectCode:
+    """Машинный код из файла любого формата: двоичный определяется по сигнатуре, иначе JSON."""
+    if is_object_file(filename):
+        return ObjectCode(filename)
+    return read_code(filename)
@@ -45,6 +45,9 @@ class Opcode(str, Enum):
     JNZ = "jnz"
     JMP = "jmp"
 
+    # Новые коды операций добавляются в конец: номер в `opcode_list` хранится в памяти и объектных файлах.
+    OUTS = "outs"
+
     def __str__(self) -> str:
         return str(self.value)
 
@@ -77,8 +80,79 @@ onear_instructions = [
     Opcode.IN,
     Opcode.CMP,
     Opcode.TEST,
+    Opcode.OUTS,
 ]
 
+DIRECT = 0
+INDIRECT = 1
+IMMEDIATE = 2
+"Виды адресации операнда (так они хранятся в памяти): прямая, косвенная, непосредственная."
+
+fetch_ticks = 2
+"Тактов на выборку инструкции."
+
+indirect_ticks = 2
+"Дополнительных тактов на выборку операнда при косвенной адресации."
+
+instruction_ticks = {
+    Opcode.NOP: 1,
+    Opcode.INC: 1,
+    Opcode.DEC: 1,
+    Opcode.HALT: 0,
+    Opcode.PUSH: 2,
+    Opcode.POP: 3,
+    Opcode.LOAD: 2,
+    Opcode.STORE: 2,
+    Opcode.ADD: 2,
+    Opcode.SUB: 2,
+    Opcode.MUL: 2,
+    Opcode.DIV: 2,
+    Opcode.OUT: 2,
+    Opcode.IN: 1,
+    Opcode.CMP: 2,
+    Opcode.TEST: 2,
+    Opcode.JG: 1,
+    Opcode.JZ: 1,
+    Opcode.JNZ: 1,
+    Opcode.JMP: 1,
+    Opcode.OUTS: 2,
+}
+"Тактов на исполнение инструкции (без выборки и косвенной адресации), как в ControlUnit."
+
+string_word_ticks = 1
+"""Тактов на каждое слово строки `outs` сверх `instruction_ticks`: чтение слова из памяти и запись в порт.
+
+Блок вывода читает слова своим счётчиком адреса, по слову за такт (память однопортовая).
+"""
+
+immediate_ticks = {
+    Opcode.LOAD: 1,
+    Opcode.ADD: 1,
+    Opcode.SUB: 1,
+    Opcode.MUL: 1,
+    Opcode.DIV: 1,
+    Opcode.OUT: 1,
+    Opcode.CMP: 1,
+    Opcode.TEST: 1,
+}
+"""Тактов на исполнение инструкции при непосредственной адресации (операнд уже в DR после выборки).
+
+Непосредственная адресация допустима только для этих инструкций, остальные исполняются как при прямой.
+"""
+
+opcode_list = list(Opcode)
+"Коды операций в порядке их числовых идентификаторов (так они хранятся в памяти)."
+
+opcode_ids = {opcode: index for index, opcode in enumerate(opcode_list)}
+"Числовой идентификатор кода операции."
+
+
+def cell_addressing(cell: dict) -> int:
+    """Вид адресации ячейки машинного кода. Ключ `is_immediate` есть только у ячеек с непосредственным операндом."""
+    if cell["is_indirect"]:
+        return INDIRECT
+    return IMMEDIATE if cell.get("is_immediate") else DIRECT
+
 
 def write_code(filename, code):
     with open(filename, "w", encoding="utf-8") as file:
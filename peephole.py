@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import bisect
+
+from opcodes import Opcode, fetch_ticks, instruction_ticks
+
+instruction_names = {str(opcode) for opcode in Opcode}
+"Операторы исходного кода: имена кодов операций."
+
+conditional_branches = {str(Opcode.JG), str(Opcode.JZ), str(Opcode.JNZ)}
+branches = conditional_branches | {str(Opcode.JMP)}
+memory_moves = {str(Opcode.LOAD), str(Opcode.STORE)}
+
+
+def is_instruction(word: list) -> bool:
+    return isinstance(word[0], str) and word[0] in instruction_names
+
+
+def cost(name: str) -> int:
+    """Такты на выполнение инструкции с прямой адресацией, включая выборку."""
+    return fetch_ticks + instruction_ticks[Opcode(name)]
+
+
+class Peephole:
+    """Оптимизация машинного кода по шаблонам (peephole).
+
+    Работает со словами исходного кода до подстановки адресов меток (`translator.translate`
+    вызывает её между построением таблицы символов и связыванием), поэтому после удаления
+    ячеек адреса меток и ссылки на них пересчитываются обычным связыванием. Ячейки удаляются
+    внутри участка памяти: следующие за ними ячейки участка сдвигаются, участки, размещённые
+    `org`, остаются на своих адресах, даже если начинаются сразу за предыдущим.
+
+    Шаблоны:
+
+    - `load`/`store` сразу после `load`/`store` того же адреса данных (AC, флаги и память
+      не меняются)
+    - переход на `jmp` заменяется переходом сразу на его цель
+    - инструкции после `jmp` и `halt` до ближайшей метки недостижимы
+    - `nop`, если следующая инструкция -- не условный переход (`nop` выставляет флаги)
+
+    Предполагается, что в код переходят только по меткам и код не изменяет сам себя.
+    Статистика остаётся в объекте.
+    """
+
+    removed = None
+    "Количество удалённых инструкций по шаблону."
+
+    threaded = None
+    "Количество перенаправленных переходов."
+
+    savings = None
+    "Такты, сэкономленные за одно прохождение, по адресу оптимизированного кода."
+
+    loops = None
+    "Циклы оптимизированного кода (адрес начала, адрес перехода назад) -> тактов за итерацию."
+
+    origins = None
+    "Адрес слова оптимизированного кода -> адрес того же слова до оптимизации (нужен отладочной информации)."
+
+    regions = None
+    "Адреса начала участков памяти: 0 и адреса `org`, отсортированы."
+
+    def __init__(self):
+        self.removed = {"redundant load/store": 0, "nop": 0, "unreachable": 0}
+        self.threaded = 0
+        self.savings = {}
+        self.loops = {}
+        self.origins = {}
+        self.regions = [0]
+
+    def optimize(self, words: dict, symbols: dict, regions: set[int]) -> tuple[dict, dict]:
+        """Оптимизировать слова (адрес -> слово) и таблицу символов (метка -> адрес) до неподвижной точки.
+
+        `regions` -- адреса `org` исходного кода: с них начинаются участки, которые не сдвигаются.
+        """
+        self.origins = {position: position for position in words}
+        self.regions = sorted({0} | set(regions))
+        while True:
+            threaded = self.thread_jumps(words, symbols)
+            labelled = set(symbols.values())
+            deleted = {}
+            self.mark_unreachable(words, labelled, deleted)
+            self.mark_redundant_moves(words, symbols, labelled, deleted)
+            self.mark_nops(words, deleted)
+            if not deleted and not threaded:
+                break
+            words, symbols = self.compact(words, symbols, deleted)
+        self.loops = self.find_loops(words, symbols)
+        return words, symbols
+
+    def thread_jumps(self, words: dict, symbols: dict) -> bool:
+        changed = False
+        for position, word in words.items():
+            if not (word[0] in branches and len(word) == 2 and word[1] in symbols):
+                continue
+            label, seen = word[1], {position}
+            while True:
+                target = words.get(symbols[label])
+                if target is None or symbols[label] in seen or target[0] != str(Opcode.JMP) or len(target) != 2:
+                    break
+                if target[1] not in symbols:
+                    break
+                seen.add(symbols[label])
+                label = target[1]
+            if label != word[1]:
+                self.threaded += 1
+                self.save(position, cost(str(Opcode.JMP)) * (len(seen) - 1))
+                words[position] = [word[0], label]
+                changed = True
+        return changed
+
+    def mark_unreachable(self, words: dict, labelled: set, deleted: dict):
+        for position in sorted(words):
+            if words[position][0] not in {str(Opcode.JMP), str(Opcode.HALT)} or position in deleted:
+                continue
+            following = position + 1
+            while following in words and following not in labelled and is_instruction(words[following]):
+                deleted[following] = 0
+                self.removed["unreachable"] += 1
+                following += 1
+
+    def mark_redundant_moves(self, words: dict, symbols: dict, labelled: set, deleted: dict):
+        for position in sorted(words):
+            word, following = words[position], words.get(position + 1)
+            if position in deleted or following is None or position + 1 in deleted or position + 1 in labelled:
+                continue
+            if not (word[0] in memory_moves and following[0] in memory_moves and len(word) == len(following) == 2):
+                continue
+            operand = word[1]
+            if operand != following[1] or operand not in symbols:
+                continue
+            # Адрес -- ячейка данных, а не сами инструкции и не другой код.
+            target = symbols[operand]
+            if target in {position, position + 1} or (target in words and is_instruction(words[target])):
+                continue
+            deleted[position + 1] = cost(following[0])
+            self.removed["redundant load/store"] += 1
+
+    def mark_nops(self, words: dict, deleted: dict):
+        for position in sorted(words):
+            if words[position] != [str(Opcode.NOP)] or position in deleted:
+                continue
+            following = position + 1
+            while following in deleted:
+                following += 1
+            if following in words and words[following][0] in conditional_branches:
+                continue
+            deleted[position] = cost(str(Opcode.NOP))
+            self.removed["nop"] += 1
+
+    def compact(self, words: dict, symbols: dict, deleted: dict) -> tuple[dict, dict]:
+        """Удалить ячейки `deleted`, сдвинув остаток их участков; пересчитать адреса меток и экономии."""
+        removed = sorted(deleted)
+
+        def relocate(position: int) -> int:
+            start = self.regions[bisect.bisect_right(self.regions, position) - 1]
+            return position - (bisect.bisect_left(removed, position) - bisect.bisect_left(removed, start))
+
+        savings = {}
+        for position, ticks in list(self.savings.items()) + list(deleted.items()):
+            savings[relocate(position)] = savings.get(relocate(position), 0) + ticks
+        self.savings = {position: ticks for position, ticks in savings.items() if ticks}
+        self.origins = {relocate(position): self.origins[position] for position in words if position not in deleted}
+        compacted = {relocate(position): word for position, word in words.items() if position not in deleted}
+        return compacted, {label: relocate(position) for label, position in symbols.items()}
+
+    def find_loops(self, words: dict, symbols: dict) -> dict:
+        loops = {}
+        for position, word in sorted(words.items()):
+            if word[0] in branches and len(word) == 2 and word[1] in symbols and symbols[word[1]] <= position:
+                start = symbols[word[1]]
+                saved = sum(ticks for address, ticks in self.savings.items() if start <= address <= position)
+                if saved:
+                    loops[(start, position)] = saved
+        return loops
+
+    def save(self, position: int, ticks: int):
+        self.savings[position] = self.savings.get(position, 0) + ticks
+
+    def report(self) -> str:
+        removed = ", ".join(f"{name}: {count}" for name, count in self.removed.items())
+        lines = [f"peephole: removed {sum(self.removed.values())} ({removed}), threaded jumps: {self.threaded}"]
+        for (start, end), ticks in sorted(self.loops.items()):
+            lines.append(f"loop {start}..{end}: {ticks} ticks saved per iteration")
+        return "\n".join(lines)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from opcodes import IMMEDIATE, INDIRECT, Opcode, fetch_ticks, immediate_ticks
+
+memory_cycles = {
+    Opcode.NOP: (False,),
+    Opcode.INC: (False,),
+    Opcode.DEC: (False,),
+    Opcode.HALT: (),
+    Opcode.PUSH: (False, True),
+    Opcode.POP: (False, True, False),
+    Opcode.LOAD: (False, True),
+    Opcode.STORE: (False, True),
+    Opcode.ADD: (False, True),
+    Opcode.SUB: (False, True),
+    Opcode.MUL: (False, True),
+    Opcode.DIV: (False, True),
+    Opcode.OUT: (False, True),
+    Opcode.IN: (False,),
+    Opcode.CMP: (False, True),
+    Opcode.TEST: (False, True),
+    Opcode.JG: (False,),
+    Opcode.JZ: (False,),
+    Opcode.JNZ: (False,),
+    Opcode.JMP: (False,),
+    Opcode.OUTS: (False, True),
+}
+"""Такты исполнения инструкции (как в `ControlUnit`): занят ли в такте порт памяти.
+
+Слова строки `outs` читаются после исполнения, когда порт занят и выборка ждёт (как ожидание кэша).
+"""
+
+indirect_cycles = (False, True)
+"Такты выборки операнда при косвенной адресации: адрес из DR, чтение ячейки."
+
+immediate_cycles = (False,)
+"Такт исполнения при непосредственной адресации: операнд уже в DR."
+
+memory_writes = {Opcode.STORE, Opcode.PUSH}
+"Инструкции, пишущие в память последним тактом исполнения."
+
+
+def execute_cycles(opcode: Opcode, mode: int) -> tuple[bool, ...]:
+    """Такты исполнения инструкции с видом адресации `mode`: занят ли порт памяти."""
+    if mode == INDIRECT and opcode != Opcode.NOP:
+        return indirect_cycles + memory_cycles[opcode]
+    if mode == IMMEDIATE and opcode in immediate_ticks:
+        return immediate_cycles
+    return memory_cycles[opcode]
+
+
+class Pipeline:
+    """Временная модель двухстадийного конвейера: выборка следующей инструкции во время исполнения текущей.
+
+    Выборка -- `fetch_ticks` тактов: выдача адреса из PC (без памяти) и чтение ячейки
+    в IR/DR. Выдача адреса идёт в первом такте исполнения текущей инструкции, чтение --
+    в первом следующем такте, когда порт памяти свободен (память однопортовая). Если
+    такого такта нет, выборка заканчивается после исполнения:
+
+    - структурный конфликт -- порт памяти занят исполнением до конца инструкции
+      (`load`, `store` и т.п.): 1 такт ожидания
+    - короткое исполнение -- инструкция исполняется за 1 такт, выборке нужно 2: 1 такт
+      ожидания
+
+    Выбранная заранее инструкция сбрасывается, и выборка повторяется целиком после
+    исполнения:
+
+    - конфликт управления -- выполненный переход (PC не равен адресу следующей ячейки)
+    - конфликт данных -- инструкция записала в ячейку, которую уже выбрали (код изменяет
+      сам себя)
+
+    Регистры исполняются одной стадией по порядку, поэтому других конфликтов данных нет.
+    Последовательные такты (`sequential_ticks`) -- то, что насчитала бы модель без конвейера.
+    """
+
+    instructions = None
+    "Количество инструкций, включая последнюю (`halt` или `in` на пустом вводе)."
+
+    ticks = None
+    "Такты конвейерной модели."
+
+    sequential_ticks = None
+    "Такты тех же инструкций без конвейера (выборка и исполнение подряд)."
+
+    stalls = None
+    "Такты ожидания выборки по причине: `structural`, `short_execute`."
+
+    flushes = None
+    "Количество сброшенных выборок по причине: `control`, `data`."
+
+    flush_ticks = None
+    "Такты повторной выборки сброшенных инструкций по причине: `control`, `data`."
+
+    prefetched = None
+    "Адрес уже выбранной следующей инструкции или None (в начале и после останова)."
+
+    def __init__(self):
+        self.instructions = 0
+        self.ticks = 0
+        self.sequential_ticks = 0
+        self.stalls = {"structural": 0, "short_execute": 0}
+        self.flushes = {"control": 0, "data": 0}
+        self.flush_ticks = {"control": 0, "data": 0}
+        self.prefetched = None
+
+    def retire(
+        self, pc: int, fetch_pc: int, cycles: tuple[bool, ...], next_pc: int | None, write_addr: int | None
+    ) -> int:
+        """Учесть инструкцию по адресу `pc` и вернуть её стоимость в тактах конвейера.
+
+        `fetch_pc` -- адрес следующей ячейки (её выбирают заранее), `cycles` -- такты
+        исполнения (`execute_cycles`), `next_pc` -- адрес следующей инструкции (None при
+        останове), `write_addr` -- адрес записи в память или None.
+        Стоимость включает выборку самой инструкции, если она не была выбрана заранее,
+        и ожидание выборки следующей.
+        """
+        cost = len(cycles) if self.prefetched == pc else fetch_ticks + len(cycles)
+        self.instructions += 1
+        self.sequential_ticks += fetch_ticks + len(cycles)
+        self.prefetched = None
+        if next_pc is not None:
+            cost += self.prefetch(fetch_pc, cycles, next_pc, write_addr)
+            self.prefetched = next_pc
+        self.ticks += cost
+        return cost
+
+    def prefetch(self, fetch_pc: int, cycles: tuple[bool, ...], next_pc: int, write_addr: int | None) -> int:
+        """Такты после исполнения, нужные, чтобы выбрать инструкцию `next_pc`."""
+        read_cycle = next((cycle for cycle in range(1, len(cycles)) if not cycles[cycle]), None)
+        if next_pc != fetch_pc:
+            return self.flush("control")
+        if write_addr == fetch_pc and read_cycle is not None and read_cycle < len(cycles) - 1:
+            return self.flush("data")
+        if read_cycle is not None:
+            return 0
+        reason = "structural" if len(cycles) > 1 else "short_execute"
+        self.stalls[reason] += 1
+        return 1
+
+    def flush(self, reason: str) -> int:
+        self.flushes[reason] += 1
+        self.flush_ticks[reason] += fetch_ticks
+        return fetch_ticks
+
+    def stats(self) -> dict:
+        return {
+            "instructions": self.instructions,
+            "ticks": self.ticks,
+            "sequential_ticks": self.sequential_ticks,
+            "speedup": self.sequential_ticks / self.ticks if self.ticks else 1.0,
+            "stalls": dict(self.stalls),
+            "flushes": dict(self.flushes),
+            "flush_ticks": dict(self.flush_ticks),
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        stalls = " ".join(f"{reason}: {ticks}" for reason, ticks in self.stalls.items())
+        flushes = " ".join(
+            f"{reason}: {count} ({self.flush_ticks[reason]} ticks)" for reason, count in self.flushes.items()
+        )
+        return (
+            f"pipeline: instructions: {stats['instructions']} ticks: {stats['ticks']} "
+            f"sequential_ticks: {stats['sequential_ticks']} speedup: {stats['speedup']:.3f}\n"
+            f"stall ticks: {stalls}\nflushes: {flushes}"
+        )
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import ast
+from collections import deque
+from typing import Protocol
+
+input_port = 0
+"Номер порта ввода (команда `in`)."
+
+output_port = 1
+"Номер порта вывода по умолчанию."
+
+
+class InputPort(Protocol):
+    def read(self) -> int | None:
+        """Код следующего символа или None, если ввод закончился."""
+
+
+class OutputPort(Protocol):
+    def write(self, codepoint): ...
+
+    def flush(self): ...
+
+
+def codepoint_to_char(codepoint) -> str:
+    try:
+        return chr(codepoint)
+    except (ValueError, OverflowError, TypeError):
+        return "?"
+
+
+def write_string(port: OutputPort | None, read, addr: int, size: int) -> int:
+    """Вывести в `port` строку с длиной (`.word n, ...`) по адресу `addr` (команда `outs`).
+
+    `read` -- чтение ячейки памяти размера `size`, адреса берутся по модулю размера. Если
+    порта нет (None), слова всё равно читаются. Возвращает количество слов строки.
+    """
+    length = max(read(addr % size), 0)
+    for offset in range(1, length + 1):
+        word = read((addr + offset) % size)
+        if port is not None:
+            port.write(word)
+    return length
+
+
+class ListInputPort:
+    """Порт ввода из готового списка символов."""
+
+    tokens = None
+    position = None
+    "Количество прочитанных символов."
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.position = 0
+
+    def read(self) -> int | None:
+        if self.position >= len(self.tokens):
+            return None
+        symbol = self.tokens[self.position]
+        self.position += 1
+        return ord(symbol)
+
+
+class FeedInputPort:
+    """Порт ввода, который пополняют по ходу моделирования (`processor.iter_simulation`).
+
+    Пока ввод не закрыт, чтение из пустого буфера возвращает None и выставляет `starved`:
+    машина остановилась в ожидании ввода, а не в конце ввода.
+    """
+
+    position = None
+    "Количество прочитанных символов."
+
+    closed = None
+    "Ввод закончен: новых символов не будет."
+
+    starved = None
+    "Последнее чтение не получило символа из-за пустого буфера открытого ввода."
+
+    def __init__(self):
+        self.tokens = deque()
+        self.position = 0
+        self.closed = False
+        self.starved = False
+
+    def feed(self, symbols):
+        assert not self.closed, "Input is closed"
+        self.tokens.extend(symbols)
+
+    def close(self):
+        self.closed = True
+
+    def read(self) -> int | None:
+        if not self.tokens:
+            self.starved = not self.closed
+            return None
+        self.position += 1
+        return ord(self.tokens.popleft())
+
+
+class StreamInputPort:
+    """Порт ввода символов из текстового потока (файл, stdin) через буфер ограниченного размера."""
+
+    stream = None
+    buffer_size = None
+    position = None
+    "Количество прочитанных символов."
+
+    def __init__(self, stream, buffer_size: int = 1 << 16):
+        assert buffer_size > 0, "buffer size should be greater than zero"
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.position = 0
+        self._buffer = ""
+        self._index = 0
+
+    def read(self) -> int | None:
+        char = self._next_char()
+        if char is None:
+            return None
+        self.position += 1
+        return ord(char)
+
+    def _next_char(self) -> str | None:
+        if self._index >= len(self._buffer):
+            self._buffer = self.stream.read(self.buffer_size)
+            self._index = 0
+            if not self._buffer:
+                return None
+        char = self._buffer[self._index]
+        self._index += 1
+        return char
+
+
+class TokenStreamInputPort(StreamInputPort):
+    """Порт ввода из потока в формате входных файлов: `['M', 'i', 'n', ...]`.
+
+    Разбирает строковые литералы по мере чтения, не загружая файл целиком.
+    """
+
+    def read(self) -> int | None:
+        quote = self._next_quote()
+        if quote is None:
+            return None
+        chars = [quote]
+        while True:
+            char = self._next_char()
+            assert char is not None, "Unterminated string literal in input"
+            chars.append(char)
+            if char == "\\":
+                chars.append(self._next_char())
+            elif char == quote:
+                break
+        symbol = ast.literal_eval("".join(chars))
+        self.position += 1
+        return ord(symbol)
+
+    def _next_quote(self) -> str | None:
+        """Пропустить разделители до начала следующего литерала."""
+        while True:
+            char = self._next_char()
+            if char is None or char in "'\"":
+                return char
+            assert char in "[], \t\r\n", f"Unexpected character in input: {char!r}"
+
+
+class BufferOutputPort:
+    """Порт вывода в список кодов символов."""
+
+    codepoints = None
+
+    def __init__(self):
+        self.codepoints = []
+
+    def write(self, codepoint):
+        self.codepoints.append(codepoint)
+
+    def flush(self):
+        pass
+
+
+class StreamOutputPort:
+    """Порт вывода в текстовый поток: символы копятся в буфере и сбрасываются пачками."""
+
+    sink = None
+    flush_size = None
+    written = None
+    "Количество выведенных символов."
+
+    def __init__(self, sink, flush_size: int = 1 << 16):
+        assert flush_size > 0, "flush size should be greater than zero"
+        self.sink = sink
+        self.flush_size = flush_size
+        self.written = 0
+        self._chars = []
+
+    def write(self, codepoint):
+        self._chars.append(codepoint_to_char(codepoint))
+        if len(self._chars) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self._chars:
+            self.sink.write("".join(self._chars))
+            self.written += len(self._chars)
+            self._chars = []
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()
@@ -1,10 +1,55 @@
 from __future__ import annotations
 
+import argparse
+import contextlib
 import logging
 import sys
+from collections.abc import Callable, Generator
+from pathlib import Path
 from typing import ClassVar
 
-from opcodes import ALUOpcode, Opcode, Selectors, nullar_instructions, onear_instructions, read_code
+import checkpoint
+import translator
+from cache import Cache
+from debuginfo import DebugInfo, debug_info_path
+from functional import run_functional
+from jit import run_jit
+from loops import Loop, LoopDetector
+from memory import make_memory
+from microcode import microcode
+from objfile import ObjectCode, read_program
+from opcodes import (
+    DIRECT,
+    IMMEDIATE,
+    INDIRECT,
+    ALUOpcode,
+    Opcode,
+    Selectors,
+    fetch_ticks,
+    immediate_ticks,
+    indirect_ticks,
+    opcode_ids,
+    string_word_ticks,
+)
+from peephole import Peephole
+from pipeline import Pipeline, execute_cycles, memory_writes
+from ports import (
+    BufferOutputPort,
+    FeedInputPort,
+    InputPort,
+    ListInputPort,
+    OutputPort,
+    StreamInputPort,
+    StreamOutputPort,
+    TokenStreamInputPort,
+    codepoint_to_char,
+    input_port,
+    output_port,
+)
+from profiler import Profile
+from threaded import run_threaded
+from tracing import TraceRecorder, render, snapshot
+from translation_cache import TranslationCache
 
 
 class HaltError(Exception):
@@ -96,7 +141,7 @@ class DataPath:
     "Размер памяти."
 
     memory = None
-    "Память. Инициализируется NOP'ами."
+    "Память (`memory.Memory`). Инициализируется NOP'ами."
 
     addr = None
     "Регистр адреса. Инициализируется нулём."
@@ -105,7 +150,13 @@ class DataPath:
     "Регистр записи в память. Инициализируется нулём."
 
     ir = None
-    "Регистр инструкции. Инициализируется NOP'ом."
+    "Регистр инструкции (код операции). Инициализируется NOP'ом."
+
+    ir_indirect = None
+    "Признак косвенной адресации инструкции в регистре инструкции."
+
+    ir_immediate = None
+    "Признак непосредственного операнда инструкции в регистре инструкции (операнд -- значение в DR)."
 
     dr = None
     "Регистр данных. Инициализируется нулём."
@@ -122,35 +173,60 @@ class DataPath:
     ac = None
     "Аккумулятор. Инициализируется нулём."
 
-    input_buffer = None
-    "Буфер входных данных. Инициализируется входными данными конструктора."
+    input_ports = None
+    "Порты ввода: номер -> `ports.InputPort`. Команда `in` читает порт `ports.input_port`."
+
+    output_ports = None
+    "Порты вывода: номер -> `ports.OutputPort`. Команда `out` пишет в порт, номер которого лежит в операнде."
 
     output_buffer = None
-    "Буфер выходных символов. Инициализируется пустым массивом"
+    "Буфер выходных символов порта вывода (пустой, если вывод идёт в поток)."
 
     alu = None
     "АЛУ"
 
-    def __init__(self, memory_size: int, input_buffer: list):
+    cache = None
+    "Модель кэша (`cache.Cache`) или None, если память подключена напрямую."
+
+    stall_ticks = None
+    "Дополнительные такты текущей инструкции (ожидание кэша, слова `outs`), ещё не учтённые `ControlUnit`."
+
+    loop_detector = None
+    "Поиск бесконечных циклов (`loops.LoopDetector`) или None. Запись в память идёт через него."
+
+    def __init__(
+        self,
+        memory_size: int,
+        input_buffer: list | InputPort,
+        output: OutputPort | None = None,
+        cache: Cache | None = None,
+    ):
         assert memory_size > 0, "memory size should be greater than zero"
         self.alu = ALU()
         self.memory_size = memory_size
-        self.memory = [{"opcode": Opcode.NOP.value}] * memory_size
+        self.memory = make_memory(memory_size)
         self.addr = 0
         self.to_mem = 0
-        self.ir = {"opcode": Opcode.NOP.value}
+        self.ir = Opcode.NOP
+        self.ir_indirect = False
+        self.ir_immediate = False
         self.dr = 0
         self.pc = 0
         self.sp = 0
         self.ps = {"N": self.alu.n_flag, "Z": self.alu.z_flag}
         self.ac = 0
-        self.input_buffer = input_buffer
-        self.output_buffer = []
-
-    def signal_fill_memory(self, program: list):
-        for mem_cell in program:
-            index = mem_cell["index"]
-            self.memory[index] = mem_cell
+        if not hasattr(input_buffer, "read"):
+            input_buffer = ListInputPort(input_buffer)
+        if output is None:
+            output = BufferOutputPort()
+        self.input_ports = {input_port: input_buffer}
+        self.output_ports = {output_port: output}
+        self.output_buffer = output.codepoints if isinstance(output, BufferOutputPort) else []
+        self.cache = cache
+        self.stall_ticks = 0
+
+    def signal_fill_memory(self, program: list | ObjectCode):
+        self.memory.load(program)
 
     def signal_latch_addr(self):
         self.addr = self.alu.result
@@ -161,12 +237,17 @@ class DataPath:
     def signal_latch_ir(self):
         assert self.addr >= 0, "Address below memory limit"
         assert self.addr <= self.memory_size, "Address above memory limit"
-        self.ir = self.memory[self.addr]
+        self.ir = self.memory.opcode(self.addr)
+        self.ir_indirect = self.memory.is_indirect(self.addr)
+        self.ir_immediate = self.memory.is_immediate(self.addr)
 
     def signal_latch_dr(self):
         assert self.addr >= 0, "Address below memory limit"
         assert self.addr <= self.memory_size, "Address above memory limit"
-        self.dr = self.memory[self.addr]["value"]
+        self.dr = self.memory.read(self.addr)
+        # Выборка инструкции тоже проходит здесь: `instr_fetch` читает ту же ячейку сразу после `signal_latch_ir`.
+        if self.cache is not None:
+            self.stall_ticks += self.cache.access(self.addr % self.memory_size)
 
     def signal_latch_pc(self):
         self.pc = self.alu.result % self.memory_size
@@ -187,32 +268,56 @@ class DataPath:
         if sel == Selectors.FROM_ALU:
             self.ac = self.alu.result
         else:
-            if len(self.input_buffer) == 0:
+            symbol_code = self.input_ports[input_port].read()
+            if symbol_code is None:
                 raise HaltError(Opcode.IN)
-            symbol = self.input_buffer.pop(0)
-            symbol_code = ord(symbol)
             self.ac = symbol_code
-            logging.debug("input: %s", repr(symbol))
+            logging.debug("input: %s", repr(chr(symbol_code)))
+
+    def signal_halt(self):
+        raise HaltError(Opcode.HALT)
 
     def signal_output(self):
-        port_num = self.dr
-        if port_num == 1:
-            symbol = ""
-            try:
-                char = chr(self.ac)
-                symbol += char
-            except ValueError:
-                symbol += "?"
-            logging.debug("output_buffer: %s << %s", repr(codepoints_to_string(self.output_buffer)), repr(symbol))
-            self.output_buffer.append(self.ac)
+        port = self.output_ports.get(self.dr)
+        if port is not None:
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                symbol = codepoint_to_char(self.ac)
+                logging.debug("output_buffer: %s << %s", repr(codepoints_to_string(self.output_buffer)), repr(symbol))
+            port.write(self.ac)
+
+    def signal_output_string(self):
+        """Блочный вывод строки (`outs`): DR -- длина строки по адресу Addr, слова за ней идут в порт из AC.
+
+        Слова читает блок вывода своим счётчиком адреса (Addr и DR не меняются), по
+        `string_word_ticks` тактов на слово; такты добавляются к `stall_ticks`.
+        """
+        port = self.output_ports.get(self.ac)
+        length = max(self.dr, 0)
+        for offset in range(1, length + 1):
+            addr = (self.addr + offset) % self.memory_size
+            if self.cache is not None:
+                self.stall_ticks += self.cache.access(addr)
+            word = self.memory.read(addr)
+            if port is not None:
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    symbol = codepoint_to_char(word)
+                    logging.debug(
+                        "output_buffer: %s << %s", repr(codepoints_to_string(self.output_buffer)), repr(symbol)
+                    )
+                port.write(word)
+        self.stall_ticks += length * string_word_ticks
+
+    def flush_output(self):
+        for port in self.output_ports.values():
+            port.flush()
 
     def signal_wr(self):
-        self.memory[self.addr] = {
-            "index": self.addr,
-            "opcode": Opcode.NOP.value,
-            "value": self.to_mem,
-            "is_indirect": False,
-        }
+        if self.loop_detector is not None:
+            self.loop_detector.write(self.addr, self.to_mem)
+        else:
+            self.memory.write(self.addr, self.to_mem)
+        if self.cache is not None:
+            self.stall_ticks += self.cache.access(self.addr % self.memory_size, write=True)
 
     def signal_execute_alu_op(self, operation, left_sel: Selectors = None, right_sel: Selectors = None):
         src_a = None
@@ -244,6 +349,20 @@ class DataPath:
         self.alu.calc()
 
 
+def compile_microcode(opcode: Opcode, mode: int) -> tuple:
+    """Микропрограмма `microcode.microcode` с сигналами, разрешёнными в методы `DataPath`."""
+    return tuple(
+        (condition, tuple((getattr(DataPath, f"signal_{name}"), args) for name, args in operations))
+        for condition, operations in microcode(opcode, mode)
+    )
+
+
+microcode_rom = {
+    opcode: tuple(compile_microcode(opcode, mode) for mode in (DIRECT, INDIRECT, IMMEDIATE)) for opcode in Opcode
+}
+"ПЗУ микропрограмм: код операции -> микропрограммы по видам адресации. Строится один раз при импорте."
+
+
 class ControlUnit:
     data_path = None
 
@@ -251,14 +370,35 @@ class ControlUnit:
 
     _tick = None
 
-    def __init__(self, program: list, data_path: DataPath):
+    trace = None
+    "Запись снимков состояния (`tracing.TraceRecorder`) или None."
+
+    log_states = None
+    "Выводить ли состояние после каждой инструкции в журнал (уровень DEBUG на момент создания)."
+
+    profile = None
+    "Профиль выполнения (`profiler.Profile`) или None."
+
+    debug_info = None
+    "Отладочная информация (`debuginfo.DebugInfo`) или None. Если задана, журнал состояний указывает место в исходном коде."
+
+    def __init__(
+        self,
+        program: list | ObjectCode,
+        data_path: DataPath,
+        trace: TraceRecorder | None = None,
+        profile: Profile | None = None,
+    ):
         self.instruction_counter = 0
         self.data_path = data_path
         self._tick = 0
+        self.trace = trace
+        self.profile = profile
+        self.log_states = logging.getLogger().isEnabledFor(logging.DEBUG)
         data_path.signal_fill_memory(program)
 
-    def tick(self):
-        self._tick += 1
+    def tick(self, count: int = 1):
+        self._tick += count
 
     def current_tick(self) -> int:
         return self._tick
@@ -275,209 +415,240 @@ class ControlUnit:
         self.tick()
 
     def execute(self):
-        ir, ps = self.data_path.ir, self.data_path.ps
-        opcode, is_indirect = ir["opcode"], ir["is_indirect"]
+        """Исполнение инструкции из IR микропрограммой ПЗУ (`microcode_rom`): микрокоманда за такт."""
+        dp = self.data_path
+        # Вид адресации как индекс строки ПЗУ: DIRECT = 0, INDIRECT = 1, IMMEDIATE = 2.
+        for condition, operations in microcode_rom[dp.ir][dp.ir_indirect + 2 * dp.ir_immediate]:
+            if condition is None or dp.ps[condition[0]] == condition[1]:
+                for signal, args in operations:
+                    signal(dp, *args)
+            self._tick += 1
 
-        if opcode == Opcode.NOP:
-            self.tick()
-            return
+    def decode_and_execute_instruction(self):
+        dp = self.data_path
+        pc, start_tick, n, z, operand = dp.pc, self._tick, dp.ps["N"], dp.ps["Z"], None
+        try:
+            self.instr_fetch()
+            operand = dp.dr
+            self.execute()
+        finally:
+            if dp.stall_ticks:
+                self.tick(dp.stall_ticks)
+                dp.stall_ticks = 0
+            if self.profile is not None and operand is not None:
+                pointer = operand if dp.ir_indirect else None
+                addr = None if dp.ir_immediate and dp.ir in immediate_ticks else dp.addr
+                self.profile.record(pc, opcode_ids[dp.ir], pointer, addr, self._tick - start_tick, n, z)
+        dp.signal_latch_ps_flags()
+
+        if self.trace is not None:
+            self.trace.record(self)
+        if self.log_states:
+            if self.debug_info is not None:
+                logging.debug("%s | %s", self, self.debug_info.location(pc))
+            else:
+                logging.debug("%s", self)
 
-        if is_indirect:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.tick()
-
-        if opcode in nullar_instructions:
-            self.execute_nullar(opcode)
-        elif opcode in onear_instructions:
-            self.execute_onear(opcode)
-        else:
-            self.execute_branch(opcode, ps)
-
-    def execute_nullar(self, opcode: Opcode):
-        if opcode == Opcode.INC:
-            self.data_path.signal_execute_alu_op(ALUOpcode.INC_A, left_sel=Selectors.FROM_AC)
-            self.data_path.signal_latch_ac(Selectors.FROM_ALU)
-            self.tick()
-        elif opcode == Opcode.DEC:
-            self.data_path.signal_execute_alu_op(ALUOpcode.DEC_A, left_sel=Selectors.FROM_AC)
-            self.data_path.signal_latch_ac(Selectors.FROM_ALU)
-            self.tick()
-        elif opcode == Opcode.HALT:
-            raise HaltError(Opcode.HALT)
-        elif opcode == Opcode.PUSH:
-            self.data_path.signal_execute_alu_op(ALUOpcode.DEC_B, right_sel=Selectors.FROM_SP)
-            self.data_path.signal_latch_sp()
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_A, left_sel=Selectors.FROM_AC)
-            self.data_path.signal_latch_to_mem()
-            self.data_path.signal_wr()
-            self.tick()
-        elif opcode == Opcode.POP:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_SP)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_execute_alu_op(ALUOpcode.INC_B, right_sel=Selectors.FROM_SP)
-            self.data_path.signal_latch_sp()
-            self.data_path.signal_latch_dr()
-            self.tick()
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_ac(Selectors.FROM_ALU)
-            self.tick()
-
-    def execute_onear(self, opcode: Opcode):
-        if opcode == Opcode.LOAD:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_ac(Selectors.FROM_ALU)
-            self.tick()
-        elif opcode == Opcode.STORE:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_A, left_sel=Selectors.FROM_AC)
-            self.data_path.signal_latch_to_mem()
-            self.data_path.signal_wr()
-            self.tick()
-        elif opcode == Opcode.ADD:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.data_path.signal_execute_alu_op(ALUOpcode.ADD, left_sel=Selectors.FROM_AC, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_ac(Selectors.FROM_ALU)
-            self.tick()
-        elif opcode == Opcode.SUB:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.data_path.signal_execute_alu_op(ALUOpcode.SUB, left_sel=Selectors.FROM_AC, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_ac(Selectors.FROM_ALU)
-            self.tick()
-        elif opcode == Opcode.MUL:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.data_path.signal_execute_alu_op(ALUOpcode.MUL, left_sel=Selectors.FROM_AC, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_ac(Selectors.FROM_ALU)
-            self.tick()
-        elif opcode == Opcode.DIV:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.data_path.signal_execute_alu_op(ALUOpcode.DIV, left_sel=Selectors.FROM_AC, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_ac(Selectors.FROM_ALU)
-            self.tick()
-        elif opcode == Opcode.CMP:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.data_path.signal_execute_alu_op(ALUOpcode.CMP, left_sel=Selectors.FROM_AC, right_sel=Selectors.FROM_DR)
-            self.tick()
-        elif opcode == Opcode.TEST:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.data_path.signal_execute_alu_op(
-                ALUOpcode.TEST, left_sel=Selectors.FROM_AC, right_sel=Selectors.FROM_DR
-            )
-            self.tick()
-        elif opcode == Opcode.OUT:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_addr()
-            self.tick()
-            self.data_path.signal_latch_dr()
-            self.data_path.signal_output()
-            self.tick()
-        elif opcode == Opcode.IN:
-            self.data_path.signal_latch_ac(Selectors.FROM_INPUT)
-            self.tick()
-
-    def execute_branch(self, opcode: Opcode, ps: dict):
-        if opcode == Opcode.JG:
-            if not ps["N"]:
-                self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-                self.data_path.signal_latch_pc()
-
-        elif opcode == Opcode.JZ:
-            if ps["Z"]:
-                self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-                self.data_path.signal_latch_pc()
-
-        elif opcode == Opcode.JNZ:
-            if not ps["Z"]:
-                self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-                self.data_path.signal_latch_pc()
-
-        elif opcode == Opcode.JMP:
-            self.data_path.signal_execute_alu_op(ALUOpcode.SKIP_B, right_sel=Selectors.FROM_DR)
-            self.data_path.signal_latch_pc()
+    def __repr__(self) -> str:
+        return render(snapshot(self))
 
-        self.tick()
 
-    def decode_and_execute_instruction(self):
-        self.instr_fetch()
-        self.execute()
-        self.data_path.signal_latch_ps_flags()
+class PipelinedControlUnit(ControlUnit):
+    """Устройство управления с конвейером: выборка следующей инструкции идёт во время исполнения текущей.
 
-        logging.debug("%s", self)
+    Инструкции исполняются теми же сигналами, что и в `ControlUnit`, меняется только
+    счёт тактов: стоимость инструкции считает `pipeline.Pipeline` по её тактам исполнения,
+    переходу и записи в память. Статистика ожиданий и сбросов остаётся в `pipeline`.
+    """
 
-    def __repr__(self) -> str:
-        return "TICK: {:4} | AC: {:4} | PC: {:3} | IR: {:5} | DR: {:7} | SP: {:3} | Addr: {:3} | ToMem: {:7} | N: {:1} | Z: {:1} | mem[Addr]: {:7}".format(
-            self.current_tick(),
-            self.data_path.ac,
-            self.data_path.pc,
-            self.data_path.ir["opcode"],
-            self.data_path.dr,
-            self.data_path.sp,
-            self.data_path.addr,
-            self.data_path.to_mem,
-            (1 if self.data_path.ps["N"] else 0),
-            (1 if self.data_path.ps["Z"] else 0),
-            self.data_path.memory[self.data_path.addr]["value"],
-        )
+    pipeline = None
+    "Временная модель конвейера (`pipeline.Pipeline`)."
 
+    def __init__(
+        self,
+        program: list | ObjectCode,
+        data_path: DataPath,
+        trace: TraceRecorder | None = None,
+        profile: Profile | None = None,
+        pipeline: Pipeline | None = None,
+    ):
+        super().__init__(program, data_path, trace, profile)
+        self.pipeline = pipeline if pipeline is not None else Pipeline()
+        self.fetch_tick = 0
 
-def codepoints_to_string(codepoints):
-    result_string = ""
-    for cp in codepoints:
+    def instr_fetch(self):
+        self.fetch_tick = self._tick
+        super().instr_fetch()
+
+    def execute(self):
+        dp = self.data_path
+        pc, execute_tick = (dp.pc - 1) % dp.memory_size, self._tick
+        halted = True
         try:
-            char = chr(cp)
-            result_string += char
-        except ValueError:
-            result_string += "?"
-    return result_string
+            super().execute()
+            halted = False
+        finally:
+            mode = INDIRECT if dp.ir_indirect else IMMEDIATE if dp.ir_immediate else DIRECT
+            # При останове исполнение обрывается раньше: учитываются только отработанные такты.
+            cycles = execute_cycles(dp.ir, mode)[: self._tick - execute_tick]
+            write_addr = dp.addr % dp.memory_size if dp.ir in memory_writes and not halted else None
+            next_pc = None if halted else dp.pc
+            cost = self.pipeline.retire(pc, (pc + 1) % dp.memory_size, cycles, next_pc, write_addr)
+            self._tick = self.fetch_tick + cost
+
+
+def codepoints_to_string(codepoints):
+    return "".join(codepoint_to_char(cp) for cp in codepoints)
 
 
 def codepoints_to_numbers_array(codepoints):
     return [cp for cp in codepoints]
 
 
-def simulation(code: list, input_tokens: list, memory_size: int, limit: int) -> tuple[str, list, int, int]:
-    data_path = DataPath(memory_size, input_tokens)
-    control_unit = ControlUnit(code, data_path)
-    instr_counter = 0
-
+def run_signal(control_unit: ControlUnit, limit: int) -> bool:
+    """Потактовое моделирование через сигналы DataPath. Возвращает True при останове."""
+    instr_counter = control_unit.instruction_counter
+    data_path = control_unit.data_path
+    detector = data_path.loop_detector
+    halted = False
     try:
         while instr_counter < limit:
+            pc = data_path.pc
             control_unit.decode_and_execute_instruction()
             instr_counter += 1
+            if (
+                detector is not None
+                and data_path.pc <= pc
+                and detector.back_edge(
+                    pc, data_path.pc, data_path.ac, data_path.sp, data_path.ps["N"], data_path.ps["Z"], instr_counter
+                )
+            ):
+                break
     except HaltError:
-        pass
+        halted = True
+    control_unit.instruction_counter = instr_counter
+    return halted
+
 
-    if instr_counter >= limit:
+engines = {
+    "signal": run_signal,
+    "functional": run_functional,
+    "threaded": run_threaded,
+    "jit": run_jit,
+}
+"Движки моделирования: имя -> функция `run(control_unit, limit) -> halted`."
+
+
+def warn_stopped(loop: Loop | None, pc: int, debug_info: DebugInfo | None):
+    """Предупреждение о бесконечном цикле `loop` или, если его нет, о превышении лимита на адресе `pc`."""
+    if loop is not None:
+        if debug_info is None:
+            logging.warning("Infinite loop detected: %s", loop)
+        else:
+            first, last = debug_info.location(loop.first_pc), debug_info.location(loop.last_pc)
+            logging.warning("Infinite loop detected: %s, from %s to %s", loop, first, last)
+    elif debug_info is None:
         logging.warning("Limit exceeded!")
+    else:
+        logging.warning("Limit exceeded! pc: %s", debug_info.location(pc))
+
+
+def simulation(
+    code: list | ObjectCode,
+    input_tokens: list | InputPort,
+    memory_size: int,
+    limit: int,
+    engine: str = "signal",
+    trace: TraceRecorder | None = None,
+    output: OutputPort | None = None,
+    cache: Cache | None = None,
+    profile: Profile | None = None,
+    resume: dict | None = None,
+    checkpoint_file: str | None = None,
+    checkpoint_every: int = 0,
+    loop_detector: LoopDetector | None = None,
+    pipeline: Pipeline | None = None,
+    stop: Callable[[], bool] | None = None,
+    stop_every: int = 10000,
+    debug_info: DebugInfo | None = None,
+) -> tuple[str, list, int, int]:
+    """Моделирование программы.
+
+    Если задан порт `output`, вывод идёт в него, а не в возвращаемый буфер. Если задан
+    `cache`, задержки кэша добавляются к тактам, статистика остаётся в объекте кэша.
+    Если задан `profile`, в него записываются счётчики выполнения.
+
+    Если задан снимок `resume` (`checkpoint.load`), моделирование продолжается с него:
+    `code` и `memory_size` не используются, `limit` -- общий лимит с учётом инструкций
+    до снимка. Если задан `checkpoint_file`, снимок записывается в него каждые
+    `checkpoint_every` инструкций (0 -- не записывать по ходу) и по достижении лимита.
+
+    Если задан `loop_detector`, моделирование останавливается при повторе состояния
+    машины, найденный цикл остаётся в `loop_detector.loop`.
+
+    Если задан `pipeline`, такты считает конвейерная модель (`PipelinedControlUnit`),
+    статистика ожиданий и сбросов остаётся в объекте.
+
+    Если задан `stop`, моделирование идёт порциями по `stop_every` инструкций: после
+    каждой порции вывод сбрасывается в порт, и если `stop()` возвращает True, лимит
+    опускается до числа выполненных инструкций (моделирование заканчивается как по лимиту).
+
+    Если задана отладочная информация `debug_info`, журнал и предупреждения о лимите и
+    бесконечном цикле указывают место в исходном коде (`loop+3 (hello.ed:18)`).
+    """
+    assert engine in engines, f"Unknown engine '{engine}'"
+    assert trace is None or engine == "signal", "Trace is recorded by the signal engine only"
+    assert cache is None or engine == "signal", "Cache is modelled by the signal engine only"
+    assert profile is None or engine in {"signal", "functional"}, "Profile is recorded by signal and functional engines"
+    assert loop_detector is None or engine in {"signal", "functional"}, (
+        "Loops are detected by signal and functional engines"
+    )
+    assert pipeline is None or engine == "signal", "Pipeline is modelled by the signal engine only"
+    assert checkpoint_every >= 0, "checkpoint interval should not be negative"
+    assert checkpoint_every == 0 or checkpoint_file is not None, "Checkpoint interval requires a checkpoint file"
+    assert stop is None or stop_every > 0, "stop interval should be greater than zero"
+    assert stop is None or checkpoint_every == 0, "Stop callback and checkpoint interval are exclusive"
+    if resume is not None:
+        code, memory_size = [], resume["memory_size"]
+    data_path = DataPath(memory_size, input_tokens, output, cache)
+    if pipeline is not None:
+        control_unit = PipelinedControlUnit(code, data_path, trace, profile, pipeline)
+    else:
+        control_unit = ControlUnit(code, data_path, trace, profile)
+    control_unit.debug_info = debug_info
+    if resume is not None:
+        checkpoint.restore(control_unit, resume)
+    if loop_detector is not None:
+        loop_detector.attach(data_path)
+        data_path.loop_detector = loop_detector
+
+    run = engines[engine]
+
+    def stopped(halted: bool) -> bool:
+        return halted or (loop_detector is not None and loop_detector.loop is not None)
+
+    slice_size = checkpoint_every if stop is None else stop_every
+    if slice_size > 0:
+        halted = False
+        while not stopped(halted) and control_unit.instruction_counter < limit:
+            halted = run(control_unit, min(limit, control_unit.instruction_counter + slice_size))
+            if not stopped(halted):
+                data_path.flush_output()
+                if checkpoint_every > 0:
+                    checkpoint.save(checkpoint_file, checkpoint.capture(control_unit))
+                if stop is not None and stop():
+                    limit = control_unit.instruction_counter
+    else:
+        halted = run(control_unit, limit)
+        if checkpoint_file is not None and not stopped(halted):
+            data_path.flush_output()
+            checkpoint.save(checkpoint_file, checkpoint.capture(control_unit))
+    data_path.flush_output()
+
+    instr_counter = control_unit.instruction_counter
+    loop = loop_detector.loop if loop_detector is not None else None
+    if loop is not None or instr_counter >= limit:
+        warn_stopped(loop, data_path.pc, debug_info)
     logging.info("output_buffer(str): %s", repr(codepoints_to_string(data_path.output_buffer)))
     logging.info("output_buffer(num): %s", repr(codepoints_to_numbers_array(data_path.output_buffer)))
     symbols = codepoints_to_string(data_path.output_buffer)
@@ -485,6 +656,103 @@ def simulation(code: list, input_tokens: list, memory_size: int, limit: int) ->
     return symbols, numbers, instr_counter, control_unit.current_tick()
 
 
+class SimulationEvent:
+    """Событие пошагового моделирования (`iter_simulation`)."""
+
+    kind = None
+    "Вид события: `output`, `input`, `halt`, `limit` или `loop`."
+
+    codepoints = None
+    text = None
+    "Выведенные коды символов и они же строкой (для `output`)."
+
+    loop = None
+    "Найденный цикл (для `loop`)."
+
+    instruction_counter = None
+    ticks = None
+    "Счётчики инструкций и тактов на момент события."
+
+    def __init__(self, kind: str, instruction_counter: int, ticks: int, codepoints: list | None = None, loop=None):
+        self.kind = kind
+        self.instruction_counter = instruction_counter
+        self.ticks = ticks
+        self.codepoints = codepoints
+        self.text = codepoints_to_string(codepoints) if codepoints is not None else None
+        self.loop = loop
+
+    def __repr__(self) -> str:
+        details = f" {self.text!r}" if self.text is not None else f" {self.loop}" if self.loop is not None else ""
+        return f"<{self.kind}{details} instr: {self.instruction_counter} ticks: {self.ticks}>"
+
+
+def iter_simulation(
+    code: list | ObjectCode,
+    memory_size: int,
+    limit: int,
+    engine: str = "signal",
+    input_tokens: list | InputPort | None = None,
+    slice_size: int = 1000,
+    loop_detector: LoopDetector | None = None,
+) -> Generator[SimulationEvent, str | None, None]:
+    """Пошаговое моделирование: генератор событий по мере работы программы.
+
+    Программа выполняется порциями по `slice_size` инструкций; после порции, в которой был
+    вывод, выдаётся событие `output`. Генератор можно бросить в любой момент (остаток
+    программы не моделируется) и чередовать несколько машин в одном потоке.
+
+    Если `input_tokens` не задан, ввод подаётся по ходу: когда программа читает пустой
+    буфер, выдаётся событие `input`, символы передаются через `send(text)` (на любом
+    событии). `send(None)` (или просто `next`) на событии `input` закрывает ввод, и `in`
+    останавливает машину, как в конце входного файла. Ожидание ввода в тактах не учитывается:
+    счётчики и вывод совпадают с `simulation` на всём вводе сразу.
+
+    Последнее событие -- `halt`, `limit` или `loop` (найден бесконечный цикл, см. `simulation`).
+    """
+    assert engine in engines, f"Unknown engine '{engine}'"
+    assert slice_size > 0, "slice size should be greater than zero"
+    assert loop_detector is None or engine in {"signal", "functional"}, (
+        "Loops are detected by signal and functional engines"
+    )
+    feed = FeedInputPort() if input_tokens is None else None
+    data_path = DataPath(memory_size, feed if feed is not None else input_tokens)
+    control_unit = ControlUnit(code, data_path)
+    if loop_detector is not None:
+        loop_detector.attach(data_path)
+        data_path.loop_detector = loop_detector
+    run, output = engines[engine], data_path.output_buffer
+
+    def event(kind: str, **details) -> SimulationEvent:
+        return SimulationEvent(kind, control_unit.instruction_counter, control_unit.current_tick(), **details)
+
+    while True:
+        halted = run(control_unit, min(limit, control_unit.instruction_counter + slice_size))
+        if output:
+            symbols = yield event("output", codepoints=list(output))
+            output.clear()
+            if symbols is not None:
+                assert feed is not None, "Input is given up front"
+                feed.feed(symbols)
+        if halted and feed is not None and feed.starved:
+            # `in` прочитал пустой буфер: откатываем его выборку (и чтение указателя), чтобы выполнить заново с новым вводом.
+            feed.starved = False
+            data_path.pc = (data_path.pc - 1) % data_path.memory_size
+            _, _, mode = data_path.memory.decode(data_path.pc)
+            control_unit.tick(-fetch_ticks - (indirect_ticks if mode == INDIRECT else 0))
+            symbols = yield event("input")
+            if symbols is None:
+                feed.close()
+            else:
+                feed.feed(symbols)
+            continue
+        if loop_detector is not None and loop_detector.loop is not None:
+            yield event("loop", loop=loop_detector.loop)
+            return
+        if halted or control_unit.instruction_counter >= limit:
+            yield event("halt" if halted else "limit")
+            return
+
+
 def parse_to_tokens(input_file: str) -> list:
     tokens = []
     with open(input_file, encoding="utf-8") as file:
@@ -500,30 +768,170 @@ def parse_to_tokens(input_file: str) -> list:
     return tokens
 
 
-def main(code_file: str, input_file: str):
-    code = read_code(code_file)
-    input_token = []
-    if input_file != "":
-        input_token = parse_to_tokens(input_file)
-
-    output, numbers, instr_counter, ticks = simulation(
-        code,
-        input_tokens=input_token,
-        memory_size=200,
-        limit=5000,
-    )
+def open_input(input_file: str, stack: contextlib.ExitStack, raw_input: bool = False) -> InputPort:
+    """Порт ввода из файла (`-` -- stdin) в формате входных файлов или, при `raw_input`, как есть."""
+    if input_file == "":
+        return ListInputPort([])
+    stream = sys.stdin if input_file == "-" else stack.enter_context(open(input_file, encoding="utf-8"))
+    return StreamInputPort(stream) if raw_input else TokenStreamInputPort(stream)
+
+
+def load_program(
+    code_file: str, translation_cache: TranslationCache | None = None, optimize: bool = False
+) -> list | ObjectCode:
+    """Машинный код из файла. Исходный код (`.ed`) транслируется, через кэш трансляции, если он задан.
+
+    При `optimize` исходный код транслируется с peephole-оптимизацией (кэш должен быть создан с тем же признаком).
+    """
+    if Path(code_file).suffix != ".ed":
+        return read_program(code_file)
+    if translation_cache is not None:
+        assert translation_cache.optimize == optimize, "Translation cache optimization flag does not match"
+        return translation_cache.translate(code_file)[0]
+    return translator.translate(code_file, Peephole() if optimize else None)[0]
+
+
+def load_debug_info(code_file: str, optimize: bool = False) -> DebugInfo:
+    """Отладочная информация программы: исходный код (`.ed`) транслируется, для машинного кода читается `<code_file>.dbg`."""
+    if Path(code_file).suffix == ".ed":
+        return translator.translate_with_debug_info(code_file, Peephole() if optimize else None)[2]
+    return DebugInfo.load_json(debug_info_path(code_file))
+
+
+def main(
+    code_file: str,
+    input_file: str,
+    engine: str = "signal",
+    trace_size: int = 0,
+    raw_input: bool = False,
+    stream_output: bool = False,
+    memory_size: int = 200,
+    limit: int = 5000,
+    cache_spec: str | None = None,
+    translation_cache: TranslationCache | None = None,
+    profile_file: str | None = None,
+    checkpoint_file: str | None = None,
+    checkpoint_every: int = 0,
+    resume_file: str | None = None,
+    detect_loops: bool = False,
+    optimize: bool = False,
+    pipelined: bool = False,
+    debug: bool = False,
+):
+    # При продолжении со снимка память (вместе с программой) берётся из снимка.
+    resume = checkpoint.load(resume_file) if resume_file is not None else None
+    code = load_program(code_file, translation_cache, optimize) if resume is None else []
+    memory_size = resume["memory_size"] if resume is not None else memory_size
+    trace = TraceRecorder(trace_size) if trace_size > 0 else None
+    cache = Cache.from_spec(cache_spec) if cache_spec is not None else None
+    profile = Profile(memory_size) if profile_file is not None else None
+    pipeline = Pipeline() if pipelined else None
+    debug_info = load_debug_info(code_file, optimize) if debug else None
+
+    with contextlib.ExitStack() as stack:
+        if isinstance(code, ObjectCode):
+            stack.callback(code.close)
+        output, numbers, instr_counter, ticks = simulation(
+            code,
+            input_tokens=open_input(input_file, stack, raw_input),
+            memory_size=memory_size,
+            limit=limit,
+            engine=engine,
+            trace=trace,
+            output=StreamOutputPort(sys.stdout) if stream_output else None,
+            cache=cache,
+            profile=profile,
+            resume=resume,
+            checkpoint_file=checkpoint_file,
+            checkpoint_every=checkpoint_every,
+            loop_detector=LoopDetector() if detect_loops else None,
+            pipeline=pipeline,
+            debug_info=debug_info,
+        )
 
-    print(output)
-    print(numbers)
+    if stream_output:
+        print()
+    else:
+        print(output)
+        print(numbers)
     print("instr_counter: ", instr_counter, "ticks:", ticks)
+    if cache is not None:
+        print(cache.report())
+    if pipeline is not None:
+        print(pipeline.report())
+    if trace is not None:
+        print("\n".join(trace.render_lines()), file=sys.stderr)
+    if profile is not None:
+        profile.dump_json(profile_file)
+        print(profile.report(debug_info=debug_info), file=sys.stderr)
 
 
 if __name__ == "__main__":
-    logging.getLogger().setLevel(logging.DEBUG)
-    if len(sys.argv) == 3:
-        _, code_file, input_file = sys.argv
-        main(code_file, input_file)
-    elif len(sys.argv) == 2:
-        main(sys.argv[1], "")
-    else:
-        print("Wrong arguments: processor.py <code_file> <input_file?>")
+    parser = argparse.ArgumentParser(description="Модель процессора")
+    parser.add_argument("code_file")
+    parser.add_argument("input_file", nargs="?", default="")
+    parser.add_argument("--engine", choices=engines.keys(), default="signal", help="движок моделирования")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING"], default="WARNING", help="уровень журнала")
+    parser.add_argument(
+        "--trace", type=int, default=0, metavar="N", help="вывести в stderr состояния после последних N инструкций"
+    )
+    parser.add_argument("--raw-input", action="store_true", help="читать входной файл как текст, посимвольно")
+    parser.add_argument("--stream-output", action="store_true", help="выводить символы в stdout по мере работы")
+    parser.add_argument(
+        "--memory-size", type=lambda text: int(text, 0), default=200, help="размер памяти в ячейках (до 2**32 и больше)"
+    )
+    parser.add_argument("--limit", type=int, default=5000, help="лимит количества инструкций")
+    parser.add_argument(
+        "--cache",
+        metavar="SPEC",
+        help="моделировать кэш, например `lines=16,line_size=4,ways=2,replacement=lru,write_policy=back`",
+    )
+    parser.add_argument(
+        "--translation-cache", metavar="DIR", help="каталог кэша трансляции для `.ed` (по умолчанию ~/.cache/csa_lab3)"
+    )
+    parser.add_argument("--no-translation-cache", action="store_true", help="транслировать `.ed` без кэша")
+    parser.add_argument(
+        "--profile", metavar="FILE", help="записать профиль выполнения в FILE (JSON), отчёт вывести в stderr"
+    )
+    parser.add_argument("--checkpoint", metavar="FILE", help="записать снимок состояния в FILE по достижении лимита")
+    parser.add_argument(
+        "--checkpoint-every", type=int, default=0, metavar="N", help="записывать снимок каждые N инструкций"
+    )
+    parser.add_argument(
+        "--resume", metavar="FILE", help="продолжить моделирование из снимка (`code_file` не читается, лимит общий)"
+    )
+    parser.add_argument(
+        "--detect-loops", action="store_true", help="остановиться при повторе состояния машины (бесконечный цикл)"
+    )
+    parser.add_argument("-O", "--optimize", action="store_true", help="peephole-оптимизация при трансляции `.ed`")
+    parser.add_argument(
+        "--pipeline", action="store_true", help="конвейерная модель: выборка следующей инструкции во время исполнения"
+    )
+    parser.add_argument(
+        "-g",
+        "--debug-info",
+        action="store_true",
+        help="указывать места в исходном коде (`.ed` или отладочная информация `<code_file>.dbg` от `translator.py -g`)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+    main(
+        args.code_file,
+        args.input_file,
+        args.engine,
+        args.trace,
+        args.raw_input,
+        args.stream_output,
+        args.memory_size,
+        args.limit,
+        args.cache,
+        None if args.no_translation_cache else TranslationCache(args.translation_cache, optimize=args.optimize),
+        args.profile,
+        args.checkpoint,
+        args.checkpoint_every,
+        args.resume,
+        args.detect_loops,
+        args.optimize,
+        args.pipeline,
+        args.debug_info,
+    )
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import json
+from array import array
+
+from debuginfo import DebugInfo
+from memory import paged_memory_threshold
+from opcodes import Opcode, opcode_ids, opcode_list
+
+operand_reads = {
+    opcode_ids[opcode]
+    for opcode in [
+        Opcode.LOAD,
+        Opcode.ADD,
+        Opcode.SUB,
+        Opcode.MUL,
+        Opcode.DIV,
+        Opcode.CMP,
+        Opcode.TEST,
+        Opcode.OUT,
+        Opcode.OUTS,
+        Opcode.POP,
+    ]
+}
+"Инструкции, читающие ячейку по адресу операнда (для `pop` -- по SP)."
+
+operand_writes = {opcode_ids[Opcode.STORE], opcode_ids[Opcode.PUSH]}
+"Инструкции, пишущие в ячейку по адресу операнда (для `push` -- по SP)."
+
+branch_conditions = {
+    opcode_ids[Opcode.JG]: lambda n, z: not n,
+    opcode_ids[Opcode.JZ]: lambda n, z: z,
+    opcode_ids[Opcode.JNZ]: lambda n, z: not z,
+    opcode_ids[Opcode.JMP]: lambda n, z: True,
+}
+"Условия переходов по флагам N и Z."
+
+NOP_ID = opcode_ids[Opcode.NOP]
+
+
+class _CounterDict(dict):
+    """Разреженный счётчик по адресам для постраничной памяти."""
+
+    def __missing__(self, key):
+        return 0
+
+
+def counters(size: int):
+    """Счётчики по адресам: массив для памяти обычного размера, словарь для постраничной."""
+    if size > paged_memory_threshold:
+        return _CounterDict()
+    return array("Q", [0]) * size
+
+
+def nonzero(counter) -> dict:
+    if isinstance(counter, dict):
+        return {index: count for index, count in sorted(counter.items()) if count}
+    return {index: count for index, count in enumerate(counter) if count}
+
+
+class Profile:
+    """Профиль выполнения программы.
+
+    Счётчики -- массивы, индексированные идентификатором кода операции или адресом,
+    поэтому запись одной инструкции -- несколько инкрементов. Учитываются все выбранные
+    инструкции, включая последнюю (`halt` или `in` на пустом вводе), поэтому сумма тактов
+    по кодам операций равна числу тактов моделирования.
+    """
+
+    memory_size = None
+
+    instructions = None
+    "Количество выполненных инструкций по идентификатору кода операции."
+
+    ticks = None
+    "Такты по идентификатору кода операции."
+
+    pcs = None
+    "Количество выполнений по адресу инструкции."
+
+    reads = None
+    "Чтения данных по адресу (операнды, указатели косвенной адресации, `pop`)."
+
+    writes = None
+    "Записи по адресу (`store`, `push`)."
+
+    taken = None
+    "Выполненные переходы по адресу инструкции перехода."
+
+    not_taken = None
+    "Невыполненные переходы по адресу инструкции перехода."
+
+    def __init__(self, memory_size: int):
+        self.memory_size = memory_size
+        self.instructions = array("Q", [0]) * len(opcode_list)
+        self.ticks = array("Q", [0]) * len(opcode_list)
+        self.pcs = counters(memory_size)
+        self.reads = counters(memory_size)
+        self.writes = counters(memory_size)
+        self.taken = counters(memory_size)
+        self.not_taken = counters(memory_size)
+
+    def record(self, pc: int, opcode_id: int, pointer: int | None, addr: int | None, ticks: int, n: bool, z: bool):
+        """Учесть инструкцию по адресу `pc`.
+
+        `pointer` -- адрес указателя при косвенной адресации, `addr` -- адрес обращения
+        к данным (операнд или SP; None, если операнд непосредственный), `ticks` -- такты
+        инструкции, `n`/`z` -- флаги до её выполнения.
+        """
+        size = self.memory_size
+        self.instructions[opcode_id] += 1
+        self.ticks[opcode_id] += ticks
+        self.pcs[pc] += 1
+        if pointer is not None and opcode_id != NOP_ID:
+            self.reads[pointer % size] += 1
+        if opcode_id in operand_reads:
+            if addr is not None:
+                self.reads[addr % size] += 1
+        elif opcode_id in operand_writes:
+            self.writes[addr % size] += 1
+        else:
+            condition = branch_conditions.get(opcode_id)
+            if condition is not None:
+                if condition(n, z):
+                    self.taken[pc] += 1
+                else:
+                    self.not_taken[pc] += 1
+
+    def to_dict(self) -> dict:
+        taken, not_taken = nonzero(self.taken), nonzero(self.not_taken)
+        return {
+            "opcodes": {
+                str(opcode): {"count": self.instructions[index], "ticks": self.ticks[index]}
+                for index, opcode in enumerate(opcode_list)
+                if self.instructions[index]
+            },
+            "pcs": nonzero(self.pcs),
+            "reads": nonzero(self.reads),
+            "writes": nonzero(self.writes),
+            "branches": {
+                pc: {"taken": taken.get(pc, 0), "not_taken": not_taken.get(pc, 0)}
+                for pc in sorted(taken.keys() | not_taken.keys())
+            },
+        }
+
+    def dump_json(self, filename: str):
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def report(self, top: int = 10, debug_info: DebugInfo | None = None) -> str:
+        """Текстовый отчёт: коды операций по тактам, горячие адреса, обращения к памяти, переходы.
+
+        Если задана отладочная информация `debug_info`, у адресов указаны места в исходном коде.
+        """
+
+        def where(addr: int) -> str:
+            location = str(addr) if debug_info is None else debug_info.location(addr)
+            return "" if location == str(addr) else f"  {location}"
+
+        profile = self.to_dict()
+        total = sum(self.ticks) or 1
+        lines = ["opcode     count      ticks   share"]
+        for opcode, counts in sorted(profile["opcodes"].items(), key=lambda item: -item[1]["ticks"]):
+            lines.append(f"{opcode:<6} {counts['count']:>9} {counts['ticks']:>10} {counts['ticks'] / total:>6.1%}")
+        for title, counter in [("pc", profile["pcs"]), ("read", profile["reads"]), ("write", profile["writes"])]:
+            lines.append(f"top {title} addresses:")
+            for addr, count in sorted(counter.items(), key=lambda item: -item[1])[:top]:
+                lines.append(f"  {addr:>6} {count:>9}{where(addr)}")
+        lines.append("branches (pc: taken / not taken):")
+        for pc, counts in sorted(profile["branches"].items(), key=lambda item: -sum(item[1].values()))[:top]:
+            lines.append(f"  {pc:>6} {counts['taken']:>9} / {counts['not_taken']}{where(pc)}")
+        return "\n".join(lines)
@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import processor
+import translator
+from batch import init_worker
+from loops import LoopDetector
+from ports import ListInputPort, StreamOutputPort
+
+
+@functools.lru_cache(maxsize=64)
+def translate_text(text: str) -> list:
+    """Машинный код исходного кода из текста. Процесс помнит последние программы и не транслирует их повторно."""
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / "source.ed"
+        source.write_text(text, encoding="utf-8")
+        code, _ = translator.translate(str(source))
+    return code
+
+
+class QueueSink:
+    """Приёмник `StreamOutputPort`: вывод запроса уходит в очередь событий сервера."""
+
+    def __init__(self, events, ticket: int):
+        self.events = events
+        self.ticket = ticket
+
+    def write(self, text: str):
+        self.events.put(("output", self.ticket, text))
+
+
+def run_request(ticket: int, request: dict, events, cancelled) -> None:
+    """Выполнить запрос в процессе пула, передавая вывод и итог в очередь `events`.
+
+    Таймаут отсчитывается от начала выполнения. Отмена (`cancelled[ticket]`) и таймаут
+    проверяются каждые `stop_every` инструкций и опускают лимит `simulation` до числа
+    выполненных инструкций.
+    """
+    reason = None
+    deadline = time.monotonic() + request["timeout"] if request.get("timeout") else None
+
+    def stop() -> bool:
+        nonlocal reason
+        if cancelled.get(ticket):
+            reason = "cancelled"
+        elif deadline is not None and time.monotonic() >= deadline:
+            reason = "timeout"
+        return reason is not None
+
+    try:
+        if stop():
+            result = {"status": reason, "instr_counter": 0, "ticks": 0}
+        else:
+            result = simulate_request(ticket, request, events, stop)
+            if reason is not None:
+                # `stop` вызывается только у работающей программы: она остановлена по отмене или таймауту.
+                result["status"] = reason
+    except Exception as error:
+        result = {"status": "error", "error": f"{type(error).__name__}: {error}"}
+    events.put(("done", ticket, result))
+
+
+def simulate_request(ticket: int, request: dict, events, stop) -> dict:
+    assert ("source" in request) != ("code" in request), "Request should have either source or code"
+    code = translate_text(request["source"]) if "source" in request else request["code"]
+    limit = request.get("limit", 5000)
+    loop_detector = LoopDetector() if request.get("detect_loops") else None
+    _, _, instr_counter, ticks = processor.simulation(
+        code,
+        ListInputPort(list(request.get("input", ""))),
+        request.get("memory_size", 200),
+        limit,
+        engine=request["engine"],
+        output=StreamOutputPort(QueueSink(events, ticket)),
+        loop_detector=loop_detector,
+        stop=stop,
+        stop_every=request["stop_every"],
+    )
+    result = {"instr_counter": instr_counter, "ticks": ticks}
+    if loop_detector is not None and loop_detector.loop is not None:
+        return {"status": "loop", "loop": str(loop_detector.loop), **result}
+    return {"status": "limit" if instr_counter >= limit else "halted", **result}
+
+
+class Server:
+    """Сервер моделирования: запросы JSON lines выполняются в пуле заранее запущенных процессов.
+
+    Процессы пула живут, пока работает сервер, поэтому запуск и импорт модулей оплачиваются
+    один раз, а не на каждую программу. Вывод каждого запроса передаётся из процесса
+    через очередь событий (`multiprocessing.Manager`) и отправляется клиенту по мере
+    работы программы, итог -- отдельным сообщением в конце.
+    """
+
+    workers = None
+    "Количество процессов пула."
+
+    engine = None
+    "Движок моделирования по умолчанию."
+
+    timeout = None
+    "Таймаут запроса по умолчанию в секундах (None -- без таймаута)."
+
+    stop_every = None
+    "Через сколько инструкций процесс проверяет отмену и таймаут (и отправляет вывод)."
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        engine: str = "signal",
+        timeout: float | None = None,
+        stop_every: int = 10000,
+        log_level: str = "WARNING",
+    ):
+        assert engine in processor.engines, f"Unknown engine '{engine}'"
+        assert stop_every > 0, "stop interval should be greater than zero"
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.timeout = timeout
+        self.stop_every = stop_every
+        self.log_level = log_level
+        self.tickets = itertools.count()
+        self.pending = {}
+        self.senders = {}
+        self.cancelling = set()
+
+    async def __aenter__(self) -> Server:
+        self.manager = multiprocessing.Manager()
+        self.events = self.manager.Queue()
+        self.cancelled = self.manager.dict()
+        self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.log_level,))
+        # Процессы запускаются сразу, а не при первом запросе.
+        for future in [self.pool.submit(int) for _ in range(self.workers)]:
+            await asyncio.wrap_future(future)
+        self.pump_task = asyncio.create_task(self.pump())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.events.put(None)
+        await self.pump_task
+        self.pool.shutdown(cancel_futures=True)
+        self.manager.shutdown()
+
+    async def pump(self):
+        """Разбор очереди событий процессов: вывод -- в очередь вывода запроса, итог -- ожидающей задаче."""
+        loop = asyncio.get_running_loop()
+        while (event := await loop.run_in_executor(None, self.events.get)) is not None:
+            kind, ticket, payload = event
+            if kind == "output" and ticket in self.senders:
+                self.senders[ticket](payload)
+            elif kind == "done" and ticket in self.pending and not self.pending[ticket].done():
+                self.pending[ticket].set_result(payload)
+
+    def cancel(self, ticket: int):
+        if ticket in self.pending and ticket not in self.cancelling:
+            self.cancelling.add(ticket)
+            self.cancelled[ticket] = True
+
+    async def session(self, read_line, send):
+        """Обслужить поток запросов: корутины `read_line()` (возвращает строку, '' -- конец) и `send(message)`.
+
+        Запрос -- `{"id": ..., "source": "<текст .ed>" | "code": [<ячейки>], "input": "...", "memory_size": 200,
+        "limit": 5000, "engine": ..., "timeout": <секунды>, "detect_loops": false}`, отмена -- `{"cancel": <id>}`.
+        Ответы -- `{"id": ..., "output": "..."}` по мере вывода и итог `{"id": ..., "status": ..., ...}`.
+        Запрос без `id` получает `id` `"line-<номер строки>"`, такие `id` не совпадают с числовыми.
+        Запрос с `id` выполняющегося запроса сессии отклоняется (итог со статусом `error`), иначе
+        отмена и итоги двух запросов были бы неразличимы. Сессия заканчивается, когда на все запросы
+        отправлены итоги.
+        """
+        tasks, tickets = set(), {}
+        for number in itertools.count():
+            line = await read_line()
+            if not line:
+                break
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                request = json.loads(line)
+                assert isinstance(request, dict), "Request should be a JSON object"
+            except (ValueError, AssertionError) as error:
+                await send({"id": None, "status": "error", "error": f"{type(error).__name__}: {error}"})
+                continue
+            if "cancel" in request:
+                if request["cancel"] in tickets:
+                    self.cancel(tickets[request["cancel"]])
+                continue
+            request_id = request.pop("id", f"line-{number}")
+            if request_id in tickets and tickets[request_id] in self.pending:
+                await send(
+                    {"id": request_id, "status": "error", "error": f"Request id {request_id!r} is already in use"}
+                )
+                continue
+            tickets[request_id] = ticket = next(self.tickets)
+            # Запрос ожидает итога с момента чтения: его можно отменить до запуска задачи.
+            self.pending[ticket] = asyncio.get_running_loop().create_future()
+            tasks.add(asyncio.create_task(self.dispatch(ticket, request_id, request, send)))
+        await asyncio.gather(*tasks)
+
+    async def dispatch(self, ticket: int, request_id, request: dict, send):
+        loop = asyncio.get_running_loop()
+        done = self.pending[ticket]
+        outputs = asyncio.Queue()
+        self.senders[ticket] = outputs.put_nowait
+        forward = asyncio.create_task(self.forward(request_id, outputs, send))
+        job = {"engine": self.engine, "timeout": self.timeout, **request, "stop_every": self.stop_every}
+        try:
+            await loop.run_in_executor(self.pool, run_request, ticket, job, self.events, self.cancelled)
+            result = await done
+        except Exception as error:
+            result = {"status": "error", "error": f"{type(error).__name__}: {error}"}
+        finally:
+            del self.pending[ticket], self.senders[ticket]
+            outputs.put_nowait(None)
+            await forward
+        if ticket in self.cancelling:
+            self.cancelling.discard(ticket)
+            del self.cancelled[ticket]
+        await send({"id": request_id, **result})
+
+    @staticmethod
+    async def forward(request_id, outputs: asyncio.Queue, send):
+        """Отправлять вывод запроса из очереди по порядку до None: медленный клиент задерживает только свои ответы."""
+        while (text := await outputs.get()) is not None:
+            await send({"id": request_id, "output": text})
+
+
+async def serve_stdio(server: Server):
+    """Запросы из stdin, ответы в stdout (JSON lines)."""
+    loop = asyncio.get_running_loop()
+
+    async def read_line() -> str:
+        return await loop.run_in_executor(None, sys.stdin.readline)
+
+    async def send(message: dict):
+        print(json.dumps(message, ensure_ascii=False), flush=True)
+
+    await server.session(read_line, send)
+
+
+async def serve_unix(server: Server, path: str):
+    """Запросы и ответы через Unix-сокет `path`, по сессии на соединение."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def read_line() -> str:
+            return (await reader.readline()).decode("utf-8")
+
+        async def send(message: dict):
+            # Ожидание `drain` не даёт буферу транспорта расти, если клиент читает медленнее, чем получает вывод.
+            if not writer.is_closing():
+                writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+                with contextlib.suppress(ConnectionError):
+                    await writer.drain()
+
+        try:
+            await server.session(read_line, send)
+        finally:
+            writer.close()
+
+    unix_server = await asyncio.start_unix_server(handle, path)
+    async with unix_server:
+        await unix_server.serve_forever()
+
+
+async def main(
+    socket_path: str | None = None,
+    workers: int | None = None,
+    engine: str = "signal",
+    default_timeout: float | None = None,
+    stop_every: int = 10000,
+    log_level: str = "WARNING",
+):
+    async with Server(workers, engine, default_timeout, stop_every, log_level) as server:
+        if socket_path is None:
+            await serve_stdio(server)
+        else:
+            await serve_unix(server, socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сервер моделирования (JSON lines)")
+    parser.add_argument("--socket", metavar="PATH", help="слушать Unix-сокет PATH вместо stdin/stdout")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="количество процессов (по умолчанию -- по числу ядер)"
+    )
+    parser.add_argument("--engine", choices=processor.engines.keys(), default="signal", help="движок по умолчанию")
+    parser.add_argument("--timeout", type=float, default=None, help="таймаут запроса по умолчанию, секунды")
+    parser.add_argument(
+        "--stop-every", type=int, default=10000, metavar="N", help="проверять отмену и таймаут каждые N инструкций"
+    )
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING"], default="WARNING", help="уровень журнала")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+    asyncio.run(main(args.socket, args.workers, args.engine, args.timeout, args.stop_every, args.log_level))
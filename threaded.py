@@ -0,0 +1,431 @@
+from __future__ import annotations
+
+import logging
+import operator
+
+from opcodes import (
+    IMMEDIATE,
+    INDIRECT,
+    Opcode,
+    fetch_ticks,
+    immediate_ticks,
+    indirect_ticks,
+    instruction_ticks,
+    opcode_list,
+    string_word_ticks,
+)
+from ports import input_port, write_string
+
+
+class _HaltError(Exception):
+    pass
+
+
+def _div(dividend, divisor):
+    if divisor == 0:
+        logging.error(f"Division by zero: {Opcode.DIV}")
+        return 0
+    return dividend // divisor
+
+
+class ThreadedState:
+    """Регистры для скомпилированных обработчиков (см. `FunctionalEngine.flag`)."""
+
+    __slots__ = ("ac", "flag", "halt_pc", "sp", "ticks")
+
+    def __init__(self, ac, sp, flag):
+        self.ac = ac
+        self.sp = sp
+        self.flag = flag
+        self.ticks = 0
+        self.halt_pc = None
+
+
+class ThreadedCode(dict):
+    """Программа, скомпилированная в замыкания (шитый код): адрес -> обработчик ячейки.
+
+    Обработчик выполняет инструкцию над `ThreadedState` и возвращает адрес следующей,
+    код операции, операнд и вид адресации в него уже подставлены. Обработчики
+    компилируются при первом обращении к ячейке, запись в ячейку сбрасывает её
+    обработчик, и он компилируется заново.
+    """
+
+    def __init__(self, data_path):
+        super().__init__()
+        self.data_path = data_path
+        self.memory = data_path.memory
+        self.size = data_path.memory_size
+
+    def __missing__(self, addr: int):
+        handler = self.compile(addr)
+        self[addr] = handler
+        return handler
+
+    def compile(self, addr: int):
+        opcode_id, value, mode = self.memory.decode(addr)
+        opcode = opcode_list[opcode_id]
+        next_pc = (addr + 1) % self.size
+        if mode == IMMEDIATE and opcode in immediate_ticks:
+            return compilers_immediate[opcode](self, value, next_pc, fetch_ticks + immediate_ticks[opcode])
+        if opcode == Opcode.NOP or mode != INDIRECT:
+            return compilers[opcode](self, value, next_pc, fetch_ticks + instruction_ticks[opcode])
+        cost = fetch_ticks + indirect_ticks + instruction_ticks[opcode]
+        return compilers_indirect.get(opcode, _compile_indirect)(self, opcode, value, next_pc, cost)
+
+    def write(self, addr: int, value):
+        self.memory.write(addr, value)
+        self.pop(addr % self.size, None)
+
+
+def _compile_nop(code, value, next_pc, cost):
+    def nop(st):
+        st.flag = 1
+        st.ticks += cost
+        return next_pc
+
+    return nop
+
+
+def _compile_inc(code, value, next_pc, cost):
+    def inc(st):
+        st.ac = st.flag = st.ac + 1
+        st.ticks += cost
+        return next_pc
+
+    return inc
+
+
+def _compile_dec(code, value, next_pc, cost):
+    def dec(st):
+        st.ac = st.flag = st.ac - 1
+        st.ticks += cost
+        return next_pc
+
+    return dec
+
+
+def _compile_halt(code, value, next_pc, cost):
+    def halt(st):
+        st.ticks += cost
+        st.halt_pc = next_pc
+        raise _HaltError
+
+    return halt
+
+
+def _compile_push(code, value, next_pc, cost):
+    size, write = code.size, code.write
+
+    def push(st):
+        st.sp = (st.sp - 1) % size
+        write(st.sp, st.ac)
+        st.flag = st.ac
+        st.ticks += cost
+        return next_pc
+
+    return push
+
+
+def _compile_pop(code, value, next_pc, cost):
+    size, read = code.size, code.memory.read
+
+    def pop(st):
+        st.ac = st.flag = read(st.sp)
+        st.sp = (st.sp + 1) % size
+        st.ticks += cost
+        return next_pc
+
+    return pop
+
+
+def _compile_load(code, addr, next_pc, cost):
+    read = code.memory.read
+
+    def load(st):
+        st.ac = st.flag = read(addr)
+        st.ticks += cost
+        return next_pc
+
+    return load
+
+
+def _compile_store(code, addr, next_pc, cost):
+    write = code.write
+
+    def store(st):
+        write(addr, st.ac)
+        st.flag = st.ac
+        st.ticks += cost
+        return next_pc
+
+    return store
+
+
+def _compile_add(code, addr, next_pc, cost):
+    read = code.memory.read
+
+    def add(st):
+        st.ac = st.flag = st.ac + read(addr)
+        st.ticks += cost
+        return next_pc
+
+    return add
+
+
+def _compile_sub(code, addr, next_pc, cost):
+    read = code.memory.read
+
+    def sub(st):
+        st.ac = st.flag = st.ac - read(addr)
+        st.ticks += cost
+        return next_pc
+
+    return sub
+
+
+def _compile_mul(code, addr, next_pc, cost):
+    read = code.memory.read
+
+    def mul(st):
+        st.ac = st.flag = st.ac * read(addr)
+        st.ticks += cost
+        return next_pc
+
+    return mul
+
+
+def _compile_div(code, addr, next_pc, cost):
+    read = code.memory.read
+
+    def div(st):
+        divisor = read(addr)
+        if divisor == 0:
+            logging.error(f"Division by zero: {Opcode.DIV}")
+            st.ac = st.flag = 0
+        else:
+            st.ac = st.flag = st.ac // divisor
+        st.ticks += cost
+        return next_pc
+
+    return div
+
+
+def _compile_cmp(code, addr, next_pc, cost):
+    read = code.memory.read
+
+    def cmp(st):
+        st.flag = st.ac - read(addr)
+        st.ticks += cost
+        return next_pc
+
+    return cmp
+
+
+def _compile_test(code, addr, next_pc, cost):
+    read = code.memory.read
+
+    def test(st):
+        st.flag = st.ac & read(addr)
+        st.ticks += cost
+        return next_pc
+
+    return test
+
+
+def _compile_out(code, addr, next_pc, cost):
+    read, output_ports = code.memory.read, code.data_path.output_ports
+
+    def out(st):
+        port = output_ports.get(read(addr))
+        if port is not None:
+            port.write(st.ac)
+        st.flag = addr
+        st.ticks += cost
+        return next_pc
+
+    return out
+
+
+def _compile_outs(code, addr, next_pc, cost):
+    read, output_ports, size = code.memory.read, code.data_path.output_ports, code.size
+
+    def outs(st):
+        st.ticks += cost + write_string(output_ports.get(st.ac), read, addr, size) * string_word_ticks
+        st.flag = addr
+        return next_pc
+
+    return outs
+
+
+def _compile_load_immediate(code, value, next_pc, cost):
+    def load(st):
+        st.ac = st.flag = value
+        st.ticks += cost
+        return next_pc
+
+    return load
+
+
+def _compile_alu_immediate(operation, latch_ac=True):
+    def compile_immediate(code, value, next_pc, cost):
+        if latch_ac:
+
+            def alu(st):
+                st.ac = st.flag = operation(st.ac, value)
+                st.ticks += cost
+                return next_pc
+
+        else:
+
+            def alu(st):
+                st.flag = operation(st.ac, value)
+                st.ticks += cost
+                return next_pc
+
+        return alu
+
+    return compile_immediate
+
+
+def _compile_out_immediate(code, value, next_pc, cost):
+    output_ports = code.data_path.output_ports
+
+    def out(st):
+        port = output_ports.get(value)
+        if port is not None:
+            port.write(st.ac)
+        st.flag = value
+        st.ticks += cost
+        return next_pc
+
+    return out
+
+
+def _compile_in(code, value, next_pc, cost, flag=1):
+    read_input = code.data_path.input_ports[input_port].read
+
+    def in_(st):
+        symbol_code = read_input()
+        if symbol_code is None:
+            st.ticks += cost - instruction_ticks[Opcode.IN]
+            st.halt_pc = next_pc
+            raise _HaltError
+        st.ac = symbol_code
+        st.flag = flag
+        st.ticks += cost
+        return next_pc
+
+    return in_
+
+
+def _compile_branch(condition):
+    def compile_branch(code, target, next_pc, cost, flag=1):
+        target_pc = target % code.size
+
+        def branch(st):
+            st.ticks += cost
+            if condition(st.flag):
+                st.flag = target
+                return target_pc
+            st.flag = flag
+            return next_pc
+
+        return branch
+
+    return compile_branch
+
+
+def _compile_indirect(code, opcode, pointer, next_pc, cost, keep_flag=False):
+    """Косвенная адресация: операнд читается из ячейки `pointer` при каждом исполнении.
+
+    Обработчики с прямой адресацией для прочитанных адресов кэшируются. Если инструкция
+    сама может не трогать АЛУ (`keep_flag`), флаги остаются от адреса `pointer`.
+    """
+    read, compile_direct = code.memory.read, compilers[opcode]
+    direct_cost = cost - indirect_ticks
+    extra = (pointer,) if keep_flag else ()
+    handlers = {}
+
+    def indirect(st):
+        addr = read(pointer)
+        handler = handlers.get(addr)
+        if handler is None:
+            handler = handlers[addr] = compile_direct(code, addr, next_pc, direct_cost, *extra)
+        st.ticks += indirect_ticks
+        return handler(st)
+
+    return indirect
+
+
+def _compile_indirect_keep_flag(code, opcode, pointer, next_pc, cost):
+    return _compile_indirect(code, opcode, pointer, next_pc, cost, keep_flag=True)
+
+
+compilers = {
+    Opcode.NOP: _compile_nop,
+    Opcode.INC: _compile_inc,
+    Opcode.DEC: _compile_dec,
+    Opcode.HALT: _compile_halt,
+    Opcode.PUSH: _compile_push,
+    Opcode.POP: _compile_pop,
+    Opcode.LOAD: _compile_load,
+    Opcode.STORE: _compile_store,
+    Opcode.ADD: _compile_add,
+    Opcode.SUB: _compile_sub,
+    Opcode.MUL: _compile_mul,
+    Opcode.DIV: _compile_div,
+    Opcode.OUT: _compile_out,
+    Opcode.IN: _compile_in,
+    Opcode.CMP: _compile_cmp,
+    Opcode.TEST: _compile_test,
+    Opcode.JG: _compile_branch(lambda flag: flag >= 0),
+    Opcode.JZ: _compile_branch(lambda flag: flag == 0),
+    Opcode.JNZ: _compile_branch(lambda flag: flag != 0),
+    Opcode.JMP: _compile_branch(lambda flag: True),
+    Opcode.OUTS: _compile_outs,
+}
+"Компиляторы ячеек для прямой адресации: код операции -> функция, строящая обработчик ячейки."
+
+compilers_indirect = {
+    Opcode.IN: _compile_indirect_keep_flag,
+    Opcode.JG: _compile_indirect_keep_flag,
+    Opcode.JZ: _compile_indirect_keep_flag,
+    Opcode.JNZ: _compile_indirect_keep_flag,
+    Opcode.JMP: _compile_indirect_keep_flag,
+}
+
+compilers_immediate = {
+    Opcode.LOAD: _compile_load_immediate,
+    Opcode.ADD: _compile_alu_immediate(operator.add),
+    Opcode.SUB: _compile_alu_immediate(operator.sub),
+    Opcode.MUL: _compile_alu_immediate(operator.mul),
+    Opcode.DIV: _compile_alu_immediate(_div),
+    Opcode.OUT: _compile_out_immediate,
+    Opcode.CMP: _compile_alu_immediate(operator.sub, latch_ac=False),
+    Opcode.TEST: _compile_alu_immediate(operator.and_, latch_ac=False),
+}
+"Компиляторы ячеек для непосредственной адресации: операнд подставляется в обработчик как константа."
+
+
+def run_threaded(control_unit, limit: int) -> bool:
+    """Выполнение шитым кодом: `pc = handlers[pc](state)`. Возвращает True при останове."""
+    dp = control_unit.data_path
+    handlers = ThreadedCode(dp)
+    state = ThreadedState(dp.ac, dp.sp, -1 if dp.ps["N"] else 0 if dp.ps["Z"] else 1)
+    pc, count = dp.pc, control_unit.instruction_counter
+    halted = False
+    try:
+        while count < limit:
+            pc = handlers[pc](state)
+            count += 1
+    except _HaltError:
+        pc = state.halt_pc
+        halted = True
+
+    dp.ac, dp.sp, dp.pc = state.ac, state.sp, pc
+    dp.alu.n_flag = state.flag < 0
+    dp.alu.z_flag = state.flag == 0
+    dp.signal_latch_ps_flags()
+    control_unit.instruction_counter = count
+    control_unit.tick(state.ticks)
+    return halted
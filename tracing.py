@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import struct
+
+from opcodes import opcode_ids, opcode_list
+
+state_format = (
+    "TICK: {:4} | AC: {:4} | PC: {:3} | IR: {:5} | DR: {:7} | SP: {:3} | Addr: {:3} | ToMem: {:7} | N: {:1} | Z: {:1} "
+    "| mem[Addr]: {:7}"
+)
+"Формат строки журнала состояний процессора."
+
+record_struct = struct.Struct("<QqqBqqqqBq")
+"Упакованный снимок: такт, AC, PC, IR, DR, SP, Addr, ToMem, флаги (N -- бит 1, Z -- бит 0), mem[Addr]."
+
+
+def snapshot(control_unit) -> tuple:
+    """Снимок регистров процессора в порядке полей `record_struct`."""
+    dp = control_unit.data_path
+    return (
+        control_unit.current_tick(),
+        dp.ac,
+        dp.pc,
+        opcode_ids[dp.ir],
+        dp.dr,
+        dp.sp,
+        dp.addr,
+        dp.to_mem,
+        (2 if dp.ps["N"] else 0) | (1 if dp.ps["Z"] else 0),
+        dp.memory.read(dp.addr),
+    )
+
+
+def render(record: tuple) -> str:
+    """Строка журнала состояний (как `ControlUnit.__repr__`) по снимку."""
+    tick, ac, pc, ir, dr, sp, addr, to_mem, flags, mem = record
+    return state_format.format(tick, ac, pc, opcode_list[ir], dr, sp, addr, to_mem, flags >> 1, flags & 1, mem)
+
+
+class TraceRecorder:
+    """Кольцевой буфер упакованных снимков регистров после каждой инструкции.
+
+    Хранит последние `capacity` снимков. Текст журнала строится только по запросу
+    (`render_lines`). Снимки, не помещающиеся в упаковку (например, значения больше
+    64 бит), хранятся отдельно как кортежи.
+    """
+
+    capacity = None
+    "Количество хранимых снимков."
+
+    buffer = None
+    "Упакованные снимки."
+
+    wide = None
+    "Номер слота -> снимок, не поместившийся в упаковку."
+
+    count = None
+    "Количество записанных снимков (в том числе вытесненных)."
+
+    def __init__(self, capacity: int = 4096):
+        assert capacity > 0, "trace capacity should be greater than zero"
+        self.capacity = capacity
+        self.buffer = bytearray(record_struct.size * capacity)
+        self.wide = {}
+        self.count = 0
+
+    def record(self, control_unit):
+        slot = self.count % self.capacity
+        values = snapshot(control_unit)
+        try:
+            record_struct.pack_into(self.buffer, slot * record_struct.size, *values)
+            if self.wide:
+                self.wide.pop(slot, None)
+        except struct.error:
+            self.wide[slot] = values
+        self.count += 1
+
+    def records(self):
+        """Хранимые снимки от старых к новым."""
+        first = max(0, self.count - self.capacity)
+        for index in range(first, self.count):
+            slot = index % self.capacity
+            if slot in self.wide:
+                yield self.wide[slot]
+            else:
+                yield record_struct.unpack_from(self.buffer, slot * record_struct.size)
+
+    def render_lines(self) -> list[str]:
+        return [render(record) for record in self.records()]
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import objfile
+import translator
+from peephole import Peephole
+
+
+def default_directory() -> Path:
+    """Каталог кэша по умолчанию: `$XDG_CACHE_HOME/csa_lab3` (или `~/.cache/csa_lab3`)."""
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "csa_lab3"
+
+
+def count_lines(text: str) -> int:
+    """Количество строк так, как их считает `translator.read_lines`."""
+    return text.count("\n") + (1 if text and not text.endswith("\n") else 0)
+
+
+class TranslationCache:
+    """Кэш трансляции на диске, адресуемый содержимым.
+
+    Ключ -- sha256 от версии транслятора, версии объектного формата, признака оптимизации
+    и текста исходного кода, значение -- объектный файл (`objfile`). Попадание обновляет время изменения
+    файла; при превышении `max_size` удаляются файлы, к которым дольше всего не
+    обращались (LRU). Записи создаются атомарно, поэтому кэш можно делить между
+    процессами.
+    """
+
+    directory = None
+    "Каталог кэша."
+
+    max_size = None
+    "Предельный суммарный размер объектных файлов в байтах."
+
+    optimize = None
+    "Применять ли при трансляции peephole-оптимизацию (`peephole.Peephole`)."
+
+    def __init__(self, directory: str | Path | None = None, max_size: int = 64 << 20, optimize: bool = False):
+        assert max_size > 0, "cache size should be greater than zero"
+        self.directory = Path(directory) if directory is not None else default_directory()
+        self.max_size = max_size
+        self.optimize = optimize
+        self.hits = self.misses = 0
+
+    def key(self, text: str) -> str:
+        digest = hashlib.sha256(f"{translator.version}:{objfile.version}:{int(self.optimize)}:".encode())
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def object_path(self, source_filename: str) -> tuple[Path, int]:
+        """Объектный файл для исходного кода (трансляция при промахе) и количество строк исходного кода."""
+        with open(source_filename) as file:
+            text = file.read()
+        path = self.directory / f"{self.key(text)}.bin"
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            return path, count_lines(text)
+
+        code, source_loc = translator.translate(source_filename, Peephole() if self.optimize else None)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(handle)
+        try:
+            objfile.write_object(temporary, code)
+            Path(temporary).replace(path)
+        except BaseException:
+            Path(temporary).unlink(missing_ok=True)
+            raise
+        self.evict(keep=path)
+        return path, source_loc
+
+    def translate(self, source_filename: str) -> tuple[objfile.ObjectCode, int]:
+        """Как `translator.translate`, но машинный код берётся из кэша."""
+        path, source_loc = self.object_path(source_filename)
+        return objfile.ObjectCode(str(path)), source_loc
+
+    def evict(self, keep: Path | None = None):
+        """Удалить давно не использованные записи (кроме `keep`), пока кэш больше `max_size`."""
+        entries = []
+        for path in self.directory.glob("*.bin"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
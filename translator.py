@@ -1,38 +1,56 @@
 from __future__ import annotations
 
-import sys
+import argparse
+import re
+from pathlib import Path
 
-from opcodes import Opcode, write_code
+from debuginfo import DebugInfo, debug_info_path
+from objfile import write_object
+from opcodes import DIRECT, IMMEDIATE, INDIRECT, Opcode, immediate_ticks, write_code
+from peephole import Peephole
+
+version = 3
+"Версия транслятора. Увеличивается при любом изменении генерируемого машинного кода (входит в ключ кэша трансляции)."
+
+mnemonics = {
+    "nop": Opcode.NOP,
+    "inc": Opcode.INC,
+    "dec": Opcode.DEC,
+    "halt": Opcode.HALT,
+    "push": Opcode.PUSH,
+    "pop": Opcode.POP,
+    "load": Opcode.LOAD,
+    "store": Opcode.STORE,
+    "add": Opcode.ADD,
+    "sub": Opcode.SUB,
+    "mul": Opcode.MUL,
+    "div": Opcode.DIV,
+    "out": Opcode.OUT,
+    "outs": Opcode.OUTS,
+    "in": Opcode.IN,
+    "cmp": Opcode.CMP,
+    "test": Opcode.TEST,
+    "jg": Opcode.JG,
+    "jz": Opcode.JZ,
+    "jnz": Opcode.JNZ,
+    "jmp": Opcode.JMP,
+}
+"Операторы исходного кода -> коды операций."
+
+word_token = re.compile(r"'(?P<string>[^']*)'|(?P<number>[-\d]\d*)|[ ,]+|(?P<label>[^ ,]+)")
+"Лексемы слова данных: строка в кавычках, число, разделители, метка."
 
 
 def symbol_to_opcode(symbol) -> Opcode:
     """Отображение операторов исходного кода в коды операций."""
-    return {
-        "nop": Opcode.NOP,
-        "inc": Opcode.INC,
-        "dec": Opcode.DEC,
-        "halt": Opcode.HALT,
-        "push": Opcode.PUSH,
-        "pop": Opcode.POP,
-        "load": Opcode.LOAD,
-        "store": Opcode.STORE,
-        "add": Opcode.ADD,
-        "sub": Opcode.SUB,
-        "mul": Opcode.MUL,
-        "div": Opcode.DIV,
-        "out": Opcode.OUT,
-        "in": Opcode.IN,
-        "cmp": Opcode.CMP,
-        "test": Opcode.TEST,
-        "jg": Opcode.JG,
-        "jz": Opcode.JZ,
-        "jnz": Opcode.JNZ,
-        "jmp": Opcode.JMP,
-    }.get(symbol, Opcode.NOP)
-
-
-def read_lines(source_filename: str) -> tuple[list[str], int]:
-    """Построчно читаем файл, убираем отступы и пустые строки"""
+    return mnemonics.get(symbol, Opcode.NOP)
+
+
+def read_lines(source_filename: str, line_numbers: list[int] | None = None) -> tuple[list[str], int]:
+    """Построчно читаем файл, убираем отступы и пустые строки
+
+    Если задан `line_numbers`, в него добавляются номера оставленных строк (с 1).
+    """
     source_loc = 0
     lines = []
     with open(source_filename) as file:
@@ -41,62 +59,67 @@ def read_lines(source_filename: str) -> tuple[list[str], int]:
             line = line.strip()
             if line != "":
                 lines.append(line)
+                if line_numbers is not None:
+                    line_numbers.append(source_loc)
     return lines, source_loc
 
 
-def remove_comments(code_lines) -> list[str]:
-    """Убираем комменарии"""
+def remove_comments(code_lines, line_numbers: list[int] | None = None) -> list[str]:
+    """Убираем комменарии
+
+    Если задан `line_numbers` (номера строк `code_lines`), из него убираются номера удалённых строк.
+    """
     without_comments = []
-    for line in code_lines:
+    kept_numbers = []
+    for number, line in enumerate(code_lines):
         index = line.find(";")
-        if index == -1:
-            without_comments.append(line)
-            continue
-        line = line[0 : line.find(";")].strip()
+        if index != -1:
+            line = line[0 : line.find(";")].strip()
         if line != "":
             without_comments.append(line)
+            kept_numbers.append(number)
+    if line_numbers is not None:
+        line_numbers[:] = [line_numbers[number] for number in kept_numbers]
     return without_comments
 
 
 def parse_word(position, word_line, words) -> tuple[int, dict]:
     """Индексация слова данных (в т.ч. разбиение строк по буквам)"""
-    char_num = 0
-    while char_num < len(word_line):
-        if word_line[char_num] == "'":
-            char_num += 1
-            while word_line[char_num] != "'":
-                words[position] = [ord(word_line[char_num])]
+    for token in word_token.finditer(word_line):
+        string, number, label = token.group("string", "number", "label")
+        if string is not None:
+            for char in string:
+                words[position] = [ord(char)]
                 position += 1
-                char_num += 1
-            char_num += 1
-        elif word_line[char_num].isnumeric() or word_line[char_num] == "-":
-            cur_num = word_line[char_num]
-            char_num += 1
-            while char_num < len(word_line) and word_line[char_num].isnumeric():
-                cur_num += word_line[char_num]
-                char_num += 1
-            words[position] = [int(cur_num)]
+        elif number is not None:
+            words[position] = [int(number)]
             position += 1
-        elif word_line[char_num] == "," or word_line[char_num] == " ":
-            char_num += 1
-        else:
-            label = ""
-            while char_num < len(word_line) and word_line[char_num] != "," and word_line[char_num] != " ":
-                label += word_line[char_num]
-                char_num += 1
+        elif label is not None:
+            assert not label.startswith("'"), f"Unterminated string in .word {word_line}"
             words[position] = [label]
             position += 1
     return position, words
 
 
-def lines_to_words_and_labels(code_lines) -> tuple[dict, dict]:
-    """Трансляция строк кода в операторы (без привязки к языку)"""
+def lines_to_words_and_labels(
+    code_lines, line_numbers: list[int] | None = None, source_lines: dict | None = None, regions: set | None = None
+) -> tuple[dict, dict]:
+    """Трансляция строк кода в операторы (без привязки к языку)
+
+    Если заданы `line_numbers` (номера строк `code_lines`) и `source_lines`, в `source_lines`
+    записывается адрес слова -> номер строки, из которой оно получено.
+    Если задан `regions`, в него добавляются адреса директив `org`.
+    """
     labels = {}
     words = {}
     position = 0
-    for line in code_lines:
+    for number, line in enumerate(code_lines):
+        start = position
         if line.startswith("org"):
             position = int(line.split(" ")[1])
+            start = position
+            if regions is not None:
+                regions.add(position)
         elif line[-1] == ":":
             labels[position] = line[0:-1]
         elif line.startswith(".word"):
@@ -108,6 +131,9 @@ def lines_to_words_and_labels(code_lines) -> tuple[dict, dict]:
                 kv.append(args[1])
             words[position] = kv
             position += 1
+        if source_lines is not None:
+            for addr in range(start, position):
+                source_lines[addr] = line_numbers[number]
     return words, labels
 
 
@@ -122,64 +148,124 @@ def find_program_start(labels) -> int:
     return position
 
 
+def build_symbol_table(labels) -> dict:
+    """Таблица символов: метка -> индекс. Если метка повторяется, берётся первая по порядку `labels`."""
+    symbols = {}
+    for index, label in labels.items():
+        symbols.setdefault(label, index)
+    return symbols
+
+
 def link_labels(words, labels) -> dict:
-    """Подмена меток на индексы + установка вида адресации (True - косвенный)"""
+    """Подмена меток на индексы + установка вида адресации (`opcodes.DIRECT`/`INDIRECT`/`IMMEDIATE`)"""
+    return link_symbols(words, build_symbol_table(labels))
+
+
+def link_symbols(words, symbols) -> dict:
+    """Как `link_labels`, но по готовой таблице символов (метка -> индекс)."""
     replaced = {}
     for w_index, word in words.items():
         new_word = []
-        indirect = False
+        mode = DIRECT
         for part in word:
-            if isinstance(part, str) and part.startswith("("):
-                indirect = True
-                part = part[1:-1]
-            for l_index, label in labels.items():
-                if label == part:
-                    part = l_index
+            if isinstance(part, str):
+                if part.startswith("("):
+                    mode = INDIRECT
+                    part = part[1:-1]
+                elif part.startswith("#"):
+                    assert mnemonics.get(word[0]) in immediate_ticks, (
+                        f"Immediate operand is not allowed for '{word[0]}'"
+                    )
+                    mode = IMMEDIATE
+                    part = part[1:]
+                    if part.lstrip("-").isdigit():
+                        part = int(part)
+                part = symbols.get(part, part)
             new_word.append(part)
-        new_word.append(indirect)
+        new_word.append(mode)
         replaced[w_index] = new_word
     return replaced
 
 
 def to_machine_code(raw_code, _start_position) -> list:
+    """Ячейки машинного кода. Ключ `is_immediate` добавляется только ячейкам с непосредственным операндом."""
     code = [{"index": 0, "opcode": Opcode.JMP, "value": _start_position, "is_indirect": False}]
     for index, word in raw_code.items():
         if len(word) == 2:
-            code.append(
-                {
-                    "index": index,
-                    "opcode": symbol_to_opcode(word[0]),
-                    "value": word[0] if word[0] not in Opcode._value2member_map_ else 0,
-                    "is_indirect": word[1],
-                }
-            )
+            cell = {
+                "index": index,
+                "opcode": symbol_to_opcode(word[0]),
+                "value": word[0] if word[0] not in mnemonics else 0,
+                "is_indirect": word[1] == INDIRECT,
+            }
         elif len(word) == 3:
-            code.append({"index": index, "opcode": symbol_to_opcode(word[0]), "value": word[1], "is_indirect": word[2]})
+            cell = {
+                "index": index,
+                "opcode": symbol_to_opcode(word[0]),
+                "value": word[1],
+                "is_indirect": word[2] == INDIRECT,
+            }
         else:
             raise f"Incorrect operands count = {len(word)}"
+        if word[-1] == IMMEDIATE:
+            cell["is_immediate"] = True
+        code.append(cell)
     return code
 
 
-def translate(source_filename) -> tuple[list, int]:
-    """Многопроходная трансляция программы в машинный код"""
-    lines, source_loc = read_lines(source_filename)
-    lines_without_comments = remove_comments(lines)
-    words, labels = lines_to_words_and_labels(lines_without_comments)
-    raw_code = link_labels(words, labels)
+def translate(source_filename, optimizer: Peephole | None = None) -> tuple[list, int]:
+    """Многопроходная трансляция программы в машинный код.
+
+    Если задан `optimizer`, слова оптимизируются перед связыванием, статистика остаётся в нём.
+    """
+    code, source_loc, _ = translate_with_debug_info(source_filename, optimizer)
+    return code, source_loc
+
+
+def translate_with_debug_info(source_filename, optimizer: Peephole | None = None) -> tuple[list, int, DebugInfo]:
+    """То же, что `translate`, и отладочная информация: адрес -> строка исходного кода, адрес -> метка."""
+    line_numbers = []
+    lines, source_loc = read_lines(source_filename, line_numbers)
+    lines_without_comments = remove_comments(lines, line_numbers)
+    source_lines, regions = {}, set()
+    words, labels = lines_to_words_and_labels(lines_without_comments, line_numbers, source_lines, regions)
+    symbols = build_symbol_table(labels)
     _start_position = find_program_start(labels)
+    if optimizer is not None:
+        words, symbols = optimizer.optimize(words, symbols, regions)
+        _start_position = symbols["_start"]
+        source_lines = {position: source_lines[origin] for position, origin in optimizer.origins.items()}
+    raw_code = link_symbols(words, symbols)
     code = to_machine_code(raw_code, _start_position)
-    return code, source_loc
+    return code, source_loc, DebugInfo.from_symbols(Path(source_filename).name, source_lines, symbols)
+
+
+code_writers = {"bin": write_object, "json": write_code}
+"Форматы машинного кода: имя -> функция записи."
 
 
-def main(source_filename, target_filename):
-    code, source_loc = translate(source_filename)
+def main(source_filename, target_filename, code_format="json", optimize=False, debug_info=False):
+    assert code_format in code_writers, f"Unknown code format '{code_format}'"
+    optimizer = Peephole() if optimize else None
+    code, source_loc, info = translate_with_debug_info(source_filename, optimizer)
 
-    write_code(target_filename, code)
+    code_writers[code_format](target_filename, code)
+    if debug_info:
+        info.dump_json(debug_info_path(target_filename))
 
     print("source LoC:", source_loc, "code instr:", len(code))
+    if optimizer is not None:
+        print(optimizer.report())
 
 
 if __name__ == "__main__":
-    assert len(sys.argv) == 3, "Wrong arguments: translator.py <input_file> <target_file>"
-    _, source_filename, target_filename = sys.argv
-    main(source_filename, target_filename)
+    parser = argparse.ArgumentParser(description="Транслятор")
+    parser.add_argument("source_filename")
+    parser.add_argument("target_filename")
+    parser.add_argument("--format", choices=code_writers.keys(), default="json", help="формат машинного кода")
+    parser.add_argument("-O", "--optimize", action="store_true", help="peephole-оптимизация машинного кода")
+    parser.add_argument(
+        "-g", "--debug-info", action="store_true", help="записать отладочную информацию в `<target_filename>.dbg`"
+    )
+    args = parser.parse_args()
+    main(args.source_filename, args.target_filename, args.format, args.optimize, args.debug_info)